@@ -0,0 +1,316 @@
+"""Tasks that analyse the output of the collection tasks."""
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+
+import file_util, task
+
+# The parsers and columnar load numpy, they are imported by the tasks that
+# use them as this module is loaded to add the task options for every
+# command.
+
+# ============================================================================
+#
+
+class AnalysisTask(task.Task):
+    """Base for tasks that analyse the output of other tasks in the checkup.
+    """
+
+    def _input_files(self, command_name, task_name):
+        """Returns the paths of the output files from the task ``task_name``
+        run by the command ``command_name`` in this checkup.
+
+        The files are taken from the receipt for the task if it ran in this
+        checkup, otherwise from the command manifest, which includes the 
+        output from every node the command collected from. If there is not
+        one the task dir is listed.
+        """
+
+        receipts = self._input_receipts(command_name, task_name)
+        if receipts:
+            return [
+                os.path.join(receipt.task_dir, f["name"])
+                for receipt in receipts
+                for f in receipt.files
+            ]
+
+        cmd_dir = os.path.join(self.args.check_root, command_name)
+        task_dir = os.path.join(cmd_dir, task_name)
+        if not os.path.isdir(task_dir):
+            raise RuntimeError("No output from task {task_name} in "\
+                "{cmd_dir}".format(task_name=task_name, cmd_dir=cmd_dir))
+        return [
+            os.path.join(task_dir, f)
+            for f in sorted(os.listdir(task_dir))
+            if not task.TaskReceipt.is_receipt_file(f)
+        ]
+
+    def _input_receipts(self, command_name, task_name):
+        """Returns the list of receipts for the task ``task_name`` run by 
+        the command ``command_name``, from this checkup or the command 
+        manifest. The list is empty if there is no manifest."""
+
+        receipt = self.input_receipts.get(task_name)
+        if receipt is not None:
+            return [receipt]
+
+        cmd_dir = os.path.join(self.args.check_root, command_name)
+        return [
+            receipt
+            for receipt in task.ReceiptManifest.load(cmd_dir) or []
+            if receipt.name == task_name
+        ]
+
+    def _cache_inputs(self):
+        """The output depends on the content of the collected files, so the
+        digests from their receipts are used and output is reused between 
+        checkups that collected the same files."""
+
+        inputs = []
+        for task_name in self.inputs:
+            receipts = self._input_receipts("collect", task_name)
+            if receipts:
+                inputs.append(sorted(
+                    (receipt.node, f["name"], f["size"], f["sha1"])
+                    for receipt in receipts
+                    for f in receipt.files
+                ))
+            else:
+                inputs.append(self._file_inputs(self._input_files("collect",
+                    task_name)))
+        return inputs
+
+    def _collect_path(self, path):
+        """Returns ``path`` relative to the collect dir of the checkup, 
+        ``<node>/<task>/<file>``, which names a collected file across nodes.
+        """
+
+        return os.path.relpath(path, os.path.join(self.args.check_root,
+            "collect"))
+
+    def _new_table(self, name, columns):
+        """Create the table ``name`` in the task dir, replacing any there."""
+
+        import columnar
+
+        path = os.path.join(self.task_dir, name)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        return columnar.Table(path, columns)
+
+# ============================================================================
+#
+
+class SystemLogAnalysisTask(AnalysisTask):
+    """Parse the collected ``system.log`` files into a table of events."""
+    log = logging.getLogger("%s.%s" % (__name__, "SystemLogAnalysisTask"))
+
+    name = "analyse-system-log"
+    description = "Parse system.log into events"
+    inputs = ["collect-logs"]
+    version = 2
+
+    @classmethod
+    def add_arguments(cls, parser):
+
+        parser.add_argument("--parse-processes", dest="parse_processes",
+            type=int, default=multiprocessing.cpu_count(),
+            help="Number of processes to parse logs with.")
+        parser.add_argument("--parse-chunk-mb", dest="parse_chunk_mb",
+            type=int, default=32,
+            help="Size of the chunks logs are split into to parse them.")
+        return
+
+    def _do_task(self):
+
+        import system_log
+
+        paths = [
+            path
+            for path in self._input_files("collect", "collect-logs")
+            if os.path.basename(path).startswith("system.log")
+        ]
+
+        table = self._new_table("events", system_log.EVENT_COLUMNS)
+        chunk_size = self.args.parse_chunk_mb * 1024 * 1024
+
+        start = time.time()
+        summary = system_log.new_summary()
+        pool = None
+        try:
+            for path in paths:
+                if file_util.source_compression(path):
+                    results = self._parse_stream(path, chunk_size)
+                else:
+                    ranges = system_log.chunk_ranges(path, chunk_size,
+                        file_name=self._collect_path(path))
+                    if len(ranges) > 1 and self.args.parse_processes > 1:
+                        if pool is None:
+                            pool = multiprocessing.Pool(
+                                self.args.parse_processes)
+                        # imap keeps the chunks in file order.
+                        results = pool.imap(system_log.parse_range, ranges)
+                    else:
+                        results = (system_log.parse_range(r) for r in ranges)
+
+                for columns, chunk_summary in results:
+                    table.append(columns)
+                    system_log.merge_summary(summary, chunk_summary)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        elapsed = time.time() - start
+
+        self.log.info("Parsed {rows} events from {count} files in "\
+            "{elapsed:.2f}s".format(rows=table.rows, count=len(paths),
+            elapsed=elapsed))
+        self.receipt.stats.update({
+            "events" : table.rows,
+            "files_parsed" : len(paths),
+            "parse_seconds" : round(elapsed, 3),
+            "levels" : dict(summary["levels"]),
+            "kinds" : dict(summary["kinds"]),
+            "dropped" : dict(summary["dropped"]),
+            "gc_pause_ms_total" : summary["gc_pause_ms_total"],
+            "gc_pause_ms_max" : summary["gc_pause_ms_max"],
+            "compacted_bytes" : summary["compacted_bytes"],
+            "flushed_bytes" : summary["flushed_bytes"],
+            "first_ts" : summary["first_ts"],
+            "last_ts" : summary["last_ts"],
+        })
+        return
+
+    def _parse_stream(self, path, chunk_size):
+        """Parse the compressed log at ``path`` as it is decompressed.
+
+        Yields the results for each chunk.
+        """
+
+        import system_log
+
+        file_name = self._collect_path(path)
+        with file_util.open_decompressed(path) as reader:
+            for offset, text in system_log.iter_stream_chunks(reader,
+                chunk_size):
+                yield system_log.parse_text(text, file_name, offset)
+
+# ============================================================================
+#
+
+class GCLogAnalysisTask(AnalysisTask):
+    """Summarise the pauses in the collected GC logs."""
+    log = logging.getLogger("%s.%s" % (__name__, "GCLogAnalysisTask"))
+
+    name = "analyse-gc-log"
+    description = "Summarise GC pauses"
+    inputs = ["collect-logs"]
+    version = 2
+
+    @classmethod
+    def add_arguments(cls, parser):
+
+        parser.add_argument("--gc-window-secs", dest="gc_window_secs",
+            type=int, default=60,
+            help="Size of the windows stop the world time is totalled in.")
+        parser.add_argument("--gc-worst-windows", dest="gc_worst_windows",
+            type=int, default=10,
+            help="Number of windows with the most stop the world time to "\
+                "report.")
+        return
+
+    def _do_task(self):
+
+        import columnar, gc_log
+
+        paths = [
+            path
+            for path in self._input_files("collect", "collect-logs")
+            if os.path.basename(path).startswith("gc")
+        ]
+
+        start = time.time()
+        parsed_files = [
+            gc_log.parse_file(path, file_name=self._collect_path(path))
+            for path in paths
+        ]
+
+        pauses = self._new_table("pauses", [("ts", "d"), ("pause_s", "d"),
+            ("file", columnar.STRING)])
+        collections = self._new_table("collections", [
+            (name, "d")
+            for name in gc_log.COLLECTION_COLUMNS
+        ] + [("file", columnar.STRING)])
+        for parsed in parsed_files:
+            times, pause_s = gc_log.pause_times(parsed)
+            pauses.append({
+                "ts" : times,
+                "pause_s" : pause_s,
+                "file" : columnar.repeat_string(parsed["file"], len(times)),
+            })
+            data = dict(zip(gc_log.COLLECTION_COLUMNS, parsed["collections"]))
+            data["file"] = columnar.repeat_string(parsed["file"],
+                len(data["uptime"]))
+            collections.append(data)
+
+        summary = gc_log.summarise(parsed_files,
+            window_secs=self.args.gc_window_secs,
+            worst=self.args.gc_worst_windows)
+        elapsed = time.time() - start
+        self.log.info("Analysed {pauses} GC pauses from {count} files in "\
+            "{elapsed:.2f}s using {backend}".format(pauses=summary["pauses"],
+            count=len(paths), elapsed=elapsed, backend=summary["backend"]))
+
+        summary["parse_seconds"] = round(elapsed, 3)
+        self.receipt.stats.update(summary)
+        return
+
+# ============================================================================
+#
+
+class SearchIndexAnalysisTask(AnalysisTask):
+    """Build a search index over the collected logs, see
+    :mod:`search_index`."""
+    log = logging.getLogger("%s.%s" % (__name__, "SearchIndexAnalysisTask"))
+
+    name = "analyse-search-index"
+    description = "Build a search index over the logs"
+    inputs = ["collect-logs"]
+
+    index_name = "index"
+    """Name of the index dir in the task dir."""
+
+    @classmethod
+    def index_dir(cls, check_root):
+        """Returns the path of the index for the checkup in ``check_root``,
+        it may not exist."""
+
+        return os.path.join(check_root, "analyse", cls.name, cls.index_name)
+
+    def _do_task(self):
+
+        import search_index
+
+        paths = self._input_files("collect", "collect-logs")
+        index_dir = self.index_dir(self.args.check_root)
+        if os.path.exists(index_dir):
+            shutil.rmtree(index_dir)
+
+        # The report stages collect/<node>/<task>/<file> as
+        # tasks/<node>/<task>/<file>.
+        start = time.time()
+        writer = search_index.IndexWriter(index_dir)
+        for path in paths:
+            writer.add_file(path, report_path=os.path.join("tasks",
+                self._collect_path(path)))
+        stats = writer.close()
+        elapsed = time.time() - start
+
+        self.log.info("Indexed {bytes_indexed} bytes from {files} files "\
+            "into {terms} terms in {elapsed:.2f}s".format(elapsed=elapsed,
+            **stats))
+        stats["index_seconds"] = round(elapsed, 3)
+        self.receipt.stats.update(stats)
+        return
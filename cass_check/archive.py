@@ -0,0 +1,216 @@
+"""Stream the checkup output into a compressed tar as it is produced.
+
+Files are added to the tar as soon as the task that wrote them finishes, so
+the checkup dir is read once and no temporary copy of the archive is made.
+The archive can be written to stdout to pipe it off the node, for example
+``cass-check check --archive - | ssh box 'cat > check.tar.gz'``.
+
+A sha1 of each file is calculated while it is written to the tar and stored
+in ``MANIFEST.json``, the last member of the archive.
+"""
+import hashlib
+import json
+import logging
+import os
+import os.path
+import sys
+import threading
+import time
+
+import file_util
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_EXTENSIONS = [
+    (".tar.gz", "gzip"),
+    (".tgz", "gzip"),
+    (".tar.zst", "zstd"),
+    (".tar", "none"),
+]
+"""Archive file extensions and the codec used for them."""
+
+MANIFEST_NAME = "MANIFEST.json"
+"""Name of the manifest member, written last."""
+
+def add_arguments(parser):
+    """Add the archive options to ``parser``, shared by the commands that
+    can write an archive."""
+
+    parser.add_argument("--archive", dest="archive", default=None,
+        help="Stream the checkup output into this tar file, use - for "\
+            "stdout. The codec is taken from the extension unless "\
+            "--archive-codec is specified.")
+    parser.add_argument("--archive-codec", dest="archive_codec",
+        default=None,
+        choices=["none", "gzip", "zstd"],
+        help="Compression for the archive, default is gzip.")
+    return
+
+def archive_codec(path, codec=None):
+    """Returns the codec to use for the archive at ``path``, ``codec`` if
+    specified, otherwise based on the extension and gzip for stdout or an
+    unknown extension."""
+
+    if codec:
+        return codec
+    for ext, ext_codec in ARCHIVE_EXTENSIONS:
+        if path.endswith(ext):
+            return ext_codec
+    return "gzip"
+
+# ============================================================================
+#
+
+class ArchiveWriter(object):
+    """Writes files to a compressed tar stream.
+
+    Files and directories may be added from many threads, each one is
+    written to the tar in a single pass that also hashes it.
+    """
+
+    def __init__(self, fileobj, codec="gzip", root_name=""):
+        # imported here as the options in this module are added for every
+        # command.
+        import tarfile
+
+        self.root_name = root_name
+        """Name of the top level dir in the archive."""
+
+        self.manifest = []
+        """List of dicts describing each file in the archive."""
+
+        self.path = None
+        """Path of the archive, it is never added to itself."""
+
+        self.bytes_in = 0
+        self._fileobj = fileobj
+        self._sink = file_util.compress_stream(fileobj, codec)
+        # w| writes the tar without seeking, so the sink may be a pipe.
+        self._tar = tarfile.open(fileobj=self._sink, mode="w|")
+        self._names = set()
+        self._lock = threading.Lock()
+        self._start = time.time()
+
+    @classmethod
+    def open(cls, path, codec=None, root_name=""):
+        """Create an :class:`ArchiveWriter` to ``path`` or stdout if
+        ``path`` is "-"."""
+
+        codec = archive_codec(path, codec)
+        if path == "-":
+            fileobj = sys.stdout
+        else:
+            file_util.ensure_dir(os.path.dirname(os.path.abspath(path)))
+            fileobj = open(path, "wb")
+        log.info("Streaming archive to {path} with {codec}".format(path=path,
+            codec=codec))
+        writer = cls(fileobj, codec=codec, root_name=root_name)
+        if path != "-":
+            writer.path = os.path.abspath(path)
+        return writer
+
+    def add_dir(self, src_dir, arc_dir):
+        """Add the files under ``src_dir`` to the archive under ``arc_dir``,
+        files already in the archive are skipped.
+
+        Returns the number of files added.
+        """
+
+        added = 0
+        for dir_path, dir_names, file_names in os.walk(src_dir):
+            dir_names.sort()
+            rel_dir = os.path.relpath(dir_path, src_dir)
+            for file_name in sorted(file_names):
+                if os.path.abspath(os.path.join(dir_path, file_name)) == \
+                    self.path:
+                    continue
+                arc_name = os.path.normpath(os.path.join(arc_dir, rel_dir,
+                    file_name))
+                if self.add_file(os.path.join(dir_path, file_name),
+                    arc_name):
+                    added += 1
+        return added
+
+    def add_file(self, path, arc_name):
+        """Add the file at ``path`` to the archive as ``arc_name``.
+
+        Returns False if ``arc_name`` is already in the archive.
+        """
+
+        arc_name = os.path.join(self.root_name, arc_name)
+        with self._lock:
+            if arc_name in self._names:
+                return False
+            self._names.add(arc_name)
+
+            # Files hard linked into the report are stored as links.
+            tar_info = self._tar.gettarinfo(path, arcname=arc_name)
+            entry = {"path" : arc_name}
+            if tar_info.islnk():
+                entry["link"] = tar_info.linkname
+                self._tar.addfile(tar_info)
+            elif tar_info.isreg():
+                with open(path, "rb") as f:
+                    reader = _HashingReader(f)
+                    self._tar.addfile(tar_info, reader)
+                entry["size"] = reader.size
+                entry["sha1"] = reader.digest.hexdigest()
+                self.bytes_in += reader.size
+            else:
+                self._tar.addfile(tar_info)
+            self.manifest.append(entry)
+        return True
+
+    def add_bytes(self, data, arc_name):
+        """Add ``data`` to the archive as ``arc_name``, the file is not
+        included in the manifest."""
+
+        import StringIO
+        import tarfile
+
+        tar_info = tarfile.TarInfo(os.path.join(self.root_name, arc_name))
+        tar_info.size = len(data)
+        tar_info.mtime = time.time()
+        with self._lock:
+            self._tar.addfile(tar_info, StringIO.StringIO(data))
+        return
+
+    def close(self):
+        """Write the manifest and finish the archive."""
+
+        self.add_bytes(json.dumps({
+            "files" : self.manifest,
+            "created" : time.time(),
+        }, indent=2, sort_keys=True), MANIFEST_NAME)
+        self._tar.close()
+        self._sink.close()
+        if self._fileobj is not sys.stdout:
+            self._fileobj.close()
+        else:
+            self._fileobj.flush()
+        log.info("Archived {count} files, {bytes_in} bytes, in "\
+            "{elapsed:.2f}s".format(count=len(self.manifest),
+            bytes_in=self.bytes_in, elapsed=time.time() - self._start))
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+class _HashingReader(object):
+    """Read only file like object that hashes the data read from
+    ``fileobj``."""
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self.digest = hashlib.sha1()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self._fileobj.read(size)
+        self.digest.update(data)
+        self.size += len(data)
+        return data
@@ -0,0 +1,326 @@
+"""Micro benchmarks for the parts of cass-check that need to be fast.
+
+Benchmarks are functions registered with :func:`benchmark` that take the
+command line args and return a list of result dicts with at least ``name``,
+``rate``, ``unit`` and ``scale`` keys. They are run by the ``bench``
+command.
+
+Benchmarks that depend on the amount of data run once for each of the
+``--scales``, using the synthetic node data from :mod:`fixtures` so they
+do not need a real Cassandra node. ``scale`` is None for the others.
+"""
+import argparse
+import logging
+import os
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import entry_points, serializer, task
+
+log = logging.getLogger(__name__)
+
+BENCHMARKS = {}
+"""Registered benchmarks, {name : func}."""
+
+SCALE_LOG_MB = 4
+"""MB of logs the collect benchmark uses for each unit of scale."""
+
+SCALE_TASKS = 10
+"""Number of tasks the report benchmark uses for each unit of scale."""
+
+def parse_scales(value):
+    """Parse the comma separated list of scales in ``value``, for use as an
+    argparse type."""
+
+    try:
+        scales = [int(s) for s in value.split(",") if s.strip()]
+    except (ValueError):
+        scales = []
+    if not scales or any(s < 1 for s in scales):
+        raise argparse.ArgumentTypeError("Scales must be a comma separated "\
+            "list of positive integers, not {value!r}".format(value=value))
+    return scales
+
+def benchmark(name):
+    """Decorator to register a benchmark function as ``name``."""
+
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+def _timed_rate(func, count):
+    """Call ``func`` ``count`` times and return the calls per second."""
+
+    start = time.time()
+    for i in xrange(count):
+        func(i)
+    elapsed = time.time() - start
+    return count / elapsed if elapsed else float("inf")
+
+def _best_time(func, runs, setup=None):
+    """Call ``func`` ``runs`` times, calling ``setup`` before each call if
+    specified, and return the fastest time in seconds."""
+
+    best = None
+    for i in xrange(max(1, runs)):
+        if setup is not None:
+            setup(i)
+        start = time.time()
+        func(i)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def _rate(count, elapsed):
+    return count / elapsed if elapsed else float("inf")
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# Receipts
+
+def make_receipts(root, count, fmt):
+    """Write ``count`` receipts in format ``fmt`` under ``root``, like a
+    collection of checkups would have.
+
+    Returns the list of receipt paths.
+    """
+
+    paths = []
+    for i in xrange(count):
+        task_dir = os.path.join(root, "task-{i}".format(i=i))
+        os.makedirs(task_dir)
+        receipt = task.TaskReceipt("task-{i}".format(i=i), task_dir, fmt=fmt)
+        receipt.stats = {
+            "raw_bytes" : 1024 * 1024 * i,
+            "stored_bytes" : 1024 * i,
+            "files" : [
+                {
+                    "source" : "/var/log/cassandra/system.log.{j}".format(
+                        j=j),
+                    "file" : "system.log.{j}".format(j=j),
+                    "offset" : 0,
+                    "raw_bytes" : 1024 * 1024,
+                    "stored_bytes" : 1024,
+                }
+                for j in xrange(5)
+            ],
+        }
+        receipt.files = [
+            {
+                "name" : "system.log.{j}".format(j=j),
+                "size" : 1024 * 1024,
+                "sha1" : "0" * 40,
+            }
+            for j in xrange(5)
+        ]
+        paths.append(serializer.dump(receipt.to_dict(), os.path.join(task_dir,
+            "receipt" + serializer.FORMAT_EXTENSIONS[fmt])))
+    return paths
+
+@benchmark("receipt-load")
+def bench_receipt_load(args):
+    """Rate receipts can be loaded in each of the available formats, with
+    ``count`` receipts for each unit of scale."""
+
+    results = []
+    for scale in args.scales:
+        count = args.count * scale
+        for fmt in serializer.available_formats():
+            root = tempfile.mkdtemp(prefix="cass-check-bench-")
+            try:
+                paths = make_receipts(root, count, fmt)
+                rate = _timed_rate(
+                    lambda i: task.TaskReceipt.maybe_load(paths[i]), count)
+            finally:
+                shutil.rmtree(root)
+            results.append({
+                "name" : "receipt-load-{fmt}".format(fmt=fmt),
+                "scale" : scale,
+                "rate" : rate,
+                "unit" : "receipts/sec",
+            })
+    return results
+
+@benchmark("receipt-write")
+def bench_receipt_write(args):
+    """Rate receipts can be written in each of the available formats, with
+    ``count`` receipts for each unit of scale."""
+
+    results = []
+    for scale in args.scales:
+        count = args.count * scale
+        for fmt in serializer.available_formats():
+            root = tempfile.mkdtemp(prefix="cass-check-bench-")
+            try:
+                start = time.time()
+                make_receipts(root, count, fmt)
+                elapsed = time.time() - start
+            finally:
+                shutil.rmtree(root)
+            results.append({
+                "name" : "receipt-write-{fmt}".format(fmt=fmt),
+                "scale" : scale,
+                "rate" : _rate(count, elapsed),
+                "unit" : "receipts/sec",
+            })
+    return results
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# Commands
+
+STARTUP_SCRIPT = "import sys; sys.argv[0] = 'cass-check'; "\
+    "from cass_check.scripts import cass_check_main; cass_check_main()"
+"""Runs ``cass-check`` the way the ``bin/cass-check`` script does, for
+when the installed script is not needed."""
+
+def find_cass_check():
+    """Returns the path of the installed ``cass-check`` script, the one 
+    next to the running python or else the one on the ``PATH``, or None if 
+    it is not installed."""
+
+    candidates = [os.path.dirname(sys.executable)] + \
+        os.environ.get("PATH", "").split(os.pathsep)
+    for bin_dir in candidates:
+        path = os.path.join(bin_dir, "cass-check")
+        if bin_dir and os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+def _cass_check(root, cmd_args, executable=None):
+    """Returns a function that runs ``cass-check`` with ``cmd_args`` in a
+    new process, using an output base and entry point cache in ``root``.
+    
+    The ``executable`` script is run if specified, otherwise 
+    :data:`STARTUP_SCRIPT` is run with this python.
+    """
+
+    env = dict(os.environ, CASS_CHECK_CACHE_DIR=os.path.join(root, "cache"))
+    if executable:
+        cmd = [executable]
+    else:
+        cmd = [sys.executable, "-c", STARTUP_SCRIPT]
+    cmd += ["--log-file", os.devnull, "--output-base", 
+        os.path.join(root, "output")] + list(cmd_args)
+
+    def run(*ignored):
+        with open(os.devnull, "w") as devnull:
+            subprocess.check_call(cmd, env=env, stdout=devnull)
+    return run
+
+@benchmark("startup")
+def bench_startup(args):
+    """Rate the installed ``cass-check noop`` can be started, with a cold 
+    and a warm entry point cache."""
+
+    executable = args.cass_check_path or find_cass_check()
+    if executable is None:
+        raise RuntimeError("cass-check is not installed, use --cass-check "\
+            "to give the path of the script to time.")
+    with open(executable, "rb") as f:
+        if b"pkg_resources" in f.read():
+            log.warn("{executable} imports pkg_resources when it starts, "\
+                "it was installed by setup.py install or develop. Install "\
+                "with pip to use the bin/cass-check script as is.".format(
+                executable=executable))
+    log.info("Timing start up of {executable}".format(
+        executable=executable))
+
+    root = tempfile.mkdtemp(prefix="cass-check-bench-")
+    run = _cass_check(root, ["noop"], executable=executable)
+    cache_path = os.path.join(root, "cache", entry_points.CACHE_FILE)
+
+    def run_cold(i):
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+        run()
+        
+    results = []
+    try:
+        for cold in (True, False):
+            results.append({
+                "name" : "startup-{cache}-cache".format(
+                    cache="cold" if cold else "warm"),
+                "scale" : None,
+                "rate" : _timed_rate(run_cold if cold else run, args.runs),
+                "unit" : "starts/sec",
+                "executable" : executable,
+            })
+    finally:
+        shutil.rmtree(root)
+    return results
+
+@benchmark("collect")
+def bench_collect(args):
+    """Rate ``cass-check collect`` collects a synthetic node with
+    :data:`SCALE_LOG_MB` of logs for each unit of scale, with the task cache
+    disabled so every run does the work."""
+
+    import fixtures
+    
+    results = []
+    for scale in args.scales:
+        root = tempfile.mkdtemp(prefix="cass-check-bench-")
+        try:
+            log_dir = os.path.join(root, "logs")
+            log_mb = scale * SCALE_LOG_MB
+            fixtures.make_log_dir(log_dir, log_mb * fixtures.MB)
+            nodetool = fixtures.write_fake_nodetool(os.path.join(root,
+                "bin", "nodetool"))
+
+            def run(i):
+                _cass_check(root, ["--check-name", "check-{i}".format(i=i),
+                    "collect", "--log-dir", log_dir, "--nodetool", nodetool,
+                    "--no-cache", "--no-history"])()
+            elapsed = _best_time(run, args.runs)
+        finally:
+            shutil.rmtree(root)
+        results.append({
+            "name" : "collect",
+            "scale" : scale,
+            "rate" : _rate(log_mb, elapsed),
+            "unit" : "MB/sec",
+            "seconds" : elapsed,
+        })
+    return results
+
+@benchmark("report")
+def bench_report(args):
+    """Rate ``cass-check report`` builds a report for a checkup with
+    :data:`SCALE_TASKS` tasks for each unit of scale, from scratch and when
+    nothing has changed since the last build."""
+
+    import fixtures
+    
+    results = []
+    for scale in args.scales:
+        root = tempfile.mkdtemp(prefix="cass-check-bench-")
+        try:
+            check_dir = os.path.join(root, "check")
+            tasks = scale * SCALE_TASKS
+            fixtures.make_check_dir(check_dir, tasks)
+            run = _cass_check(root, ["--check-dir", check_dir, "report"])
+            report_dir = os.path.join(check_dir, "report")
+
+            def clean(i):
+                shutil.rmtree(report_dir, ignore_errors=True)
+            timings = [
+                ("report-cold", _best_time(run, args.runs, setup=clean)),
+                ("report-incremental", _best_time(run, args.runs)),
+            ]
+        finally:
+            shutil.rmtree(root)
+        results.extend(
+            {
+                "name" : name,
+                "scale" : scale,
+                "rate" : _rate(tasks, elapsed),
+                "unit" : "tasks/sec",
+                "seconds" : elapsed,
+            }
+            for name, elapsed in timings
+        )
+    return results
@@ -1,9 +1,14 @@
 """Tasks that collect raw details from the node."""
+import hashlib
 import logging
 import os
 import shutil
+import time
 
-import task
+import file_util, log_util, nodetool, serializer, task
+
+# columnar and histogram load numpy, they are imported by the tasks that use 
+# them as this module is loaded to add the task options for every command.
 
 # ============================================================================
 # 
@@ -14,38 +19,548 @@ class LogCollectionTask(task.Task):
     name = "collect-logs"
     description = "Collect logs"
 
+    # only copy files that start with this
+    matches = ["system.log", "gc-"]
+
+    # number of bytes at the start of a file used to detect when an inode 
+    # has been re-used for a different file. 
+    head_size = 512
+
+    @classmethod
+    def add_arguments(cls, parser):
+        
+        parser.add_argument("--log-dir", dest="log_dir", 
+            default="/var/log/cassandra",
+            help="Directory to collect the Cassandra logs from.")
+        parser.add_argument("--log-compression", dest="log_compression", 
+            default="none", choices=file_util.available_codecs(),
+            help="Compress the logs as they are collected. Rotated .gz and "\
+                ".zip logs are read without inflating them to disk.")
+        parser.add_argument("--incremental", dest="incremental", 
+            default=False, action="store_true",
+            help="Only collect log data written since the last incremental "\
+                "collection under output-base.")
+        parser.add_argument("--since", dest="since", default=None,
+            help="Only collect log lines from this time, either relative "\
+                "like 30m, 2h or 1d or local time like 2012-11-27T10:05.")
+        parser.add_argument("--until", dest="until", default=None,
+            help="Only collect log lines up to this time, see --since.")
+        return
+
+    def _cache_inputs(self):
+        """Incremental and time window collections depend on when they run,
+        so only full collections are cached."""
+        
+        if self.args.incremental or self.args.since or self.args.until:
+            return None
+        if not os.path.isdir(self.args.log_dir):
+            return None
+        return self._file_inputs(
+            os.path.join(self.args.log_dir, f)
+            for f in os.listdir(self.args.log_dir)
+            if any(f.startswith(match) for match in self.matches)
+        )
 
     def _do_task(self):
         
-        # only copy files that start with this
-        matches = ["system.log", "gc-"]
-        root, _, files = os.walk("/var/log/cassandra").next()
+        root, _, files = os.walk(self.args.log_dir).next()
         
-        for f in files:
-            for match in matches:
+        since = self.args.since and log_util.parse_time_arg(self.args.since)
+        until = self.args.until and log_util.parse_time_arg(self.args.until)
+        windowed = bool(since or until)
+        incremental = self.args.incremental
+        if windowed and incremental:
+            self.log.warn("Ignoring --incremental as a time window was "\
+                "specified.")
+            incremental = False
+        
+        checkpoint_path = os.path.join(self.args.output_base, "checkpoints",
+            "{self.name}.yaml".format(self=self))
+        if incremental:
+            checkpoints = self._load_checkpoints(checkpoint_path)
+        else:
+            checkpoints = {}
+        new_checkpoints = {}
+
+        collected = []
+        for f in sorted(files):
+            for match in self.matches:
                 if f.startswith(match):
                     src = os.path.join(root, f)
-                    dest = os.path.join(self.task_dir, f)
-                    self.log.debug("Copying {src} to {dest}".format(
-                        src=src, dest=dest))
-                    shutil.copy2(src, dest)
+                    if windowed:
+                        result = self._collect_window(src, since, until)
+                    else:
+                        result, checkpoint = self._collect_incremental(src, 
+                            checkpoints)
+                        new_checkpoints[checkpoint["key"]] = checkpoint
+                    if result:
+                        collected.append(result)
                     break
 
+        self.receipt.stats["files"] = collected
+        self.receipt.stats["raw_bytes"] = sum(
+            c["raw_bytes"] for c in collected)
+        self.receipt.stats["stored_bytes"] = sum(
+            c["stored_bytes"] for c in collected)
+        if windowed:
+            self.receipt.stats["since"] = since
+            self.receipt.stats["until"] = until
+        
+        if incremental:
+            self._save_checkpoints(checkpoint_path, new_checkpoints)
         return 
+    
+    def _collect_incremental(self, src, checkpoints):
+        """Collect the part of the log file ``src`` that was not collected 
+        according to the ``checkpoints``.
+        
+        Files are tracked by device and inode so a log that was rotated 
+        (renamed) since the last run carries on from where it was. If the 
+        file is smaller than the checkpoint it was truncated, and if the 
+        start of the file changed the inode was re-used, in both cases the 
+        whole file is collected. The start is compared over the bytes 
+        hashed for the checkpoint, which is less than ``head_size`` if the 
+        file was smaller then. 
+        
+        Returns a tuple of (result, checkpoint) where result is None if 
+        there was nothing new to collect. 
+        """
+        
+        st = os.stat(src)
+        key = "{st.st_dev}:{st.st_ino}".format(st=st)
+        with open(src, "rb") as f:
+            head = f.read(self.head_size)
+        checkpoint = {
+            "key" : key,
+            "path" : src,
+            "size" : st.st_size,
+            "offset" : st.st_size,
+            "head" : hashlib.md5(head).hexdigest(),
+            "head_bytes" : len(head),
+        }
+        
+        previous = checkpoints.get(key)
+        offset = 0
+        if previous and self._same_head(head, previous):
+            if st.st_size == previous["offset"]:
+                self.log.debug("No new data in {src}".format(src=src))
+                return (None, checkpoint)
+            if st.st_size > previous["offset"]:
+                offset = previous["offset"]
+            else:
+                self.log.info("Log file {src} was truncated, collecting "\
+                    "all of it.".format(src=src))
+        
+        if offset and file_util.source_compression(src):
+            # compressed files are not appended to.
+            offset = 0
+        result = self._collect_file(src, offset=offset, 
+            length=st.st_size - offset)
+        return (result, checkpoint)
+    
+    def _collect_window(self, src, since, until):
+        """Collect the lines from the log file ``src`` that are between the 
+        ``since`` and ``until`` timestamp keys, either may be None. 
+        
+        Files last modified before ``since`` are skipped without reading 
+        them. The window in uncompressed files is found by bisecting the 
+        file on the line timestamps, compressed files cannot be seeked so 
+        their lines are filtered as they are streamed. 
+        
+        Returns a dict describing the file collected, or None if there were 
+        no lines in the window.
+        """
+        
+        if since is not None and \
+            os.path.getmtime(src) < log_util.timestamp_epoch(since):
+            self.log.debug("Skipping {src} last modified before "\
+                "{since}".format(src=src, since=since))
+            return None
+        
+        if file_util.source_compression(src):
+            return self._collect_filtered(src, since, until)
+            
+        window = log_util.window_range(src, since, until)
+        if window is None:
+            self.log.warn("No timestamps found in {src}, collecting all of "\
+                "it.".format(src=src))
+            return self._collect_file(src)
+        
+        start, end = window
+        if start == end:
+            self.log.debug("No lines in the time window in {src}".format(
+                src=src))
+            return None
+        return self._collect_file(src, offset=start, length=end - start)
+    
+    def _collect_filtered(self, src, since, until):
+        """Collect the lines from the compressed log file ``src`` that are 
+        between the ``since`` and ``until`` timestamp keys.
+        
+        Returns a dict describing the file collected, or None if there were 
+        no lines in the window.
+        """
+        
+        dest = self._dest_path(src)
+        self.log.debug("Filtering {src} to {dest}".format(src=src, 
+            dest=dest))
+        
+        raw_bytes = 0
+        with file_util.open_decompressed(src) as reader:
+            writer = file_util.open_compressed(dest, 
+                self.args.log_compression)
+            try:
+                lines = iter(reader.readline, b"")
+                for line in log_util.filter_window(lines, since, until):
+                    writer.write(line)
+                    raw_bytes += len(line)
+            finally:
+                writer.close()
+        
+        if not raw_bytes:
+            os.remove(dest)
+            return None
+        return {
+            "source" : src,
+            "file" : os.path.basename(dest),
+            "offset" : 0,
+            "raw_bytes" : raw_bytes,
+            "stored_bytes" : os.path.getsize(dest),
+        }
+        
+    def _dest_path(self, src):
+        """Returns the path in the task dir to stream the log file ``src``
+        to, using the extension for the compression codec from the args.
+        """
+        
+        _, src_name = os.path.split(src)
+        return os.path.join(self.task_dir, 
+            file_util.strip_compression_ext(src_name) + \
+            file_util.COMPRESSION_EXTENSIONS[self.args.log_compression])
+    
+    def _collect_file(self, src, offset=0, length=None):
+        """Copy the log file ``src`` into the task dir, compressing it with 
+        the codec from the args. 
+        
+        If ``offset`` or ``length`` are specified only that part of the file
+        is copied, they are ignored for compressed files. 
+        
+        Returns a dict describing the file collected.
+        """
+        
+        codec = self.args.log_compression
+        src_compression = file_util.source_compression(src)
+        _, src_name = os.path.split(src)
+        
+        if src_compression:
+            offset, length = 0, None
+        whole_file = offset == 0 and (length is None or 
+            length == os.path.getsize(src))
+        
+        if whole_file and (codec == "none" or 
+            (codec == "gzip" and src_compression == "gzip")):
+            # Copy as is, there is no need to re-compress a gzip file. 
+            dest = os.path.join(self.task_dir, src_name)
+            self.log.debug("Copying {src} to {dest}".format(
+                src=src, dest=dest))
+            if src_compression == "gzip":
+                raw_bytes = file_util.copy_gzip(src, dest)
+                shutil.copystat(src, dest)
+            else:
+                shutil.copy2(src, dest)
+                raw_bytes = os.path.getsize(dest)
+            stored_bytes = os.path.getsize(dest)
+        else:
+            dest = self._dest_path(src)
+            self.log.debug("Streaming {src} from {offset} to {dest} with "\
+                "{codec} compression".format(src=src, offset=offset, 
+                dest=dest, codec=codec))
+            
+            with file_util.open_decompressed(src) as reader:
+                if offset:
+                    reader.seek(offset)
+                writer = file_util.open_compressed(dest, codec)
+                try:
+                    raw_bytes = file_util.copy_stream(reader, writer, 
+                        length=length)
+                finally:
+                    writer.close()
+            shutil.copystat(src, dest)
+            stored_bytes = os.path.getsize(dest)
+            
+        return {
+            "source" : src,
+            "file" : os.path.basename(dest),
+            "offset" : offset,
+            "raw_bytes" : raw_bytes,
+            "stored_bytes" : stored_bytes,
+        }
+
+    def _same_head(self, head, checkpoint):
+        """Returns True if the ``head`` bytes read from the start of a file 
+        start with the bytes hashed for the ``checkpoint``."""
+        
+        # checkpoints without head_bytes hashed up to head_size bytes. 
+        head_bytes = checkpoint.get("head_bytes", 
+            min(self.head_size, checkpoint["offset"]))
+        if len(head) < head_bytes:
+            return False
+        return hashlib.md5(head[:head_bytes]).hexdigest() == \
+            checkpoint["head"]
+    
+    def _load_checkpoints(self, path):
+        """Load the checkpoints from the last incremental collection.
+        
+        Returns a dict of {key : checkpoint}.
+        """
+        
+        if not os.path.exists(path):
+            self.log.info("No log checkpoints in {path}, collecting all "\
+                "logs.".format(path=path))
+            return {}
+        data = serializer.load(path) or {}
+        return data.get("files", {})
+    
+    def _save_checkpoints(self, path, checkpoints):
+        """Save the ``checkpoints`` for the next incremental collection."""
+        
+        self.log.debug("Writing log checkpoints to {path}".format(path=path))
+        file_util.ensure_dir(os.path.dirname(path))
+        serializer.dump({"files" : checkpoints}, path)
+        return
 
 # ============================================================================
 # 
 
-class ProxyHistogramsCollectionTask(task.Task):
-    log = logging.getLogger("%s.%s" % (__name__, 
-        "ProxyHistogramsCollectionTask"))
+class NodetoolCollectionTask(task.Task):
+    """Collect the output from the nodetool commands that describe the 
+    node.
     
-    name = "collect-proxy-histograms"
-    description = "Collect proxy histograms"
+    Each command starts a JVM which takes a few seconds, so the commands 
+    are run at the same time. Output is cached for the checkup, see 
+    :class:`nodetool.Nodetool`.
+    """
+    log = logging.getLogger("%s.%s" % (__name__, "NodetoolCollectionTask"))
+    
+    name = "collect-nodetool"
+    description = "Collect nodetool output"
+
+    subcommands = ["info", "ring", "tpstats", "cfstats", "compactionstats",
+        "netstats", "gossipinfo", "proxyhistograms"]
+    """nodetool commands to run."""
+
+    @classmethod
+    def add_arguments(cls, parser):
+        
+        nodetool.add_arguments(parser)
+        parser.add_argument("--nodetool-jobs", dest="nodetool_jobs", 
+            type=int, default=4,
+            help="Number of nodetool commands to run at the same time.")
+        return
+
+    def _do_task(self):
+        
+        runner = nodetool.Nodetool.from_args(self.args)
+        
+        def collect(subcommand):
+            try:
+                cached_path = runner.output(self, subcommand)
+            except (Exception) as e:
+                self.log.warn("Error running nodetool {subcommand}".format(
+                    subcommand=subcommand), exc_info=True)
+                return (subcommand, e)
+            file_util.stage_file(cached_path, os.path.join(self.task_dir, 
+                "{subcommand}.txt".format(subcommand=subcommand)))
+            return (subcommand, None)
+        
+        jobs = max(1, min(self.args.nodetool_jobs, len(self.subcommands)))
+        # imported here as it is only needed by this task. 
+        import multiprocessing.pool
+        pool = multiprocessing.pool.ThreadPool(jobs)
+        try:
+            results = pool.map(collect, self.subcommands)
+            pool.close()
+        finally:
+            pool.join()
+        
+        errors = dict(
+            (subcommand, "{name}: {error}".format(
+                name=type(error).__name__, error=error))
+            for subcommand, error in results
+            if error is not None
+        )
+        self.receipt.stats.update({
+            "commands" : len(self.subcommands),
+            "failed" : errors,
+        })
+        if len(errors) == len(self.subcommands):
+            raise RuntimeError("All nodetool commands failed, first error "\
+                "{error}".format(error=errors[self.subcommands[0]]))
+        return
+
+# ============================================================================
+# 
+
+class HistogramCollectionTask(task.Task):
+    """Base for tasks that collect the histograms output by a ``nodetool`` 
+    command, either as a single snapshot or by sampling them for a while.
+    
+    When sampling, the difference between each snapshot and the one before
+    is stored so each row covers one interval.
+    """
+
+    nodetool_cmd = None
+    """The nodetool command that outputs the histograms."""
 
+    @classmethod
+    def add_arguments(cls, parser):
+        
+        nodetool.add_arguments(parser)
+        parser.add_argument("--sample-interval", dest="sample_interval", 
+            type=float, default=None,
+            help="Sample the histograms every this many seconds, rather "\
+                "than taking one snapshot.")
+        parser.add_argument("--duration", dest="duration", type=float, 
+            default=60.0,
+            help="Number of seconds to sample the histograms for.")
+        parser.add_argument("--sample-buffer", dest="sample_buffer", 
+            type=int, default=60,
+            help="Number of samples to keep in memory before writing them "\
+                "to disk.")
+        return
+
+    def __init__(self, args):
+        super(HistogramCollectionTask, self).__init__(args)
+        self.nodetool = nodetool.Nodetool.from_args(args)
 
     def _do_task(self):
         
-        cmd = "/Users/aaron/servers/cassandra/apache-cassandra-1.1.6/bin/nodetool -h localhost proxyhistograms"
-        self._write_output(self._exec_cmd(cmd))
+        if self.args.sample_interval:
+            return self._sample()
+        
+        import columnar, histogram
+        
+        # The snapshot may have been taken already in this checkup. 
+        cached_path = self.nodetool.output(self, self.nodetool_cmd)
+        ts = os.path.getmtime(cached_path)
+        with open(cached_path, "r") as f:
+            histograms = histogram.parse_nodetool(f.read())
+        file_util.stage_file(cached_path, os.path.join(self.task_dir, 
+            self.name))
+
+        # Keep the buckets so histograms can be merged without re-parsing 
+        # the text.
+        table = columnar.Table(os.path.join(self.task_dir, "histograms"), 
+            histogram.HISTOGRAM_COLUMNS)
+        histogram.append_histograms(table, ts, self.nodetool.host, 
+            histograms)
+        
+        self.receipt.stats.update(
+            ("{name}_latency_us".format(name=name), h.summary())
+            for name, h in histograms.iteritems()
+        )
         return 
+
+    def _snapshot(self):
+        """Run the nodetool command, without using the cache. 
+        
+        Returns a tuple of (output, {name : histogram}).
+        """
+        
+        import histogram
+        
+        output = self._exec_cmd(self.nodetool.command(self.nodetool_cmd))
+        return (output, histogram.parse_nodetool(output))
+
+    def _sample(self):
+        """Take a snapshot every ``sample_interval`` for ``duration`` and 
+        store the histogram of each interval in the ``samples`` table."""
+        
+        import columnar, histogram
+        
+        interval = self.args.sample_interval
+        table = columnar.Table(os.path.join(self.task_dir, "samples"), 
+            histogram.HISTOGRAM_COLUMNS)
+        buf = histogram.SnapshotBuffer(table, self.args.sample_buffer, 
+            self.nodetool.host)
+        
+        start = time.time()
+        end = start + self.args.duration
+        overhead = 0.0
+        snapshots = 0
+        missed = 0
+        previous = None
+        next_sample = start
+        while True:
+            sample_start = time.time()
+            _, current = self._snapshot()
+            # the end of the interval is when the snapshot was taken.
+            ts = time.time()
+            overhead += ts - sample_start
+            snapshots += 1
+            if previous is not None:
+                buf.append(ts, dict(
+                    (name, h - previous[name])
+                    for name, h in current.iteritems()
+                ))
+            previous = current
+            
+            next_sample += interval
+            now = time.time()
+            if now > next_sample:
+                # the snapshot took longer than the interval, skip ahead.
+                skipped = int((now - next_sample) // interval) + 1
+                missed += skipped
+                next_sample += skipped * interval
+            if next_sample > end:
+                break
+            time.sleep(max(0.0, next_sample - time.time()))
+        buf.flush()
+        elapsed = time.time() - start
+        
+        self.log.info("Took {snapshots} histogram snapshots over "\
+            "{elapsed:.1f}s, sampling took {overhead:.3f}s".format(
+            snapshots=snapshots, elapsed=elapsed, overhead=overhead))
+        self.receipt.stats.update({
+            "snapshots" : snapshots,
+            "missed_intervals" : missed,
+            "buffer_flushes" : buf.flushes,
+            "sample_overhead_s" : round(overhead, 3),
+            "sample_overhead_pct" : round(100.0 * overhead / elapsed, 3) \
+                if elapsed else None,
+            "timeline" : self._timeline(table),
+        })
+        return
+
+    def _timeline(self, table):
+        """Returns a list with the percentiles for each interval in the 
+        sample ``table``."""
+        
+        import histogram
+        
+        timeline = []
+        for (ts, _), histograms in histogram.load_histograms(table).iteritems():
+            row = {
+                "time" : "{0}.{1:03d}".format(time.strftime(
+                    "%Y-%m-%dT%H:%M:%S", time.localtime(ts)), 
+                    int(ts * 1000) % 1000),
+            }
+            for name, h in histograms.iteritems():
+                for pct in ("p50", "p99"):
+                    row["{name}_{pct}_us".format(name=name, pct=pct)] = \
+                        h.percentile(dict(histogram.PERCENTILES)[pct])
+                row["{name}_count".format(name=name)] = int(h.count)
+            timeline.append(row)
+        return timeline
+
+# ============================================================================
+# 
+
+class ProxyHistogramsCollectionTask(HistogramCollectionTask):
+    log = logging.getLogger("%s.%s" % (__name__, 
+        "ProxyHistogramsCollectionTask"))
+    
+    name = "collect-proxy-histograms"
+    description = "Collect proxy histograms"
+
+    nodetool_cmd = "proxyhistograms"
@@ -0,0 +1,251 @@
+"""Compact column oriented storage for the numbers tasks extract.
+
+A table is a directory with a ``table.json`` header and one file per column
+holding the packed machine values of an :class:`array.array`. String
+columns are dictionary encoded, the column holds ``I`` indexes into a list
+of the distinct values kept in the header. Rows are only ever appended, so
+a table can be added to by later runs without re-writing it.
+"""
+import array
+import json
+import os
+import os.path
+
+import file_util
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+HEADER_FILE = "table.json"
+
+STRING = "s"
+"""Type code for a dictionary encoded string column."""
+
+CODE_TYPE = "I"
+"""Array type code used to store the dictionary codes."""
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# Array helpers for python 2 and 3.
+
+def array_bytes(arr):
+    """Returns the machine values in ``arr`` as bytes."""
+
+    return arr.tobytes() if hasattr(arr, "tobytes") else arr.tostring()
+
+def array_from_bytes(typecode, data):
+    """Returns an :class:`array.array` of ``typecode`` from ``data``."""
+
+    arr = array.array(typecode)
+    if hasattr(arr, "frombytes"):
+        arr.frombytes(data)
+    else:
+        arr.fromstring(data)
+    return arr
+
+def repeat_string(value, rows):
+    """Returns a (codes, dictionary) tuple for a string column of ``rows``
+    that all have ``value``, see :meth:`Table.append`."""
+
+    return (array.array(CODE_TYPE, [0]) * rows, [value])
+
+# ============================================================================
+#
+
+class StringEncoder(object):
+    """Dictionary encodes strings into integer codes."""
+
+    def __init__(self, values=None):
+        self.values = list(values or [])
+        self._codes = dict((v, i) for i, v in enumerate(self.values))
+
+    def encode(self, value):
+        """Returns the code for ``value``, adding it if it is new."""
+
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def remap(self, codes, values):
+        """Re-encode ``codes`` that index into ``values``, a dictionary from
+        another encoder, into codes for this encoder.
+
+        Returns an array of codes.
+        """
+
+        mapping = [self.encode(v) for v in values]
+        return array.array(CODE_TYPE, (mapping[c] for c in codes))
+
+# ============================================================================
+#
+
+class Table(object):
+    """A column oriented table stored in the directory ``path``.
+
+    ``columns`` is a list of (name, typecode) used to create the table if
+    it does not exist, where typecode is an :mod:`array` type code or
+    :attr:`STRING`.
+    """
+
+    def __init__(self, path, columns=None):
+        self.path = path
+        header_path = os.path.join(path, HEADER_FILE)
+
+        if os.path.exists(header_path):
+            with open(header_path, "r") as f:
+                header = json.load(f)
+            self.columns = [
+                (str(name), str(typecode))
+                for name, typecode in header["columns"]
+            ]
+            self.rows = header["rows"]
+            self.itemsizes = header["itemsizes"]
+            self.encoders = dict(
+                (name, StringEncoder(values))
+                for name, values in header["dictionaries"].iteritems()
+            )
+        else:
+            if not columns:
+                raise ValueError("No table in {path} and no columns to "\
+                    "create one.".format(path=path))
+            self.columns = list(columns)
+            self.rows = 0
+            self.itemsizes = dict(
+                (name, array.array(self.storage_type(name)).itemsize)
+                for name, _ in self.columns
+            )
+            self.encoders = dict(
+                (name, StringEncoder())
+                for name, typecode in self.columns
+                if typecode == STRING
+            )
+
+    @property
+    def names(self):
+        return [name for name, _ in self.columns]
+
+    def storage_type(self, name):
+        """Returns the array type code the column ``name`` is stored as."""
+
+        typecode = dict(self.columns)[name]
+        return CODE_TYPE if typecode == STRING else typecode
+
+    def column_path(self, name):
+        return os.path.join(self.path, "{name}.col".format(name=name))
+
+    def append(self, data):
+        """Append rows to the table.
+
+        ``data`` is a dict of {name : values} with a value for every column.
+        Values for numeric columns are arrays, NumPy arrays or sequences of 
+        numbers. For
+        string columns they are either a sequence of strings or a tuple of
+        (codes, dictionary) from another :class:`StringEncoder`.
+
+        Returns the number of rows appended.
+        """
+
+        encoded = {}
+        count = None
+        for name, typecode in self.columns:
+            values = data[name]
+            if typecode == STRING:
+                encoder = self.encoders[name]
+                if isinstance(values, tuple):
+                    codes, dictionary = values
+                    values = encoder.remap(codes, dictionary)
+                else:
+                    values = array.array(CODE_TYPE,
+                        (encoder.encode(v) for v in values))
+            elif hasattr(values, "dtype"):
+                # NumPy uses the same type codes, copy the buffer.
+                values = array_from_bytes(typecode, 
+                    values.astype(typecode).tobytes())
+            elif not isinstance(values, array.array) or \
+                values.typecode != typecode:
+                values = array.array(typecode, values)
+
+            if count is not None and len(values) != count:
+                raise ValueError("Column {name} has {len} values, expected "\
+                    "{count}".format(name=name, len=len(values), count=count))
+            count = len(values)
+            encoded[name] = values
+
+        if not count:
+            self._write_header()
+            return 0
+
+        file_util.ensure_dir(self.path)
+        for name, values in encoded.iteritems():
+            with open(self.column_path(name), "ab") as f:
+                # Drop anything past the rows in the header, left by an
+                # append that did not finish.
+                f.truncate(self.rows * self.itemsizes[name])
+                f.seek(0, os.SEEK_END)
+                f.write(array_bytes(values))
+        self.rows += count
+        self._write_header()
+        return count
+
+    def _write_header(self):
+        """Write the header, which makes the appended rows visible."""
+
+        file_util.ensure_dir(self.path)
+        header = {
+            "columns" : self.columns,
+            "rows" : self.rows,
+            "itemsizes" : self.itemsizes,
+            "dictionaries" : dict(
+                (name, encoder.values)
+                for name, encoder in self.encoders.iteritems()
+            ),
+        }
+        with file_util.atomic_write(os.path.join(self.path, HEADER_FILE),
+            "w") as f:
+            json.dump(header, f)
+        return
+
+    def read(self, name):
+        """Read the values in the column ``name``.
+
+        Returns an :class:`array.array`, string columns are returned as
+        their codes, see :meth:`strings`.
+        """
+
+        typecode = self.storage_type(name)
+        if array.array(typecode).itemsize != self.itemsizes[name]:
+            raise RuntimeError("Column {name} in {path} was written on a "\
+                "platform with a different size for type {typecode}".format(
+                name=name, path=self.path, typecode=typecode))
+        length = self.rows * self.itemsizes[name]
+        if not length:
+            return array.array(typecode)
+        with open(self.column_path(name), "rb") as f:
+            return array_from_bytes(typecode, f.read(length))
+
+    def map(self, name):
+        """Memory map the values in the column ``name``, so only the pages
+        that are used are read.
+
+        Returns a read only NumPy array, or an :class:`array.array` from 
+        :meth:`read` if NumPy is not installed.
+        """
+
+        if numpy is None or not self.rows:
+            return self.read(name)
+        typecode = self.storage_type(name)
+        if numpy.dtype(typecode).itemsize != self.itemsizes[name]:
+            raise RuntimeError("Column {name} in {path} was written on a "\
+                "platform with a different size for type {typecode}".format(
+                name=name, path=self.path, typecode=typecode))
+        return numpy.memmap(self.column_path(name), dtype=typecode, 
+            mode="r", shape=(self.rows,))
+
+    def strings(self, name):
+        """Returns the dictionary of values for the string column ``name``.
+        """
+
+        return self.encoders[name].values
@@ -1,16 +1,20 @@
 """Base for commands"""
 
 import argparse
+import codecs
+import collections
 import copy
+import hashlib
+import json
 import logging
 import os.path
-import shutil
+import sys
+import time
 
-import pkg_resources
+import entry_points, file_util, resources, serializer, task
 
-from mako.template import Template
-
-import file_util, resources, task
+# The modules for the other commands are imported by the commands that use 
+# them, so the ones that do not need them, like noop, start quickly. 
 
 # ============================================================================
 # 
@@ -53,9 +57,21 @@ class SubCommand(object):
         parser = sub_parsers.add_parser(cls.name,
             help=cls.help or "No help", 
             description=cls.description or "No help", 
-            formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+            conflict_handler="resolve")
         parser.set_defaults(func=cls)
+        cls.add_arguments(parser)
         return parser
+
+    @classmethod
+    def add_arguments(cls, parser):
+        """Called to add the command specific arguments to ``parser``.
+
+        Sub classes should override this method to add their options. 
+        Commands that run other commands should pass the call on so the 
+        options for those commands are also available.
+        """
+        return
     
     def __call__(self):
         """Called to execute the SubCommand.
@@ -111,46 +127,121 @@ class CheckCommand(SubCommand):
     description = "Runs a full checkup."
     """Command line description for the Sub Command."""
 
+    command_names = ["collect", "analyse", "report"]
+    """Commands to run and the order to run them in."""
 
     def __init__(self, args):
         self.log = logging.getLogger("%s.%s" % (__name__, "CheckCommand"))
         self.args = args
+
+    @classmethod
+    def add_arguments(cls, parser):
+        """Adds the arguments for all of the commands the check runs."""
+        
+        import archive
+        archive.add_arguments(parser)
+        for ep_name in cls.command_names:
+            for ep in entry_points.iter_entry_points(
+                resources.COMMAND_EP_GROUP, name=ep_name):
+                ep.load().add_arguments(parser)
+        return
         
     def __call__(self):
         """Runs the command."""
         
-        # commands to run and the order to run them in. 
-        ep_names = ["collect", "report"]
         cmds = []
-        for ep_name in ep_names:
-            eps = list(pkg_resources.iter_entry_points(
+        for ep_name in self.command_names:
+            eps = list(entry_points.iter_entry_points(
                 resources.COMMAND_EP_GROUP, name=ep_name))
 
             if not eps or len(eps) > 1:
                 return RuntimeError("Found {len} end points for group "\
                     "{group} and name {name}".format(len=len(ep), 
                     group=resources.COMMAND_EP_GROUP, name=ep_name))
-            # Load returns the cls, we want to create an instance
-            cmds.append(eps[0].load()(copy.copy(self.args)))
+            cmds.append(eps[0].load())
+        # Tasks add their output to the archive as they finish.
+        writer = None
+        if self.args.archive:
+            import archive
+            writer = archive.ArchiveWriter.open(self.args.archive, 
+                codec=self.args.archive_codec, 
+                root_name=os.path.basename(self.args.check_dir))
+            self.args.archive_writer = writer
+        
+        # Load returns the cls, we want to create an instance
+        cmds = [cmd_cls(copy.copy(self.args)) for cmd_cls in cmds]
         self.log.info("Running commands {cmds}".format(cmds=cmds))
 
         out = []
-        for cmd in cmds:
-            self.log.debug("Starting command {cmd}".format(cmd=cmd))
-            cmd_ret, cmd_out = cmd()
-            
-            if cmd_ret != 0 and self.args.fail_fast:
-                import pdb
-                pdb.set_trace()
-                self.log.error("Error {cmd_ret} running command {cmd.name}. "\
-                    "Stopping as fail-fast was specified.".format(
-                    cmd_ret=cmd_ret, cmd=cmd))
+        rv = 0
+        for batch in self._batches(cmds):
+            if len(batch) > 1:
+                results = self._run_scheduled(batch)
+            else:
+                self.log.debug("Starting command {cmd}".format(cmd=batch[0]))
+                results = [batch[0]()]
             
-            out.append("")
-            out.append("Output from command: {cmd.name}".format(cmd=cmd))
-            out.append(cmd_out)
+            for cmd, (cmd_ret, cmd_out) in zip(batch, results):
+                if cmd_ret != 0 and self.args.fail_fast:
+                    import pdb
+                    pdb.set_trace()
+                    self.log.error("Error {cmd_ret} running command "\
+                        "{cmd.name}. Stopping as fail-fast was "\
+                        "specified.".format(cmd_ret=cmd_ret, cmd=cmd))
+                
+                rv = rv or cmd_ret
+                out.append("")
+                out.append("Output from command: {cmd.name}".format(cmd=cmd))
+                out.append(cmd_out)
         
-        return (0, "\n".join(out))
+        if writer is not None:
+            # pick up the report and anything the tasks did not archive.
+            writer.add_dir(self.args.check_dir, "")
+            writer.close()
+            if self.args.archive == "-":
+                # stdout has the archive.
+                sys.stderr.write("\n".join(out) + "\n")
+                return (rv, None)
+        return (rv, "\n".join(out))
+    
+    def _batches(self, cmds):
+        """Yields lists of the ``cmds`` to run together, commands next to 
+        each other that only run tasks are in the same list."""
+        
+        batch = []
+        for cmd in cmds:
+            if isinstance(cmd, TaskRunningCommand) and cmd.schedulable():
+                batch.append(cmd)
+                continue
+            if batch:
+                yield batch
+                batch = []
+            yield [cmd]
+        if batch:
+            yield batch
+    
+    def _run_scheduled(self, cmds):
+        """Run the tasks from all the ``cmds`` together, so a task can start
+        as soon as the tasks it needs have finished rather than when the 
+        command before has finished. 
+        
+        Returns the list of (rv, msg) tuples for the commands.
+        """
+        
+        import scheduler
+        
+        cmd_tasks = [(cmd, cmd.create_tasks()) for cmd in cmds]
+        owners = dict(
+            (t, cmd)
+            for cmd, tasks in cmd_tasks
+            for t in tasks
+        )
+        self.log.info("Scheduling tasks {tasks} from commands {cmds}".format(
+            tasks=owners.keys(), cmds=cmds))
+        scheduler.Scheduler([t for _, tasks in cmd_tasks for t in tasks],
+            lambda t: owners[t]._try_run_task(t), 
+            jobs=getattr(self.args, "jobs", 1) or 1).run()
+        return [cmd.finish(tasks) for cmd, tasks in cmd_tasks]
 
 # ============================================================================
 # 
@@ -170,6 +261,10 @@ class ReportCommand(SubCommand):
     description = "Reports on the task output."
     """Command line description for the Sub Command."""
 
+    template_filters = ["unicode", "h"]
+    """Filters for every expression in the templates. Errors and stats 
+    include text from the logs and nodetool, so they are HTML escaped, use
+    ``| n`` in a template for markup."""
 
     def __init__(self, args):
         self.log = logging.getLogger("%s.%s" % (__name__, "ReportCommand"))
@@ -181,104 +276,323 @@ class ReportCommand(SubCommand):
     def __call__(self):
         """Runs the command."""
         
-        # Collect all of the task receipts that need to be reported on.
-        # args.check_dir will be the top level dir 
-        receipts = []
-        for root, dirs, files in os.walk(self.args.check_dir):
-            paths = (
-                os.path.join(root, f)
-                for f in files
-            )
-            for path in paths:
-                receipt = task.TaskReceipt.maybe_load(path)
-                if receipt and receipt.report_on:
-                    receipts.append(receipt)
+        receipts = self._load_receipts()
         self.log.debug("Reporting on receipts {receipts}".format(
             receipts=receipts))
         
         # Build a list of all the files we want to copy and associate 
         # this with the receipt. 
         receipt_files = {}
-        for receipt in receipts:            
-            root, _, files = os.walk(receipt.task_dir).next()
-            paths = (
-                os.path.join(root, f)
-                for f in files
-            )
-            
-            # Exclude the receipt files. 
-            copy_files = [
-                path
-                for path in paths
-                if not task.TaskReceipt.is_receipt_file(path)
-            ]
+        digests = {}
+        for receipt in receipts:
+            if receipt.files:
+                copy_files = []
+                for f in receipt.files:
+                    path = os.path.join(receipt.task_dir, f["name"])
+                    digests[path] = f["sha1"]
+                    copy_files.append(path)
+            else:
+                copy_files = self._find_task_files(receipt.task_dir)
             self.log.debug("For task {receipt.name} has files "\
                 "{files}".format(receipt=receipt, files=copy_files))
             receipt_files[receipt] = copy_files
         
+        # Only tasks that changed since the last build are staged and 
+        # rendered again. 
+        state = self._load_build_state()
+        templates = self._templates_fingerprint()
+        if state.get("templates") != templates:
+            state = {}
+        built = state.get("receipts", {})
         
-        relative_files = self._copy_receipt_files(receipt_files)
+        fingerprints = {}
+        relative_files = {}
+        changed = {}
+        for receipt, files in receipt_files.iteritems():
+            fingerprints[receipt] = self._receipt_fingerprint(receipt, files)
+            previous = built.get(receipt.label)
+            if previous and previous["fingerprint"] == fingerprints[receipt] \
+                and all(
+                    os.path.exists(os.path.join(self.report_dir, path))
+                    for path in previous["files"] + [previous["page"]]
+                ):
+                relative_files[receipt] = previous["files"]
+            else:
+                changed[receipt] = files
+        self.log.info("Building report in {self.report_dir} for {changed} "\
+            "changed tasks of {count}".format(self=self, changed=len(changed),
+            count=len(receipt_files)))
+        relative_files.update(self._copy_receipt_files(changed, digests))
         
-        self.log.info("Building report in {self.report_dir}".format(
-            self=self))
-        report_file = self._write_report(relative_files)
+        report_file, task_pages = self._write_report(relative_files, changed)
+        self._save_build_state({
+            "templates" : templates,
+            "receipts" : dict(
+                (receipt.label, {
+                    "fingerprint" : fingerprints[receipt],
+                    "files" : relative_files[receipt],
+                    "page" : task_pages[receipt],
+                })
+                for receipt in receipt_files
+            ),
+        })
+        import perf
+        perf_file = serializer.dump(perf.summarise(receipts), 
+            os.path.join(self.report_dir, "perf.json"))
         
         out = [
-            "Wrote report to {report_file}".format(report_file=report_file)
+            "Wrote report to {report_file}, {changed} of {count} tasks "\
+                "changed".format(report_file=report_file, 
+                changed=len(changed), count=len(receipt_files)),
+            "Wrote task perf summary to {perf_file}".format(
+                perf_file=perf_file),
         ]
         return (0, "\n".join(out))
     
-    def _copy_receipt_files(self, receipt_files):
-        """Copy the files for each receipt in ``receipt_files`` to the 
-        tasks/ dir in the report. 
+    build_state_file = "build-state.json"
+    """File in the report dir the state of the last build is kept in."""
+    
+    def _load_build_state(self):
+        """Returns the state saved by the last build, or an empty dict."""
+        
+        path = os.path.join(self.report_dir, self.build_state_file)
+        if not os.path.exists(path):
+            return {}
+        try:
+            return serializer.load(path) or {}
+        except (ValueError) as e:
+            self.log.warn("Ignoring invalid build state {path}: {e}".format(
+                path=path, e=e))
+            return {}
+    
+    def _save_build_state(self, state):
+        
+        return serializer.dump(state, os.path.join(self.report_dir, 
+            self.build_state_file))
+    
+    def _receipt_fingerprint(self, receipt, files):
+        """Returns a digest of the ``receipt`` and the size and mtime of its
+        output ``files``, which changes when the task runs again."""
+        
+        data = {
+            "receipt" : receipt.to_dict(),
+            "files" : [
+                (path, os.path.getsize(path), os.path.getmtime(path))
+                for path in files
+            ],
+        }
+        return hashlib.sha1(json.dumps(data, sort_keys=True, 
+            default=str)).hexdigest()
+    
+    def _templates_fingerprint(self):
+        """Returns a digest of the report templates, pages are rendered 
+        again when they change."""
+        
+        import pkg_resources
+        
+        template_dir = pkg_resources.resource_filename("cass_check", 
+            "templates")
+        data = [
+            (name, os.path.getsize(os.path.join(template_dir, name)), 
+                os.path.getmtime(os.path.join(template_dir, name)))
+            for name in sorted(os.listdir(template_dir))
+        ]
+        data.append(self.template_filters)
+        return hashlib.sha1(json.dumps(data)).hexdigest()
+    
+    def _load_receipts(self):
+        """Load the receipts to report on from the output of each command in
+        the check_dir. 
+        
+        Receipts are read from the manifest the command wrote, if there is 
+        no manifest the command dir is searched for receipt files. 
+        """
+        
+        receipts = []
+        for name in sorted(os.listdir(self.args.check_dir)):
+            cmd_dir = os.path.join(self.args.check_dir, name)
+            if not os.path.isdir(cmd_dir) or cmd_dir == self.report_dir:
+                continue
+            
+            cmd_receipts = task.ReceiptManifest.load(cmd_dir)
+            if cmd_receipts is None:
+                self.log.info("No manifest in {cmd_dir}, searching for "\
+                    "receipts.".format(cmd_dir=cmd_dir))
+                cmd_receipts = self._find_receipts(cmd_dir)
+            receipts.extend(
+                receipt
+                for receipt in cmd_receipts
+                if receipt.report_on
+            )
+        return receipts
+    
+    def _find_receipts(self, search_dir):
+        """Walk ``search_dir`` and load all the receipts in it."""
+        
+        receipts = []
+        for root, dirs, files in os.walk(search_dir):
+            paths = (
+                os.path.join(root, f)
+                for f in files
+            )
+            for path in paths:
+                receipt = task.TaskReceipt.maybe_load(path)
+                if receipt:
+                    receipts.append(receipt)
+        return receipts
+    
+    def _find_task_files(self, task_dir):
+        """Returns the paths of the output files in ``task_dir``."""
+        
+        root, _, files = os.walk(task_dir).next()
+        paths = (
+            os.path.join(root, f)
+            for f in files
+        )
+        
+        # Exclude the receipt files. 
+        return [
+            path
+            for path in paths
+            if not task.TaskReceipt.is_receipt_file(path)
+        ]
+    
+    def _copy_receipt_files(self, receipt_files, digests):
+        """Stage the files for each receipt in ``receipt_files`` in the 
+        tasks/<task name>/ dir in the report. 
+        
+        Files are hard linked or cloned rather than copied where possible, 
+        see :func:`file_util.stage_file`, and files with the same content 
+        are only staged once. ``digests`` is a map of the paths to their 
+        sha1 digests from the receipts, other files are hashed if needed. 
         
         Returns a dict of {receipt : [report_file]} where report_file is 
         a relative path under the report."""
         
+        # Only files with the same size can have the same content, so only 
+        # they are hashed. 
+        sizes = collections.Counter(
+            os.path.getsize(path)
+            for paths in receipt_files.itervalues()
+            for path in paths
+        )
+        
+        staged = {}
+        methods = collections.Counter()
         report_files = {}
-        for receipt, paths in receipt_files.iteritems():
+        for receipt in sorted(receipt_files, key=lambda r: r.label):
             report_files[receipt] = []
             
-            for src_path in paths:
-                _, src_name = os.path.split(src_path)
-                rel_path = os.path.join("tasks", src_name)
-                dest_path = os.path.join(self.report_dir, rel_path)
+            for src_path in receipt_files[receipt]:
+                digest = digests.get(src_path)
+                if digest is None and sizes[os.path.getsize(src_path)] > 1:
+                    digest = file_util.file_digest(src_path)
                 
-                file_util.ensure_dir(os.path.dirname(dest_path))
-                shutil.copy2(src_path, dest_path)
+                if digest in staged:
+                    rel_path = staged[digest]
+                    methods["duplicate"] += 1
+                else:
+                    _, src_name = os.path.split(src_path)
+                    rel_path = os.path.join("tasks", receipt.node or "", 
+                        receipt.name, src_name)
+                    dest_path = os.path.join(self.report_dir, rel_path)
+                    
+                    file_util.ensure_dir(os.path.dirname(dest_path))
+                    methods[file_util.stage_file(src_path, dest_path)] += 1
+                    if digest:
+                        staged[digest] = rel_path
                 report_files[receipt].append(rel_path)
+        
+        self.log.info("Staged report files using {methods}".format(
+            methods=dict(methods)))
         return report_files
         
-    def _write_report(self, receipt_files):
+    def _write_report(self, receipt_files, changed):
         """Writes the report to disk for the ``receipt_files`` map of 
         :class:`task.TastReceipt` to list of file paths. 
+        
+        The index only summarises the tasks, the files and stats for each 
+        task are on a page for the task so the index stays small. Only the
+        pages for the ``changed`` receipts are rendered.
+        
+        Returns a tuple of (index path, {receipt : page path}).
         """
         
-        # Render the report
+        # Only the report needs these, and they are slow to import. 
+        import pkg_resources
+        from mako.lookup import TemplateLookup
+        import analysis_tasks, perf
         
-        template = Template(text=pkg_resources.resource_string(
-            "cass_check", "templates/report.mako"))
-        index_path = os.path.join(self.report_dir, "index.html")
-        self.log.info("Writing report index to {index_path}".format(
-            index_path=index_path))
-        with open(index_path, "w") as f:
-            f.write(template.render(receipt_files=receipt_files))
+        # Templates are compiled to modules in the cache dir, so they are 
+        # only compiled again when they change. The filters are compiled 
+        # into the modules, so they are kept apart for each set of filters.
+        lookup = TemplateLookup(
+            directories=[pkg_resources.resource_filename("cass_check", 
+                "templates")],
+            module_directory=os.path.join(entry_points.cache_dir(), "mako",
+                "-".join(self.template_filters)),
+            input_encoding="utf-8",
+            default_filters=self.template_filters)
+        
+        task_pages = {}
+        for receipt, files in receipt_files.iteritems():
+            page = os.path.join("pages", receipt.label + ".html")
+            page_dir = os.path.dirname(page)
+            if receipt in changed:
+                self._render(lookup, "task.mako", page, receipt=receipt, 
+                    files=[os.path.relpath(f, page_dir) for f in files])
+            task_pages[receipt] = page
+        
+        index_path = self._render(lookup, "report.mako", "index.html", 
+            receipt_files=receipt_files, task_pages=task_pages, 
+            perf_fields=perf.PERF_FIELDS, 
+            search=os.path.isdir(analysis_tasks.SearchIndexAnalysisTask.\
+                index_dir(self.args.check_dir)))
+        self.log.info("Wrote report index to {index_path} and {count} task "\
+            "pages".format(index_path=index_path, count=len(task_pages)))
             
-        # copy assets
+        # copy assets, unless they are already there. 
         for asset_name in pkg_resources.resource_listdir("cass_check", 
             "assets/"):
             
             res_name = "assets/{asset_name}".format(asset_name=asset_name)
             dest = os.path.join(self.report_dir, res_name)
+            content = pkg_resources.resource_string("cass_check", res_name)
+            if os.path.exists(dest) and \
+                os.path.getsize(dest) == len(content):
+                with open(dest, "rb") as f:
+                    if f.read() == content:
+                        continue
+            
             self.log.info("Copying report asset {asset_name} to "\
                 "{dest}".format(asset_name=asset_name, dest=dest))
-                
-            with pkg_resources.resource_stream("cass_check", res_name) as src:
-                file_util.ensure_dir(os.path.dirname(dest))
-                with open(dest, "w") as f:
-                    f.write(src.read())
+            file_util.ensure_dir(os.path.dirname(dest))
+            with file_util.atomic_write(dest, "wb") as f:
+                f.write(content)
+        
+        return (index_path, task_pages)
+    
+    def _render(self, lookup, template_name, rel_path, **kwargs):
+        """Render the template ``template_name`` from ``lookup`` to 
+        ``rel_path`` in the report with the ``kwargs``. 
+        
+        The template writes to the file as it is rendered, rather than 
+        building the page in memory.
+        
+        Returns the path written.
+        """
+        
+        from mako.runtime import Context
         
-        return index_path
+        path = os.path.join(self.report_dir, rel_path)
+        file_util.ensure_dir(os.path.dirname(path))
+        # links to the assets are relative to the page.
+        root = "../" * rel_path.count(os.sep)
+        with file_util.atomic_write(path, "wb") as f:
+            writer = codecs.getwriter("utf-8")(f)
+            lookup.get_template(template_name).render_context(Context(writer,
+                root=root, **kwargs))
+        return path
         
 
 # ============================================================================
@@ -304,40 +618,173 @@ class TaskRunningCommand(SubCommand):
 
     def __init__(self, args):
         self.args = args
+
+    @classmethod
+    def add_arguments(cls, parser):
+        """Adds the options for running tasks."""
+        
+        parser.add_argument("--jobs", dest="jobs", type=int, default=1,
+            help="Number of tasks to run at the same time.")
+        parser.add_argument("--exec-timeout", dest="exec_timeout", 
+            type=float, default=300,
+            help="Seconds to wait for a command run by a task before "\
+                "killing it.")
+        import history, task_cache
+        history.add_arguments(parser)
+        task_cache.add_arguments(parser)
+        
+        for ep in entry_points.iter_entry_points(cls.entry_point_group):
+            ep.load().add_arguments(parser)
+        return
         
     def __call__(self):
         """"""
         
+        import scheduler
+        
+        tasks = self.create_tasks()
+        self.log.info("Running tasks {tasks}".format(tasks=tasks))
+        scheduler.Scheduler(tasks, self._try_run_task, 
+            jobs=getattr(self.args, "jobs", 1) or 1).run()
+        return self.finish(tasks)
+    
+    def schedulable(self):
+        """Returns True if the command only runs tasks, so the check 
+        command can schedule them with the tasks from other commands."""
+        
+        return True
+    
+    def create_tasks(self):
+        """Returns the list of tasks for this command."""
+        
         # Update things before creating all the tasks
         self._on_before_tasks()
         
-        # create all the tasks
         tasks = []
         self.log.debug("Loading entry points from group {group}".format(
             group=self.entry_point_group))
-        for ep in pkg_resources.iter_entry_points(self.entry_point_group):
+        for ep in entry_points.iter_entry_points(self.entry_point_group):
             # Tasks share the same args instance the command has.
             tasks.append(ep.load()(self.args))
-        self.log.info("Running tasks {tasks}".format(tasks=tasks))
+        return tasks
+    
+    def finish(self, tasks):
+        """Called after the ``tasks`` from :meth:`create_tasks` have run,
+        to write the manifest. 
+        
+        Returns the (rv, msg) tuple for the command.
+        """
+        
+        receipts = [t.receipt for t in tasks]
+        task.ReceiptManifest.write(self.args.check_dir, receipts, 
+            fmt=self.args.receipt_format)
+        self._record_history(receipts)
+        self._archive_dir(self.args.check_dir)
+        if self.task_cache is not None:
+            self.task_cache.evict()
+        return (0, self._describe_receipts(receipts))
+    
+    def _record_history(self, receipts):
+        """Adds the metrics from the ``receipts`` to the history, unless 
+        disabled."""
+        
+        if getattr(self.args, "no_history", False):
+            return
+        import history
+        path = history.history_dir(self.args)
+        try:
+            rows = history.record(path, 
+                os.path.basename(self.args.check_root), receipts)
+        except (EnvironmentError, ValueError) as e:
+            # the checkup is still good without the history.
+            if self.args.fail_fast:
+                raise
+            self.log.warn("Could not add metrics to the history in "\
+                "{path}: {e}".format(path=path, e=e))
+            return
+        self.log.info("Added {rows} metrics to the history in "\
+            "{path}".format(rows=rows, path=path))
+        return
+    
+    def _archive_dir(self, src_dir):
+        """Adds the files in ``src_dir`` to the archive being streamed by 
+        the check command, if any."""
+        
+        writer = getattr(self.args, "archive_writer", None)
+        if writer is None:
+            return
+        added = writer.add_dir(src_dir, os.path.relpath(src_dir, 
+            self.args.check_root))
+        self.log.debug("Archived {added} files from {src_dir}".format(
+            added=added, src_dir=src_dir))
+        return
+    
+    def _run_task(self, task):
+        """Runs the ``task`` and writes its receipt. 
         
-        # Run each task
-        for task in tasks:
-            self.log.debug("Running task {task.name}".format(task=task))
-            task_dir = None
-            try:
+        Errors from the task are stored in the receipt, unless fail-fast 
+        was specified in which case they are raised. 
+        """
+        
+        self.log.debug("Running task {task.name}".format(task=task))
+        task_dir = None
+        try:
+            cache = self.task_cache
+            fingerprint = task.fingerprint() if cache else None
+            if fingerprint and self._restore_task(task, fingerprint):
+                task_dir = task.task_dir
+            else:
                 task_dir = task()
-            except (Exception) as e:
-                if self.args.fail_fast:
-                    raise
-                self.log.warn("Error from task {task.name}".format(task=task),
-                    exc_info=True)
-                task.receipt.error = e
-            
-            task.receipt.write()
-            self.log.info("Task {task.name} generated output in "\
-                "{task_dir}".format(task=task, task_dir=task_dir))
+                if fingerprint:
+                    cache.store(task, fingerprint)
+        except (Exception) as e:
+            if self.args.fail_fast:
+                raise
+            self.log.warn("Error from task {task.name}".format(task=task),
+                exc_info=True)
+            task.receipt.error = e
         
-        return (0, self._describe_receipts(tasks))
+        task.receipt.write()
+        self.log.info("Task {task.name} generated output in "\
+            "{task_dir}".format(task=task, task_dir=task_dir))
+        self._archive_dir(task.receipt.task_dir)
+        return task
+    
+    @property
+    def task_cache(self):
+        """The :class:`task_cache.TaskCache` for the command, or None if 
+        caching is disabled."""
+        
+        if not hasattr(self, "_task_cache"):
+            import task_cache
+            self._task_cache = task_cache.TaskCache.from_args(self.args)
+        return self._task_cache
+    
+    def _restore_task(self, task, fingerprint):
+        """Restore the output of ``task`` from the cache, recording the 
+        resources used to do it. 
+        
+        Returns False if it is not in the cache."""
+        
+        task.measurement.start()
+        try:
+            return self.task_cache.restore(task, fingerprint)
+        finally:
+            task.receipt.perf = task.measurement.stop()
+    
+    def _try_run_task(self, task):
+        """Runs the ``task`` in a pool thread. 
+        
+        Returns None or the ``sys.exc_info()`` for an error raised by the 
+        task, so it can be re-raised with the original traceback in the 
+        calling thread.
+        """
+        
+        try:
+            self._run_task(task)
+        except:
+            return sys.exc_info()
+        return None
         
     def _on_before_tasks(self):
         """Called before the tasks are created for the command. 
@@ -346,8 +793,10 @@ class TaskRunningCommand(SubCommand):
         output dir for this command.
         """
         
-        # update the output dir 
+        # update the output dir, keeping the checkup dir so tasks can read
+        # the output from other commands.
         orig_check_dir = self.args.check_dir
+        self.args.check_root = os.path.abspath(orig_check_dir)
         self.args.check_dir = os.path.abspath(os.path.join(
             self.args.check_dir, self.name))
         file_util.ensure_dir(self.args.check_dir)
@@ -356,19 +805,21 @@ class TaskRunningCommand(SubCommand):
             "{command.args.check_dir}".format(command=self))
         return
     
-    def _describe_receipts(self, tasks):
-        """Build a string to describe all the ``tasks`` that ran.
-        
-        Uses the task receipt.
+    def _describe_receipts(self, receipts):
+        """Build a string to describe all the tasks that ran from their 
+        ``receipts``.
         """
         
         builder = []
         append = builder.append
         
         append("Tasks run by command {s.name}:".format(s=self))
-        for task in tasks:
-            result = "Error" if task.receipt.error else task.receipt.task_dir
-            append("\t{receipt.name:<30} {result}".format(receipt=task.receipt, 
+        # tasks may finish in any order, so sort to keep the output stable. 
+        for receipt in sorted(receipts, key=lambda r: r.label):
+            result = "Error" if receipt.error else receipt.task_dir
+            if receipt.cached:
+                result += " (cached)"
+            append("\t{receipt.label:<30} {result}".format(receipt=receipt, 
                 result=result))
         return "\n".join(builder)
 # ============================================================================
@@ -390,4 +841,502 @@ class CollectCommand(TaskRunningCommand):
 
     entry_point_group = "cass_check.tasks.collection"
 
+    @classmethod
+    def add_arguments(cls, parser):
+        
+        super(CollectCommand, cls).add_arguments(parser)
+        import remote
+        parser.add_argument("--hosts", dest="hosts", default=None,
+            help="Comma separated list of nodes to collect from, rather "\
+                "than collecting from this machine.")
+        parser.add_argument("--remote-exec", dest="remote_exec", 
+            default=remote.DEFAULT_REMOTE_EXEC,
+            help="Template for the command that runs {cmd} on {host}.")
+        parser.add_argument("--remote-cass-check", dest="remote_cass_check",
+            default="cass-check",
+            help="Path to cass-check on the nodes.")
+        parser.add_argument("--host-concurrency", dest="host_concurrency", 
+            type=int, default=16,
+            help="Number of nodes to collect from at the same time.")
+        parser.add_argument("--host-timeout", dest="host_timeout", 
+            type=float, default=600,
+            help="Seconds to wait for the collection on a node.")
+        return
+
+    def schedulable(self):
+        """Collecting from other nodes does not run local tasks."""
+        
+        return not getattr(self.args, "hosts", None)
+    
+    def __call__(self):
+        
+        if self.schedulable():
+            return super(CollectCommand, self).__call__()
+        
+        import remote
+        
+        self._on_before_tasks()
+        if getattr(self.args, "incremental", False):
+            self.log.warn("Collecting all log data from the nodes, "\
+                "--incremental needs checkpoints that are not kept on the "\
+                "nodes.")
+        hosts = [
+            host.strip()
+            for host in self.args.hosts.split(",")
+            if host.strip()
+        ]
+        script = remote.remote_script(self.args.remote_cass_check, 
+            ["--receipt-format", self.args.receipt_format], 
+            self._forward_args())
+        
+        def collect(host):
+            host_dir = os.path.join(self.args.check_dir, host)
+            receipts = remote.collect_host(host, host_dir, script, 
+                template=self.args.remote_exec, 
+                timeout=self.args.host_timeout)
+            self._archive_dir(host_dir)
+            return receipts
+        
+        concurrency = max(1, min(self.args.host_concurrency, len(hosts)))
+        self.log.info("Collecting from {count} nodes, {concurrency} at a "\
+            "time".format(count=len(hosts), concurrency=concurrency))
+        # The work is done by the remote processes, so threads are enough.
+        import multiprocessing.pool
+        pool = multiprocessing.pool.ThreadPool(concurrency)
+        try:
+            host_receipts = pool.map(collect, hosts)
+            pool.close()
+        finally:
+            pool.join()
+        
+        receipts = [
+            receipt
+            for receipts in host_receipts
+            for receipt in receipts
+        ]
+        if self.args.fail_fast:
+            for receipt in receipts:
+                if receipt.error:
+                    raise RuntimeError("Error from task {receipt.label}: "\
+                        "{receipt.error}".format(receipt=receipt))
+        
+        task.ReceiptManifest.write(self.args.check_dir, receipts, 
+            fmt=self.args.receipt_format)
+        self._record_history(receipts)
+        self._archive_dir(self.args.check_dir)
+        
+        # Scripts need to know when a node was not collected. 
+        failed = [
+            receipt.node
+            for receipt in receipts
+            if receipt.name == remote.HOST_TASK_NAME and receipt.error
+        ]
+        msg = self._describe_receipts(receipts)
+        if failed:
+            return (1, "{msg}\nCollection failed on {count} of {total} "\
+                "nodes: {nodes}".format(msg=msg, count=len(failed), 
+                total=len(hosts), nodes=", ".join(sorted(failed))))
+        return (0, msg)
+
+    local_dests = ["history_dir", "no_history", "no_cache", 
+        "cache_max_age_days", "cache_max_mb"]
+    """Options that are not passed to the nodes, the remote script disables
+    the history and task cache there."""
+    
+    def _forward_args(self):
+        """Returns the list of collect args to pass to the nodes, the task 
+        options that are not the default."""
+        
+        parser = argparse.ArgumentParser(add_help=False, 
+            conflict_handler="resolve")
+        super(CollectCommand, type(self)).add_arguments(parser)
+        
+        forward = []
+        for action in parser._actions:
+            if not action.option_strings or \
+                action.dest in self.local_dests:
+                continue
+            value = getattr(self.args, action.dest, action.default)
+            if value == action.default:
+                continue
+            forward.append(action.option_strings[0])
+            # flags like store_true do not take a value.
+            if action.nargs != 0:
+                forward.append(str(value))
+        return forward
+
+# ============================================================================
+# 
+
+class AnalyseCommand(TaskRunningCommand):
+    """Run tasks categorised as analysis tasks."""
+    log = logging.getLogger("%s.%s" % (__name__, "AnalyseCommand"))
         
+    name = "analyse"
+    """Command line name for the Sub Command.
+    """
+
+    help = "Analyse the output from the collection tasks."
+    """Command line help for the Sub Command."""
+
+    description = ""
+    """Command line description for the Sub Command."""
+
+    entry_point_group = "cass_check.tasks.analysis"
+
+
+# ============================================================================
+# 
+
+class ArchiveCommand(SubCommand):
+    """Archive the output from a checkup."""
+
+    name = "archive"
+    """Command line name for the Sub Command.
+    """
+
+    help = "Archive the checkup output."
+    """Command line help for the Sub Command."""
+
+    description = "Stream the checkup dir into a compressed tar with a "\
+        "manifest of file hashes. Use check --archive to archive the "\
+        "output as it is produced."
+    """Command line description for the Sub Command."""
+
+
+    def __init__(self, args):
+        self.log = logging.getLogger("%s.%s" % (__name__, "ArchiveCommand"))
+        self.args = args
+
+    @classmethod
+    def add_arguments(cls, parser):
+        
+        import archive
+        archive.add_arguments(parser)
+        return
+        
+    def __call__(self):
+        """Runs the command."""
+        
+        import archive
+        
+        path = self.args.archive or (self.args.check_dir + 
+            archive.ARCHIVE_EXTENSIONS[0][0])
+        with archive.ArchiveWriter.open(path, codec=self.args.archive_codec,
+            root_name=os.path.basename(self.args.check_dir)) as writer:
+            writer.add_dir(self.args.check_dir, "")
+        
+        msg = "Archived {count} files, {size} bytes, to {path}".format(
+            count=len(writer.manifest), size=writer.bytes_in, path=path)
+        if path == "-":
+            sys.stderr.write(msg + "\n")
+            return (0, None)
+        return (0, msg)
+
+# ============================================================================
+# 
+
+class ServeCommand(SubCommand):
+    """Serve the report over HTTP."""
+
+    name = "serve"
+    """Command line name for the Sub Command.
+    """
+
+    help = "Serve the report over HTTP."
+    """Command line help for the Sub Command."""
+
+    description = "Serve the report dir over HTTP, with byte ranges, paged "\
+        "and tail views of large files and decompression of compressed "\
+        "files."
+    """Command line description for the Sub Command."""
+
+
+    def __init__(self, args):
+        self.log = logging.getLogger("%s.%s" % (__name__, "ServeCommand"))
+        self.args = args
+
+    @classmethod
+    def add_arguments(cls, parser):
+        
+        parser.add_argument("--bind", dest="bind", default="127.0.0.1",
+            help="Address to listen on.")
+        parser.add_argument("--port", dest="port", type=int, default=8000,
+            help="Port to listen on.")
+        return
+        
+    def __call__(self):
+        """Runs the command, until interrupted."""
+        
+        import analysis_tasks, server
+        
+        report_dir = os.path.join(self.args.check_dir, ReportCommand.name)
+        if not os.path.exists(os.path.join(report_dir, "index.html")):
+            return (1, "No report in {report_dir}, run the report command "\
+                "first.".format(report_dir=report_dir))
+        
+        index_dir = analysis_tasks.SearchIndexAnalysisTask.index_dir(
+            self.args.check_dir)
+        if not os.path.isdir(index_dir):
+            self.log.info("No search index in {index_dir}, search is "\
+                "disabled".format(index_dir=index_dir))
+            index_dir = None
+        httpd = server.make_server(report_dir, self.args.bind, 
+            self.args.port, index_dir=index_dir)
+        url = "http://{host}:{port}/".format(host=self.args.bind, 
+            port=httpd.server_address[1])
+        self.log.info("Serving {report_dir} at {url}".format(
+            report_dir=report_dir, url=url))
+        sys.stderr.write("Serving report at {url}, press Ctrl-C to "\
+            "stop.\n".format(url=url))
+        try:
+            httpd.serve_forever()
+        except (KeyboardInterrupt):
+            pass
+        finally:
+            httpd.server_close()
+        return (0, "Stopped serving {url}".format(url=url))
+
+# ============================================================================
+# 
+
+class SearchCommand(SubCommand):
+    """Search the collected logs."""
+
+    name = "search"
+    """Command line name for the Sub Command.
+    """
+
+    help = "Search the collected logs."
+    """Command line help for the Sub Command."""
+
+    description = "Search the collected logs using the index built by the "\
+        "analyse command. Lines that contain all the words in the query "\
+        "are printed."
+    """Command line description for the Sub Command."""
+
+
+    def __init__(self, args):
+        self.log = logging.getLogger("%s.%s" % (__name__, "SearchCommand"))
+        self.args = args
+
+    @classmethod
+    def add_arguments(cls, parser):
+        
+        parser.add_argument("query", nargs="+",
+            help="Words to search for, case is ignored.")
+        parser.add_argument("--limit", dest="limit", type=int, default=100,
+            help="Most lines to return.")
+        return
+        
+    def __call__(self):
+        """Runs the command."""
+        
+        import analysis_tasks, search_index
+        
+        index_dir = analysis_tasks.SearchIndexAnalysisTask.index_dir(
+            self.args.check_dir)
+        if not os.path.isdir(index_dir):
+            return (1, "No search index in {index_dir}, run the analyse "\
+                "command first.".format(index_dir=index_dir))
+        
+        query = " ".join(self.args.query)
+        try:
+            hits, elapsed = search_index.timed_search(index_dir, query, 
+                limit=self.args.limit)
+        except (ValueError) as e:
+            return (1, str(e))
+        
+        out = [
+            u"{hit.path}:{hit.line_no}: {hit.line}".format(hit=hit)
+            for hit in hits
+        ]
+        out.append(u"{count} lines matched {query!r} in {elapsed:.3f}s".format(
+            count=len(hits), query=query, elapsed=elapsed))
+        return (0, u"\n".join(out).encode("utf-8"))
+
+# ============================================================================
+# 
+
+class TrendCommand(SubCommand):
+    """Show how a metric changed between checkups."""
+
+    name = "trend"
+    """Command line name for the Sub Command.
+    """
+
+    help = "Show how a metric changed between checkups."
+    """Command line help for the Sub Command."""
+
+    description = "Show the value of a metric in each checkup from the "\
+        "history, with the change from the checkup before. Lists the "\
+        "metrics if none is given."
+    """Command line description for the Sub Command."""
+
+
+    def __init__(self, args):
+        self.log = logging.getLogger("%s.%s" % (__name__, "TrendCommand"))
+        self.args = args
+
+    @classmethod
+    def add_arguments(cls, parser):
+        
+        import history
+        history.add_arguments(parser)
+        parser.add_argument("metric", nargs="?", default=None,
+            help="Metric to show, for example pause_p99_ms.")
+        parser.add_argument("--task", dest="task", default=None,
+            help="Only show the metric from this task.")
+        parser.add_argument("--node", dest="node", default=None,
+            help="Only show the metric for this node.")
+        parser.add_argument("--last", dest="last", type=int, default=20,
+            help="Number of checkups to show.")
+        return
+        
+    def __call__(self):
+        """Runs the command."""
+        
+        import history
+        
+        path = history.history_dir(self.args)
+        if not self.args.metric:
+            names = history.metrics(path)
+            if not names:
+                return (1, "No metrics in the history in {path}".format(
+                    path=path))
+            return (0, "\n".join(names))
+        
+        start = time.time()
+        points = history.trend(path, self.args.metric, task=self.args.task,
+            node=self.args.node)
+        elapsed = time.time() - start
+        if not points:
+            return (1, "No values for {metric} in the history in "\
+                "{path}".format(metric=self.args.metric, path=path))
+        
+        # points are oldest first
+        checks = list(collections.OrderedDict.fromkeys(
+            p.check for p in points))
+        shown = set(checks[-self.args.last:])
+        
+        previous = {}
+        out = ["{0:<24} {1:<16} {2:<24} {3:>14} {4:>9}".format("checkup", 
+            "node", "task", "value", "change")]
+        for point in points:
+            key = (point.node, point.task)
+            before = previous.get(key)
+            previous[key] = point.value
+            if point.check not in shown:
+                continue
+            change = "-" if not before else "{0:+.1f}%".format(
+                (point.value - before) / abs(before) * 100)
+            out.append("{p.check:<24} {p.node:<16} {p.task:<24} "\
+                "{p.value:>14.3f} {change:>9}".format(p=point, change=change))
+        out.append("{count} values from {checks} checkups in "\
+            "{elapsed:.3f}s".format(count=len(out) - 1, checks=len(shown), 
+            elapsed=elapsed))
+        return (0, "\n".join(out))
+
+# ============================================================================
+# 
+
+class BenchmarkCommand(SubCommand):
+    """Run the micro benchmarks."""
+
+    name = "bench"
+    """Command line name for the Sub Command.
+    """
+
+    help = "Run the micro benchmarks."
+    """Command line help for the Sub Command."""
+
+    description = "Run micro benchmarks and print the rate for each. "\
+        "Benchmarks that depend on the amount of data are run on "\
+        "synthetic node data at each of the scales."
+    """Command line description for the Sub Command."""
+
+
+    def __init__(self, args):
+        self.log = logging.getLogger("%s.%s" % (__name__, 
+            "BenchmarkCommand"))
+        self.args = args
+
+    @classmethod
+    def add_arguments(cls, parser):
+        
+        import benchmarks
+        parser.add_argument("benchmarks", nargs="*", metavar="benchmark",
+            help="Benchmarks to run, all are run if not specified. Choose "\
+                "from {names}".format(
+                names=", ".join(sorted(benchmarks.BENCHMARKS))))
+        parser.add_argument("--count", dest="count", type=int, default=1000,
+            help="Number of iterations for each benchmark.")
+        parser.add_argument("--runs", dest="runs", type=int, default=10,
+            help="Number of runs for benchmarks that start processes.")
+        parser.add_argument("--cass-check", dest="cass_check_path", 
+            default=None,
+            help="The cass-check script the startup benchmark times, "\
+                "defaults to the installed one.")
+        parser.add_argument("--scales", dest="scales", 
+            type=benchmarks.parse_scales, default=[1],
+            help="Comma separated multiples of the data size to run the "\
+                "benchmarks at, e.g. 1,4,16.")
+        parser.add_argument("--json", dest="json_path", default=None,
+            help="Also write the results to this JSON file, to compare "\
+                "runs between versions.")
+        return
+        
+    def __call__(self):
+        """Runs the command."""
+        
+        import benchmarks
+        
+        names = self.args.benchmarks or sorted(benchmarks.BENCHMARKS)
+        unknown = set(names) - set(benchmarks.BENCHMARKS)
+        if unknown:
+            return (1, "Unknown benchmarks {unknown}".format(
+                unknown=", ".join(sorted(unknown))))
+        
+        results = []
+        out = []
+        for name in names:
+            self.log.info("Running benchmark {name}".format(name=name))
+            for result in benchmarks.BENCHMARKS[name](self.args):
+                results.append(result)
+                out.append("{result[name]:<30} {scale:>6} "\
+                    "{result[rate]:>12.1f} {result[unit]}".format(
+                    result=result, scale="x{scale}".format(
+                    scale=result["scale"]) if result["scale"] else "-"))
+        
+        if self.args.json_path:
+            self._write_json(self.args.json_path, results)
+            out.append("Results written to {path}".format(
+                path=self.args.json_path))
+        return (0, "\n".join(out))
+    
+    def _write_json(self, path, results):
+        """Write the ``results`` to ``path`` with details of the version 
+        and machine they are from."""
+        
+        # imported here as it is slow and only needed for the version. 
+        import pkg_resources
+        import platform
+        try:
+            version = pkg_resources.get_distribution("cass-check").version
+        except (pkg_resources.DistributionNotFound):
+            version = None
+        data = {
+            "version" : version,
+            "python" : sys.version.split()[0],
+            "platform" : platform.platform(),
+            "host" : platform.node(),
+            "ts" : time.time(),
+            "count" : self.args.count,
+            "runs" : self.args.runs,
+            "scales" : self.args.scales,
+            "results" : results,
+        }
+        file_util.ensure_dir(os.path.dirname(os.path.abspath(path)))
+        with open(path, "wb") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        return
@@ -0,0 +1,210 @@
+"""Discover the entry points advertised by the installed distributions.
+
+Importing :mod:`pkg_resources` scans and parses every installed
+distribution, which is most of the start up time for the ``cass-check``
+script. Entry points are instead read from the ``entry_points.txt`` files
+in the ``.dist-info`` and ``.egg-info`` dirs on ``sys.path`` (or
+:mod:`importlib.metadata` when it is available) and cached on disk. The
+cache is used while the mtimes of the ``sys.path`` dirs and the
+``entry_points.txt`` files have not changed.
+"""
+import errno
+import hashlib
+import json
+import logging
+import os
+import os.path
+import sys
+
+log = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+"""Changed when the format of the cache file changes."""
+
+CACHE_FILE = "entry-points.json"
+
+DIST_EXTENSIONS = (".dist-info", ".egg-info")
+
+def cache_dir():
+    """Returns the dir cass-check caches things in, set with the
+    ``CASS_CHECK_CACHE_DIR`` environment variable."""
+
+    return os.environ.get("CASS_CHECK_CACHE_DIR") or os.path.join(
+        os.path.expanduser("~"), ".cache", "cass-check")
+
+# ============================================================================
+#
+
+class EntryPoint(object):
+    """An advertised entry point, like :class:`pkg_resources.EntryPoint`.
+    """
+
+    def __init__(self, group, name, value):
+        self.group = group
+        self.name = name
+        self.value = value
+
+    def __repr__(self):
+        return "EntryPoint({self.group}, {self.name} = {self.value})".format(
+            self=self)
+
+    def load(self):
+        """Import and return the object the entry point refers to."""
+
+        module_name, _, attrs = self.value.partition(":")
+        obj = __import__(module_name.strip(), fromlist=["__name__"])
+        for attr in attrs.strip().split("."):
+            if attr:
+                obj = getattr(obj, attr)
+        return obj
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+#
+
+_groups = None
+"""Entry points loaded in this process, {group : [(name, value)]}"""
+
+def iter_entry_points(group, name=None):
+    """Yields the :class:`EntryPoint` in ``group``, optionally only those
+    called ``name``. """
+
+    global _groups
+    if _groups is None:
+        _groups = _load_groups()
+
+    for ep_name, value in _groups.get(group, []):
+        if name is None or ep_name == name:
+            yield EntryPoint(group, ep_name, value)
+
+def _load_groups():
+    """Load the entry point groups from the cache, or discover them and
+    update the cache."""
+
+    dist_dirs, key = _fingerprint()
+    cache_path = os.path.join(cache_dir(), CACHE_FILE)
+
+    try:
+        with open(cache_path, "r") as f:
+            cached = json.load(f)
+        if cached.get("key") == key:
+            return cached["groups"]
+        log.debug("Entry point cache {cache_path} is out of date".format(
+            cache_path=cache_path))
+    except (EnvironmentError, ValueError):
+        log.debug("No usable entry point cache in {cache_path}".format(
+            cache_path=cache_path))
+
+    groups = _discover(dist_dirs)
+    try:
+        _write_cache(cache_path, {"key" : key, "groups" : groups})
+    except (EnvironmentError) as e:
+        log.warn("Could not write entry point cache {cache_path}: "\
+            "{e}".format(cache_path=cache_path, e=e))
+    return groups
+
+def _write_cache(cache_path, data):
+    """Atomically write the cache ``data`` to ``cache_path``."""
+
+    try:
+        os.makedirs(os.path.dirname(cache_path))
+    except (EnvironmentError) as e:
+        if e.errno != errno.EEXIST:
+            raise
+    tmp_path = "{cache_path}.tmp.{pid}".format(cache_path=cache_path,
+        pid=os.getpid())
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.rename(tmp_path, cache_path)
+    return
+
+def _fingerprint():
+    """Find the distribution dirs on ``sys.path`` and build a key from the
+    mtimes of the path dirs and entry point files.
+
+    Installing, upgrading or removing a distribution changes the mtime of
+    the dir it is installed in, a develop install re-writes its
+    ``entry_points.txt``.
+
+    Returns a tuple of ([dist_dir], key).
+    """
+
+    dist_dirs = []
+    parts = [str(CACHE_VERSION), sys.version]
+    for path_dir in sys.path:
+        path_dir = os.path.abspath(path_dir or os.curdir)
+        try:
+            parts.append("{0}={1}".format(path_dir,
+                os.stat(path_dir).st_mtime))
+            names = sorted(os.listdir(path_dir))
+        except (EnvironmentError):
+            continue
+
+        for name in names:
+            if not name.endswith(DIST_EXTENSIONS):
+                continue
+            ep_file = os.path.join(path_dir, name, "entry_points.txt")
+            try:
+                parts.append("{0}={1}".format(ep_file,
+                    os.stat(ep_file).st_mtime))
+            except (EnvironmentError):
+                continue
+            dist_dirs.append(os.path.join(path_dir, name))
+
+    return (dist_dirs, hashlib.sha1("\n".join(parts)).hexdigest())
+
+def _discover(dist_dirs):
+    """Discover the entry points from the ``dist_dirs``, or with
+    :mod:`importlib.metadata` if it is available.
+
+    Returns a dict of {group : [(name, value)]}.
+    """
+
+    try:
+        from importlib import metadata
+    except ImportError:
+        metadata = None
+
+    groups = {}
+    seen = set()
+    if metadata is not None:
+        for dist in metadata.distributions():
+            project = dist.metadata["Name"]
+            if project in seen:
+                continue
+            seen.add(project)
+            for ep in dist.entry_points:
+                groups.setdefault(ep.group, []).append((ep.name, ep.value))
+        return groups
+
+    for dist_dir in dist_dirs:
+        # the first distribution on the path wins, like pkg_resources.
+        project = os.path.basename(dist_dir).split("-")[0].lower().replace(
+            "_", "-")
+        if project in seen:
+            continue
+        seen.add(project)
+        with open(os.path.join(dist_dir, "entry_points.txt"), "r") as f:
+            for group, name, value in _parse_entry_points(f):
+                groups.setdefault(group, []).append((name, value))
+    return groups
+
+def _parse_entry_points(lines):
+    """Parse the ini style ``lines`` of an ``entry_points.txt`` file.
+
+    Yields tuples of (group, name, value).
+    """
+
+    group = None
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith(("#", ";")):
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            group = line[1:-1].strip()
+            continue
+        if group is None or "=" not in line:
+            continue
+        name, _, value = line.partition("=")
+        # drop any extras, e.g. "module:attr [extra]"
+        value = value.split("[")[0]
+        yield (group, name.strip(), value.strip())
@@ -1,7 +1,25 @@
 """Utilities for working with files n stuff."""
 
+import contextlib
 import errno
+import fcntl
+import gzip
+import hashlib
+import os
 import os.path
+import shutil
+import zipfile
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
 
 def ensure_dir(path):
     """Ensure the directories for ``path`` exist. 
@@ -14,4 +32,340 @@ def ensure_dir(path):
         if not(e.errno == errno.EEXIST and 
             e.filename == path):
             raise
-    return
\ No newline at end of file
+    return
+
+@contextlib.contextmanager
+def atomic_write(path, mode="w"):
+    """Context manager to write the file at ``path`` atomically. 
+    
+    Yields a file object for a temp file next to ``path`` that is renamed 
+    to ``path`` if the block exits without an error. 
+    """
+    
+    tmp_path = "{path}.tmp.{pid}".format(path=path, pid=os.getpid())
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+        os.rename(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# Streaming compression. 
+
+CHUNK_SIZE = 1024 * 1024
+"""Size of the chunks used when streaming files."""
+
+COMPRESSION_EXTENSIONS = {
+    "none" : "",
+    "gzip" : ".gz",
+    "zstd" : ".zst",
+    "lz4" : ".lz4",
+}
+"""File extensions for the compression codecs we can write."""
+
+def available_codecs():
+    """Returns a list of the compression codecs that can be used, depends 
+    on the optional zstandard and lz4 packages."""
+    
+    codecs = ["none", "gzip"]
+    if zstandard is not None:
+        codecs.append("zstd")
+    if lz4 is not None:
+        codecs.append("lz4")
+    return codecs
+
+def open_compressed(path, codec):
+    """Opens ``path`` for writing compressed with ``codec``.
+    
+    Returns a file like object, closing it closes the underlying file. 
+    """
+    
+    if codec == "none":
+        return open(path, "wb")
+    if codec == "gzip":
+        # level 6 is the gzip command line default, much faster than 9 
+        # for little difference in size.
+        return gzip.GzipFile(path, "wb", compresslevel=6)
+    if codec == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).stream_writer(
+            open(path, "wb"))
+    if codec == "lz4" and lz4 is not None:
+        return lz4.frame.open(path, "wb")
+    raise ValueError("Compression codec {codec} is not available, "\
+        "choose from {codecs}".format(codec=codec, codecs=available_codecs()))
+
+def compress_stream(fileobj, codec):
+    """Returns a file like object that compresses what is written to it
+    with ``codec`` and writes it to ``fileobj``, which may be a pipe.
+
+    Closing the returned object finishes the compressed stream but leaves
+    ``fileobj`` open. Only "none", "gzip" and "zstd" are supported.
+    """
+
+    if codec == "none":
+        return _StreamSink(fileobj, None)
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=6)
+    if codec == "zstd" and zstandard is not None:
+        return _StreamSink(fileobj,
+            zstandard.ZstdCompressor(level=3).compressobj())
+    raise ValueError("Compression codec {codec} cannot be streamed, "\
+        "choose from {codecs}".format(codec=codec,
+        codecs=[c for c in available_codecs() if c != "lz4"]))
+
+class _StreamSink(object):
+    """Write only file like object that passes data through the optional
+    ``compressor``, a ``compressobj()``, to ``fileobj``."""
+
+    def __init__(self, fileobj, compressor):
+        self._fileobj = fileobj
+        self._compressor = compressor
+
+    def write(self, data):
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        if data:
+            self._fileobj.write(data)
+
+    def flush(self):
+        self._fileobj.flush()
+
+    def close(self):
+        if self._compressor is not None:
+            self._fileobj.write(self._compressor.flush())
+            self._compressor = None
+        self._fileobj.flush()
+
+SOURCE_COMPRESSION = [
+    (".gz", "gzip"),
+    (".zip", "zip"),
+    (".zst", "zstd"),
+    (".lz4", "lz4"),
+]
+"""File extensions for the compressed files we can read."""
+
+def source_compression(path):
+    """Returns the compression used by the file at ``path``, based on the 
+    file name. One of "gzip", "zip", "zstd", "lz4" or None. 
+    """
+    
+    for ext, compression in SOURCE_COMPRESSION:
+        if path.endswith(ext):
+            return compression
+    return None
+
+def strip_compression_ext(file_name):
+    """Returns ``file_name`` without a compression extension."""
+    
+    for ext, _ in SOURCE_COMPRESSION:
+        if file_name.endswith(ext):
+            return file_name[:-len(ext)]
+    return file_name
+
+def open_decompressed(path):
+    """Opens ``path`` for reading, decompressing files as they are read so 
+    they are never inflated to disk. 
+    
+    All the members of a zip file are read one after the other. zstd files 
+    only support ``read()``.
+    """
+    
+    compression = source_compression(path)
+    if compression == "gzip":
+        return gzip.GzipFile(path, "rb")
+    if compression == "zip":
+        return _ZipMembersReader(path)
+    if compression == "zstd" and zstandard is not None:
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"))
+    if compression == "lz4" and lz4 is not None:
+        return lz4.frame.open(path, "rb")
+    if compression in ("zstd", "lz4"):
+        raise ValueError("Cannot read {path} as the {compression} module is "\
+            "not installed.".format(path=path, compression=compression))
+    return open(path, "rb")
+
+def copy_gzip(src, dest, chunk_size=CHUNK_SIZE):
+    """Copy the gzip file at ``src`` to ``dest`` as is, inflating the data 
+    as it is copied to count the uncompressed bytes. 
+    
+    The size in the gzip trailer is modulo 2**32 and only for the last 
+    member, so it is wrong for files over 4GB. 
+    
+    Returns the number of uncompressed bytes. 
+    """
+    
+    def inflated(decompressor, data):
+        # Limit the output so a highly compressed chunk is not inflated all
+        # at once. At the end of a member the rest of the data is in 
+        # unused_data, python 2 also leaves it in unconsumed_tail.
+        size = 0
+        while data and not decompressor.unused_data:
+            size += len(decompressor.decompress(data, chunk_size))
+            data = decompressor.unconsumed_tail
+        return size
+    
+    raw_bytes = 0
+    # 16 + MAX_WBITS reads the gzip header and trailer.
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    with open(src, "rb") as src_file:
+        with open(dest, "wb") as dest_file:
+            for chunk in iter(lambda: src_file.read(chunk_size), b""):
+                dest_file.write(chunk)
+                raw_bytes += inflated(decompressor, chunk)
+                # data after the end of a member is the next member, or 
+                # padding. 
+                while decompressor.unused_data.strip(b"\0"):
+                    data = decompressor.unused_data
+                    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                    raw_bytes += inflated(decompressor, data)
+    return raw_bytes
+
+def copy_stream(src, dest, length=None, chunk_size=CHUNK_SIZE):
+    """Copy from the ``src`` file object to ``dest`` in chunks. 
+    
+    If ``length`` is specified at most ``length`` bytes are copied.
+    
+    Returns the number of bytes copied. 
+    """
+    
+    copied = 0
+    while length is None or copied < length:
+        want = chunk_size if length is None else min(chunk_size, 
+            length - copied)
+        chunk = src.read(want)
+        if not chunk:
+            break
+        dest.write(chunk)
+        copied += len(chunk)
+    return copied
+
+class _ZipMembersReader(object):
+    """Read only file like object that streams all the members of a zip 
+    file."""
+    
+    def __init__(self, path):
+        self._zip = zipfile.ZipFile(path, "r")
+        self._members = self._zip.namelist()
+        self._current = None
+    
+    def read(self, size=-1):
+        return self._read_member(lambda member: member.read(size))
+    
+    def readline(self):
+        return self._read_member(lambda member: member.readline())
+    
+    def _read_member(self, func):
+        """Call ``func`` with the current member until it returns data, 
+        moving to the next member when the current one is exhausted."""
+        
+        while True:
+            if self._current is None:
+                if not self._members:
+                    return b""
+                self._current = self._zip.open(self._members.pop(0))
+            data = func(self._current)
+            if data:
+                return data
+            self._current.close()
+            self._current = None
+    
+    def close(self):
+        if self._current is not None:
+            self._current.close()
+        self._zip.close()
+    
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# Staging files without copying them. 
+
+FICLONE = 0x40049409
+"""Linux ioctl to reflink a file on filesystems like btrfs and xfs."""
+
+def file_digest(path, chunk_size=CHUNK_SIZE):
+    """Returns the hex sha1 digest of the contents of the file at ``path``.
+    """
+    
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def stage_file(src, dest):
+    """Make the file at ``src`` available at ``dest`` doing as little IO as
+    possible. 
+    
+    In order of preference ``dest`` is a hard link to ``src`` if they are on
+    the same file system, a reflink (copy on write clone) if the file system
+    supports it, a kernel side copy if the platform supports it, or a copy. 
+    Any existing file at ``dest`` is replaced. 
+    
+    Returns the name of the method used. 
+    """
+    
+    if os.path.lexists(dest):
+        os.remove(dest)
+    
+    try:
+        os.link(src, dest)
+        return "link"
+    except (EnvironmentError):
+        # Not the same filesystem or not supported.
+        pass
+    
+    with open(src, "rb") as src_file:
+        with open(dest, "wb") as dest_file:
+            method = _clone_file(src_file, dest_file)
+    if method is None:
+        shutil.copy2(src, dest)
+        return "copy"
+    shutil.copystat(src, dest)
+    return method
+
+def _clone_file(src_file, dest_file):
+    """Copy ``src_file`` to ``dest_file`` without moving the data through 
+    user space. 
+    
+    Returns the name of the method used, or None if none of them worked and
+    the file should be copied. 
+    """
+    
+    try:
+        fcntl.ioctl(dest_file.fileno(), FICLONE, src_file.fileno())
+        return "reflink"
+    except (EnvironmentError):
+        pass
+    
+    size = os.fstat(src_file.fileno()).st_size
+    for name in ("copy_file_range", "sendfile"):
+        func = getattr(os, name, None)
+        if func is None:
+            continue
+        try:
+            offset = 0
+            while offset < size:
+                if name == "sendfile":
+                    sent = func(dest_file.fileno(), src_file.fileno(), 
+                        offset, size - offset)
+                else:
+                    sent = func(src_file.fileno(), dest_file.fileno(), 
+                        size - offset, offset, offset)
+                if not sent:
+                    break
+                offset += sent
+            if offset == size:
+                return name
+        except (EnvironmentError):
+            pass
+        dest_file.seek(0)
+        dest_file.truncate()
+    return None
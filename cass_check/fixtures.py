@@ -0,0 +1,434 @@
+"""Synthetic Cassandra node data for benchmarks, so they do not need a real
+``/var/log/cassandra`` or ``nodetool``.
+
+The fixtures are generated from a seeded :class:`random.Random` so the same
+arguments always produce the same data, and the lines match what the
+parsers in :mod:`system_log`, :mod:`gc_log` and :mod:`histogram` look for
+so the analysis tasks have events to work on.
+"""
+import datetime
+import gzip
+import logging
+import os
+import os.path
+import pipes
+import random
+import stat
+
+import file_util, task
+
+log = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+START_TIME = datetime.datetime(2012, 11, 27, 10, 0, 0)
+"""Time of the first line in the generated logs."""
+
+KEYSPACES = ["app", "events", "users"]
+TABLES = ["data", "by_user", "by_day", "counters"]
+DROPPED_VERBS = ["MUTATION", "READ", "RANGE_SLICE", "REQUEST_RESPONSE"]
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# Logs
+
+def _system_log_messages(rng):
+    """Yields tuples of (level, thread, source, message) for an endless
+    system.log, mostly flushes and compactions with GC pauses and dropped
+    messages mixed in."""
+
+    generation = 1
+    while True:
+        ks, cf = rng.choice(KEYSPACES), rng.choice(TABLES)
+        sstable = "/var/lib/cassandra/data/{ks}/{cf}/{ks}-{cf}-hf-"\
+            "{generation}-Data.db".format(ks=ks, cf=cf, generation=generation)
+        generation += 1
+        choice = rng.random()
+        if choice < 0.3:
+            yield ("INFO", "OptionalTasks:1", "ColumnFamilyStore.java",
+                "Enqueuing flush of Memtable-{cf}@{id}({size}/{size} "\
+                "serialized/live bytes, {ops} ops)".format(cf=cf,
+                id=rng.randint(1, 2 ** 31), size=rng.randint(1, 64) * MB,
+                ops=rng.randint(100, 100000)))
+            yield ("INFO", "FlushWriter:1", "Memtable.java",
+                "Writing Memtable-{cf}@{id}({size}/{size} serialized/live "\
+                "bytes, {ops} ops)".format(cf=cf, id=rng.randint(1, 2 ** 31),
+                size=rng.randint(1, 64) * MB, ops=rng.randint(100, 100000)))
+            yield ("INFO", "FlushWriter:1", "Memtable.java",
+                "Completed flushing {sstable} ({size} bytes) for commitlog "\
+                "position ReplayPosition(segmentId={segment}, "\
+                "position={position})".format(sstable=sstable,
+                size=rng.randint(4096, 32 * MB),
+                segment=rng.randint(1, 2 ** 40),
+                position=rng.randint(1, 2 ** 25)))
+        elif choice < 0.5:
+            before = rng.randint(MB, 512 * MB)
+            after = int(before * rng.uniform(0.3, 1.0))
+            yield ("INFO", "CompactionExecutor:1", "CompactionTask.java",
+                "Compacting [SSTableReader(path='{sstable}'), "\
+                "SSTableReader(path='{sstable}')]".format(sstable=sstable))
+            yield ("INFO", "CompactionExecutor:1", "CompactionTask.java",
+                "Compacted to [{sstable},].  {before:,} to {after:,} (~{pct}% "\
+                "of original) bytes for {keys:,} keys at {rate:.6f}MB/s.  "\
+                "Time: {ms:,}ms.".format(sstable=sstable, before=before,
+                after=after, pct=after * 100 // before,
+                keys=rng.randint(1, 10 ** 6), rate=rng.uniform(1, 50),
+                ms=rng.randint(10, 10 ** 5)))
+        elif choice < 0.7:
+            collector = rng.choice(["ParNew", "ParNew", "ParNew",
+                "ConcurrentMarkSweep"])
+            yield ("INFO", "ScheduledTasks:1", "GCInspector.java",
+                "GC for {collector}: {ms} ms for {count} collections, "\
+                "{used} used; max is {max}".format(collector=collector,
+                ms=int(rng.expovariate(1 / 200.0)) + 1,
+                count=rng.randint(1, 3), used=rng.randint(MB, 8192 * MB),
+                max=8192 * MB))
+        elif choice < 0.75:
+            yield ("INFO", "ScheduledTasks:1", "MessagingService.java",
+                "{count} {verb} messages dropped in last 5000ms".format(
+                count=rng.randint(1, 5000), verb=rng.choice(DROPPED_VERBS)))
+        elif choice < 0.8:
+            yield ("WARN", "ScheduledTasks:1", "GCInspector.java",
+                "Heap is {pct:.4f} full.  You may need to reduce memtable "\
+                "and/or cache sizes.".format(pct=rng.uniform(0.75, 0.95)))
+        else:
+            yield ("INFO", "ScheduledTasks:1", "StatusLogger.java",
+                "{ks}.{cf}                 {ops},{size}".format(ks=ks, cf=cf,
+                ops=rng.randint(0, 100000), size=rng.randint(0, 64 * MB)))
+
+def write_system_log(path, size, seed=0, start=START_TIME):
+    """Write a ``system.log`` of about ``size`` bytes to ``path``, a path
+    ending in ``.gz`` is compressed.
+
+    Returns the number of lines written.
+    """
+
+    rng = random.Random(seed)
+    ts = start
+    written = lines = 0
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "wb") as f:
+        for level, thread, source, message in _system_log_messages(rng):
+            if written >= size:
+                break
+            ts += datetime.timedelta(milliseconds=rng.randint(1, 2000))
+            line = "{level:>5} [{thread}] {ts:%Y-%m-%d %H:%M:%S},{ms:03d} "\
+                "{source} (line {line_no}) {message}\n".format(level=level,
+                thread=thread, ts=ts, ms=ts.microsecond // 1000,
+                source=source, line_no=rng.randint(50, 500),
+                message=message)
+            f.write(line)
+            written += len(line)
+            lines += 1
+    return lines
+
+def write_gc_log(path, size, seed=0, start=START_TIME, tenuring=False):
+    """Write a Java 8 GC log with ``-XX:+PrintGCDetails`` and
+    ``-XX:+PrintGCApplicationStoppedTime`` of about ``size`` bytes to
+    ``path``. If ``tenuring`` is True ``-XX:+PrintTenuringDistribution`` is
+    also on, which splits each ParNew entry over several lines.
+
+    Returns the number of collections written.
+    """
+
+    rng = random.Random(seed)
+    uptime = 10.0
+    written = collections = 0
+    young_max, heap_max = 471872, 8343552
+    old = 100 * 1024
+    with open(path, "wb") as f:
+        while written < size:
+            uptime += rng.uniform(0.1, 5.0)
+            young_before = rng.randint(young_max // 2, young_max)
+            young_after = rng.randint(1024, young_max // 8)
+            old = min(heap_max - young_max, old + rng.randint(0, 4096))
+            pause = rng.expovariate(1 / 0.02)
+            ts = start + datetime.timedelta(seconds=uptime)
+            stamp = "{ts:%Y-%m-%dT%H:%M:%S}.{ms:03d}+0000: {uptime:.3f}"\
+                .format(ts=ts, ms=ts.microsecond // 1000, uptime=uptime)
+            if tenuring:
+                # cassandra-env.sh sets MaxTenuringThreshold=1.
+                survivors = "\nDesired survivor size 41943040 bytes, new "\
+                    "threshold 1 (max 1)\n- age   1: {size:12d} bytes, "\
+                    "{size:12d} total\n".format(size=young_after * 1024)
+            else:
+                survivors = ""
+            text = "{stamp}: [GC (Allocation Failure) {uptime:.3f}: [ParNew"\
+                "{survivors}: {young_before}K->{young_after}K({young_max}K), "\
+                "{pause:.7f} secs] {heap_before}K->{heap_after}K({heap_max}K), "\
+                "{total:.7f} secs] [Times: user={user:.2f} sys=0.00, "\
+                "real={pause:.2f} secs] \n"\
+                "{stamp}: Total time for which application threads were "\
+                "stopped: {stopped:.7f} seconds, Stopping threads took: "\
+                "0.0000310 seconds\n".format(stamp=stamp, uptime=uptime,
+                survivors=survivors,
+                young_before=young_before, young_after=young_after,
+                young_max=young_max, pause=pause,
+                heap_before=old + young_before, heap_after=old + young_after,
+                heap_max=heap_max, total=pause + 0.0001,
+                user=pause * 4, stopped=pause + 0.0002)
+            f.write(text)
+            written += len(text)
+            collections += 1
+    return collections
+
+def make_log_dir(log_dir, size, seed=0):
+    """Create a Cassandra log dir in ``log_dir`` with about ``size`` bytes
+    of uncompressed logs, split between ``system.log``, a rotated
+    ``system.log.1.gz`` and a GC log.
+
+    Returns the list of paths created.
+    """
+
+    file_util.ensure_dir(log_dir)
+    rotated_start = START_TIME - datetime.timedelta(days=7)
+    paths = [
+        (os.path.join(log_dir, "system.log.1.gz"), size * 3 // 10,
+            write_system_log, rotated_start),
+        (os.path.join(log_dir, "system.log"), size * 5 // 10,
+            write_system_log, START_TIME),
+        (os.path.join(log_dir, "gc-1.log"), size * 2 // 10,
+            write_gc_log, START_TIME),
+    ]
+    for i, (path, file_size, func, start) in enumerate(paths):
+        func(path, file_size, seed=seed + i, start=start)
+    return [path for path, _, _, _ in paths]
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# nodetool
+
+HISTOGRAM_OFFSETS = [1, 2, 3, 4, 5, 6, 7, 8, 10, 12, 14, 17, 20, 24, 29, 35,
+    42, 50, 60, 72, 86, 103, 124, 149, 179, 215, 258, 310, 372, 446, 535, 642,
+    770, 924, 1109, 1331, 1597, 1916, 2299, 2759, 3311, 3973, 4768, 5722,
+    6866, 8239, 9887, 11864, 14237, 17084, 20501, 24601, 29521, 35425, 42510,
+    51012, 61214, 73457, 88148, 105778]
+"""Bucket offsets in micro seconds, like the EstimatedHistogram Cassandra
+uses."""
+
+NODETOOL_OUTPUT = {
+    "info" : """\
+Token            : 85070591730234615865843651857942052864
+Gossip active    : true
+Thrift active    : true
+Load             : 112.34 GB
+Generation No    : 1354010706
+Uptime (seconds) : 1209600
+Heap Memory (MB) : 4096.12 / 8192.00
+Data Center      : datacenter1
+Rack             : rack1
+Exceptions       : 0
+Key Cache        : size 104857584 (bytes), capacity 104857584 (bytes), 92345678 hits, 101234567 requests, 0.912 recent hit rate, 14400 save period in seconds
+Row Cache        : size 0 (bytes), capacity 0 (bytes), 0 hits, 0 requests, NaN recent hit rate, 0 save period in seconds
+""",
+    "ring" : """\
+Address         DC          Rack        Status State   Load            Effective-Ownership Token
+                                                                                           113427455640312821154458202477256070485
+10.0.0.1        datacenter1 rack1       Up     Normal  112.34 GB       33.33%              0
+10.0.0.2        datacenter1 rack1       Up     Normal  109.87 GB       33.33%              56713727820156410577229101238628035242
+10.0.0.3        datacenter1 rack1       Up     Normal  115.02 GB       33.33%              113427455640312821154458202477256070485
+""",
+    "tpstats" : """\
+Pool Name                    Active   Pending      Completed   Blocked  All time blocked
+ReadStage                         0         0      123456789         0                 0
+RequestResponseStage              0         0      234567890         0                 0
+MutationStage                     2         0      345678901         0                 0
+ReadRepairStage                   0         0        1234567         0                 0
+ReplicateOnWriteStage             0         0              0         0                 0
+GossipStage                       0         0        2345678         0                 0
+AntiEntropyStage                  0         0           1234         0                 0
+MigrationStage                    0         0             12         0                 0
+MemtablePostFlusher               0         0          23456         0                 0
+FlushWriter                       0         0          23456         0               123
+MiscStage                         0         0              0         0                 0
+commitlog_archiver                0         0              0         0                 0
+InternalResponseStage             0         0             12         0                 0
+HintedHandoff                     0         0            123         0                 0
+
+Message type           Dropped
+RANGE_SLICE                  0
+READ_REPAIR                  0
+BINARY                       0
+READ                      1234
+MUTATION                 23456
+REQUEST_RESPONSE            12
+""",
+    "compactionstats" : """\
+pending tasks: 3
+          compaction type        keyspace   column family bytes compacted     bytes total  progress
+               Compaction          events          by_day      1234567890      4567890123    27.03%
+Active compaction remaining time :   0h12m34s
+""",
+    "netstats" : """\
+Mode: NORMAL
+Not sending any streams.
+Not receiving any streams.
+Pool Name                    Active   Pending      Completed
+Commands                        n/a         0      123456789
+Responses                       n/a         0      234567890
+""",
+    "gossipinfo" : """\
+/10.0.0.1
+  LOAD:1.2062212E11
+  SCHEMA:59adb24e-f3cd-3e02-97f0-5b395827453f
+  RELEASE_VERSION:1.1.6
+  RPC_ADDRESS:10.0.0.1
+  STATUS:NORMAL,0
+/10.0.0.2
+  LOAD:1.1797012E11
+  SCHEMA:59adb24e-f3cd-3e02-97f0-5b395827453f
+  RELEASE_VERSION:1.1.6
+  RPC_ADDRESS:10.0.0.2
+  STATUS:NORMAL,56713727820156410577229101238628035242
+""",
+}
+"""Canned output for the nodetool commands that describe the node."""
+
+def cfstats_output(keyspaces=KEYSPACES, tables=TABLES):
+    """Returns the ``nodetool cfstats`` output for ``tables`` in each of the
+    ``keyspaces``."""
+
+    lines = []
+    for ks in keyspaces:
+        lines.extend([
+            "Keyspace: {ks}".format(ks=ks),
+            "\tRead Count: 12345678",
+            "\tRead Latency: 0.812 ms.",
+            "\tWrite Count: 23456789",
+            "\tWrite Latency: 0.034 ms.",
+            "\tPending Tasks: 0",
+        ])
+        for cf in tables:
+            lines.extend([
+                "\t\tColumn Family: {cf}".format(cf=cf),
+                "\t\tSSTable count: 12",
+                "\t\tSpace used (live): 12345678901",
+                "\t\tSpace used (total): 12345678901",
+                "\t\tNumber of Keys (estimate): 1234560",
+                "\t\tMemtable Columns Count: 123456",
+                "\t\tMemtable Data Size: 12345678",
+                "\t\tMemtable Switch Count: 123",
+                "\t\tRead Count: 1234567",
+                "\t\tRead Latency: 0.812 ms.",
+                "\t\tWrite Count: 2345678",
+                "\t\tWrite Latency: 0.034 ms.",
+                "\t\tPending Tasks: 0",
+                "\t\tBloom Filter False Positives: 12",
+                "\t\tBloom Filter False Ratio: 0.00012",
+                "\t\tBloom Filter Space Used: 1234560",
+                "\t\tCompacted row minimum size: 150",
+                "\t\tCompacted row maximum size: 25109160",
+                "\t\tCompacted row mean size: 2759",
+                "",
+            ])
+        lines.append("----------------")
+    return "\n".join(lines) + "\n"
+
+def _histogram_weights(mode, spread):
+    """Returns a weight for each of the :data:`HISTOGRAM_OFFSETS` for a log
+    normal like latency distribution peaking at ``mode`` micros."""
+
+    weights = []
+    for offset in HISTOGRAM_OFFSETS:
+        distance = abs(offset - mode) / float(mode * spread)
+        weights.append(max(0, int(1000 / (1 + distance ** 2)) - 10))
+    return weights
+
+NODETOOL_SCRIPT = """\
+#!/bin/sh
+# Fake nodetool generated by cass_check.fixtures, called as
+# nodetool -h <host> <command>
+{record}sleep {delay}
+case "$3" in
+{failing}proxyhistograms)
+    # counts are cumulative, so they grow with time like a real node.
+    n=$(( $(date +%s) % 100000 + 1 ))
+    echo "proxy histograms"
+    printf "%-18s%18s%18s%18s\\n" Offset "Read Latency" "Write Latency" \\
+        "Range Latency"
+{histogram_rows}
+    ;;
+{canned}
+*)
+    echo "Unknown command $3" >&2
+    exit 1
+    ;;
+esac
+"""
+
+def write_fake_nodetool(path, delay=0.0, fail=(), calls_path=None):
+    """Write a shell script to ``path`` that behaves like ``nodetool``
+    for the commands cass-check runs. ``delay`` seconds are slept before
+    each command, a real nodetool takes a few seconds to start the JVM.
+
+    The commands in ``fail`` exit with an error like nodetool does when it
+    cannot connect. If ``calls_path`` is specified each command run is
+    appended to it, one per line.
+
+    Returns ``path``.
+    """
+
+    rows = [
+        "    printf \"%-18d%18d%18d%18d\\\\n\" {offset} $(( n * {read} )) "\
+            "$(( n * {write} )) $(( n * {range} ))".format(offset=offset,
+            read=read, write=write, range=range_)
+        for offset, read, write, range_ in zip(HISTOGRAM_OFFSETS,
+            _histogram_weights(800, 1.0), _histogram_weights(40, 1.5),
+            _histogram_weights(5000, 2.0))
+    ]
+    outputs = dict(NODETOOL_OUTPUT, cfstats=cfstats_output())
+    canned = [
+        "{name})\n    cat <<'EOF'\n{output}EOF\n    ;;".format(name=name,
+            output=output)
+        for name, output in sorted(outputs.iteritems())
+    ]
+
+    file_util.ensure_dir(os.path.dirname(path))
+    record = "echo \"$3\" >> {path}\n".format(
+        path=pipes.quote(calls_path)) if calls_path else ""
+    failing = "{names})\n    echo \"Failed to connect to '$2:7199': "\
+        "Connection refused\" >&2\n    exit 1\n    ;;\n".format(
+        names="|".join(fail)) if fail else ""
+    with open(path, "wb") as f:
+        f.write(NODETOOL_SCRIPT.format(delay=delay, record=record,
+            failing=failing, histogram_rows="\n".join(rows),
+            canned="\n".join(canned)))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP |
+        stat.S_IXOTH)
+    return path
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# Checkups
+
+def make_check_dir(check_root, tasks, files_per_task=5, file_size=64 * 1024,
+    fmt="yaml", command="collect", seed=0):
+    """Create the output of ``command`` for a checkup in ``check_root``
+    with ``tasks`` tasks that each have ``files_per_task`` system log files
+    of ``file_size`` bytes, and the manifest, so it can be reported on.
+
+    Returns the list of :class:`task.TaskReceipt`.
+    """
+
+    cmd_dir = os.path.join(check_root, command)
+    receipts = []
+    for i in xrange(tasks):
+        name = "{command}-task-{i}".format(command=command, i=i)
+        task_dir = os.path.join(cmd_dir, name)
+        file_util.ensure_dir(task_dir)
+        for j in xrange(files_per_task):
+            write_system_log(os.path.join(task_dir,
+                "system.log.{j}".format(j=j)), file_size,
+                seed=seed + i * files_per_task + j)
+
+        receipt = task.TaskReceipt(name, task_dir, fmt=fmt)
+        receipt.stats = {
+            "raw_bytes" : files_per_task * file_size,
+            "stored_bytes" : files_per_task * file_size,
+        }
+        receipt.perf = {
+            "wall_time" : 1.0,
+            "cpu_time" : 0.5,
+        }
+        receipt.write()
+        receipts.append(receipt)
+
+    task.ReceiptManifest.write(cmd_dir, receipts, fmt=fmt)
+    return receipts
@@ -0,0 +1,410 @@
+"""Parse JVM garbage collection logs and summarise the pauses.
+
+Supports the logs written by Java 8 with ``-XX:+PrintGCDetails`` and
+``-XX:+PrintGCApplicationStoppedTime``, as set in ``cassandra-env.sh``, and
+the unified logging used by Java 9 and later.
+
+Logs are read a block at a time and each regex is run over the whole block
+with ``findall``. The matches are converted to columns of numbers in one go
+and the metrics are computed over the columns, using NumPy when it is
+installed and the :mod:`array` module when it is not.
+"""
+import array
+import calendar
+import itertools
+import math
+import os.path
+import re
+import time
+
+import file_util, system_log
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+STOPPED_RE = re.compile(r"(\d+\.\d+)(?:: |s\]\S* )Total time for which "\
+    r"application threads were stopped: (\d+\.\d+) seconds")
+"""Safepoint pauses, (uptime secs, pause secs)."""
+
+TENURING_RE = r"(?:\nDesired survivor[^\n]*(?:\n- age[^\n]*)*\n)?"
+"""The lines ``-XX:+PrintTenuringDistribution`` adds in the middle of a young
+collection, before the young gen for the parallel collector and after it
+for ParNew."""
+
+YOUNG_RE = re.compile(r"(\d+\.\d+): \[GC[^\n]*?" + TENURING_RE + \
+    r"\[(?:ParNew|PSYoungGen|DefNew)" + TENURING_RE + \
+    r"[^\]:\n]*: (\d+)K->(\d+)K\(\d+K\)[^\]\n]*\] (\d+)K->(\d+)K\(\d+K\), "\
+    r"(\d+\.\d+) secs\]")
+"""Java 8 young collections, (uptime secs, young before KB, young after KB,
+heap before KB, heap after KB, pause secs)."""
+
+CONTINUATION_LINES = ("Desired survivor", "- age", ": ", "[PSYoungGen")
+"""Starts of the lines that carry on a young collection from the line
+before when the tenuring distribution is printed."""
+
+UNIFIED_YOUNG_RE = re.compile(r"\[(\d+\.\d+)s\][^\n]*?GC\(\d+\) Pause Young"\
+    r"[^\n]*? (\d+)([KMG])->(\d+)([KMG])\(\d+[KMG]\) (\d+\.\d+)ms")
+"""Java 9+ young collections, (uptime secs, heap before, unit, heap after,
+unit, pause ms)."""
+
+DATESTAMP_RE = re.compile(r"(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)\.(\d{3})"\
+    r"([+-]\d{4})\]?(?:: |\[)(\d+\.\d+)")
+"""A date stamp followed by the JVM uptime, used to convert uptimes to
+epoch times."""
+
+UNIT_KB = {"K" : 1.0, "M" : 1024.0, "G" : 1024.0 * 1024}
+
+COLLECTION_COLUMNS = ["uptime", "young_before_kb", "young_after_kb",
+    "heap_before_kb", "heap_after_kb", "pause_s"]
+"""Columns for each young collection, young sizes are NaN when the log
+does not include them."""
+
+STOPPED_COLUMNS = ["uptime", "pause_s"]
+
+PERCENTILES = [("p50", 50), ("p99", 99), ("p999", 99.9)]
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# Columns, NumPy arrays when available otherwise array.array("d").
+
+def backend():
+    """Returns the name of the library used for the columns."""
+
+    return "array" if numpy is None else "numpy"
+
+def _empty():
+    return array.array("d") if numpy is None else numpy.zeros(0)
+
+def _to_columns(matches, count):
+    """Convert the tuples of numeric strings from ``findall`` into a list
+    of ``count`` columns."""
+
+    if not matches:
+        return [_empty() for _ in xrange(count)]
+    if numpy is not None:
+        return list(numpy.array(matches, dtype=numpy.float64).T)
+    return [array.array("d", map(float, col)) for col in zip(*matches)]
+
+def _scale(values, factors):
+    """Multiply the column ``values`` by the list of ``factors``."""
+
+    if numpy is not None:
+        return values * numpy.array(factors, dtype=numpy.float64)
+    return array.array("d", (v * f for v, f in itertools.izip(values,
+        factors)))
+
+def _shift(values, delta):
+    """Add ``delta`` to the column ``values``."""
+
+    if numpy is not None:
+        return values + delta
+    return array.array("d", (v + delta for v in values))
+
+def _concat(chunks):
+    if numpy is not None:
+        return numpy.concatenate(chunks) if chunks else _empty()
+    out = array.array("d")
+    for chunk in chunks:
+        out.extend(chunk)
+    return out
+
+def _total(values):
+    return float(values.sum()) if numpy is not None else math.fsum(values)
+
+def _min(values):
+    return float(values.min()) if numpy is not None else min(values)
+
+def _max(values):
+    return float(values.max()) if numpy is not None else max(values)
+
+def _positive_total(values):
+    """Total of the values greater than zero, NaN is ignored."""
+
+    if numpy is not None:
+        return float(values[values > 0].sum())
+    return math.fsum(v for v in values if v > 0)
+
+def _allocated(heap_before, heap_after):
+    """Returns the KB allocated between the collections, which is the heap
+    growth from the end of one collection to the start of the next."""
+
+    if numpy is not None:
+        growth = heap_before[1:] - heap_after[:-1]
+    else:
+        growth = array.array("d", (b - a
+            for b, a in itertools.izip(heap_before[1:], heap_after)))
+    return _positive_total(growth)
+
+def _promoted(young_before, young_after, heap_before, heap_after):
+    """Returns the KB promoted by the collections, which is what was freed
+    from the young gen but not from the heap. None if the young gen sizes
+    are not known."""
+
+    if numpy is not None:
+        if numpy.isnan(young_before).all():
+            return None
+        promoted = (young_before - young_after) - (heap_before - heap_after)
+    else:
+        if all(math.isnan(v) for v in young_before):
+            return None
+        promoted = array.array("d", (yb - ya - (hb - ha)
+            for yb, ya, hb, ha in itertools.izip(young_before, young_after,
+            heap_before, heap_after)))
+    return _positive_total(promoted)
+
+def _percentiles(values, qs):
+    """Returns the list of percentiles ``qs`` of ``values``, interpolated
+    the same way as ``numpy.percentile``."""
+
+    if not len(values):
+        return [None] * len(qs)
+    if numpy is not None:
+        return [float(v) for v in numpy.percentile(values, qs)]
+
+    ordered = sorted(values)
+    last = len(ordered) - 1
+    result = []
+    for q in qs:
+        pos = last * q / 100.0
+        lo = int(math.floor(pos))
+        hi = min(lo + 1, last)
+        result.append(ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo))
+    return result
+
+def _window_totals(times, pauses, window_secs):
+    """Total the ``pauses`` in each window of ``window_secs`` by their
+    ``times``.
+
+    Returns a dict of {window start : (pause total, pause count)}.
+    """
+
+    if not len(times):
+        return {}
+    if numpy is not None:
+        windows = numpy.floor(times / window_secs)
+        starts, inverse = numpy.unique(windows, return_inverse=True)
+        totals = numpy.bincount(inverse, weights=pauses)
+        counts = numpy.bincount(inverse)
+        return dict(
+            (float(start) * window_secs, (float(total), int(count)))
+            for start, total, count in itertools.izip(starts, totals, counts)
+        )
+
+    result = {}
+    for t, pause in itertools.izip(times, pauses):
+        start = math.floor(t / window_secs) * window_secs
+        total, count = result.get(start, (0.0, 0))
+        result[start] = (total + pause, count + 1)
+    return result
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# Parsing
+
+def datestamp_epoch(datestamp, millis, tz_offset):
+    """Convert a GC log date stamp like ``2017-05-01T10:00:00``, the
+    milliseconds and the ``+0000`` time zone offset to an epoch time."""
+
+    epoch = calendar.timegm(time.strptime(datestamp, "%Y-%m-%dT%H:%M:%S"))
+    sign = -1 if tz_offset[0] == "-" else 1
+    offset = sign * (int(tz_offset[1:3]) * 3600 + int(tz_offset[3:5]) * 60)
+    return epoch + int(millis) / 1000.0 - offset
+
+def parse_text(text):
+    """Parse a block of GC log ``text``.
+
+    Returns a dict with ``collections`` and ``stopped`` lists of columns and
+    the ``epoch_offset`` to add to an uptime to get the epoch time, which is
+    None if the block has no date stamps.
+    """
+
+    stopped = _to_columns(STOPPED_RE.findall(text), len(STOPPED_COLUMNS))
+
+    young = _to_columns(YOUNG_RE.findall(text), len(COLLECTION_COLUMNS))
+    unified = UNIFIED_YOUNG_RE.findall(text)
+    if unified:
+        uptime, before, after, pause_ms = _to_columns(
+            [(m[0], m[1], m[3], m[5]) for m in unified], 4)
+        unknown = [float("nan")] * len(unified)
+        unified_young = [
+            uptime,
+            _scale(uptime, unknown),
+            _scale(uptime, unknown),
+            _scale(before, [UNIT_KB[m[2]] for m in unified]),
+            _scale(after, [UNIT_KB[m[4]] for m in unified]),
+            _scale(pause_ms, [0.001] * len(unified)),
+        ]
+        young = [
+            _concat([a, b])
+            for a, b in itertools.izip(young, unified_young)
+        ]
+
+    match = DATESTAMP_RE.search(text)
+    epoch_offset = None
+    if match:
+        datestamp, millis, tz_offset, uptime = match.groups()
+        epoch_offset = datestamp_epoch(datestamp, millis, tz_offset) - \
+            float(uptime)
+    return {
+        "collections" : young,
+        "stopped" : stopped,
+        "epoch_offset" : epoch_offset,
+    }
+
+def _entry_blocks(reader, chunk_size):
+    """Yields blocks of about ``chunk_size`` read from the file like 
+    ``reader`` that end where a log entry ends, so a young collection split
+    over several lines by the tenuring distribution is not split between 
+    blocks."""
+
+    pending = ""
+    for _, text in system_log.iter_stream_chunks(reader, chunk_size):
+        text = pending + text
+        start = text.rfind("\n", 0, len(text) - 1)
+        while start != -1 and text.startswith(CONTINUATION_LINES, start + 1):
+            start = text.rfind("\n", 0, start)
+        pending = text[start + 1:]
+        if start != -1:
+            yield text[:start + 1]
+    if pending:
+        yield pending
+
+def parse_file(path, chunk_size=8 * 1024 * 1024, file_name=None):
+    """Parse the GC log at ``path``, which may be compressed, a block of
+    about ``chunk_size`` bytes at a time.
+
+    Returns a dict like :func:`parse_text` for the whole file, with the
+    ``file`` name, which defaults to the base name of ``path``.
+    """
+
+    collections = []
+    stopped = []
+    epoch_offset = None
+    with file_util.open_decompressed(path) as reader:
+        for text in _entry_blocks(reader, chunk_size):
+            parsed = parse_text(text)
+            collections.append(parsed["collections"])
+            stopped.append(parsed["stopped"])
+            if epoch_offset is None:
+                epoch_offset = parsed["epoch_offset"]
+
+    return {
+        "file" : file_name or os.path.basename(path),
+        "collections" : [
+            _concat(list(chunks))
+            for chunks in itertools.izip(*collections)
+        ] or _to_columns([], len(COLLECTION_COLUMNS)),
+        "stopped" : [
+            _concat(list(chunks))
+            for chunks in itertools.izip(*stopped)
+        ] or _to_columns([], len(STOPPED_COLUMNS)),
+        "epoch_offset" : epoch_offset,
+    }
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# Metrics
+
+def pause_times(parsed):
+    """Returns a tuple of (times, pause seconds) for the parsed file.
+
+    Safepoint pauses are used when the log has them as they include all
+    the stop the world time, otherwise the young collection pauses are.
+    Times are epoch times if the log has date stamps, otherwise uptimes.
+    """
+
+    uptime, pauses = parsed["stopped"]
+    if not len(uptime):
+        uptime = parsed["collections"][0]
+        pauses = parsed["collections"][-1]
+    return (_shift(uptime, parsed["epoch_offset"] or 0.0), pauses)
+
+def summarise(parsed_files, window_secs=60, worst=10):
+    """Compute the GC metrics for the ``parsed_files`` from
+    :func:`parse_file`.
+
+    Returns a dict of the metrics, including the ``worst`` windows of
+    ``window_secs`` by total stop the world time.
+    """
+
+    all_pauses = []
+    elapsed = 0.0
+    allocated_kb = 0.0
+    promoted_kb = 0.0
+    promotion_known = False
+    windows = []
+    collections = 0
+
+    for parsed in parsed_files:
+        uptime, young_before, young_after, heap_before, heap_after, _ = \
+            parsed["collections"]
+        collections += len(uptime)
+        stopped_uptime = parsed["stopped"][0]
+
+        # Time covered by this log, uptimes restart with each JVM so they
+        # are not compared across files.
+        ends = [
+            (_min(col), _max(col))
+            for col in (uptime, stopped_uptime)
+            if len(col)
+        ]
+        if ends:
+            elapsed += max(e for _, e in ends) - min(s for s, _ in ends)
+
+        allocated_kb += _allocated(heap_before, heap_after)
+        promoted = _promoted(young_before, young_after, heap_before,
+            heap_after)
+        if promoted is not None:
+            promotion_known = True
+            promoted_kb += promoted
+
+        times, pauses = pause_times(parsed)
+        all_pauses.append(pauses)
+        for start, (total, count) in _window_totals(times, pauses,
+            window_secs).iteritems():
+            windows.append((total, count, start, parsed))
+
+    pauses = _concat(all_pauses)
+    total_pause = _total(pauses)
+    pcts = _percentiles(pauses, [q for _, q in PERCENTILES])
+
+    summary = {
+        "backend" : backend(),
+        "files_parsed" : len(parsed_files),
+        "collections" : collections,
+        "pauses" : len(pauses),
+        "pause_total_s" : round(total_pause, 6),
+        "pause_max_ms" : round(_max(pauses) * 1000, 3) \
+            if len(pauses) else None,
+        "elapsed_s" : round(elapsed, 3),
+    }
+    for (name, _), value in itertools.izip(PERCENTILES, pcts):
+        summary["pause_{name}_ms".format(name=name)] = None if value is None \
+            else round(value * 1000, 3)
+
+    if elapsed:
+        summary["gc_throughput_pct"] = round(
+            100.0 * (1 - total_pause / elapsed), 4)
+        summary["allocation_mb_per_s"] = round(
+            allocated_kb / 1024 / elapsed, 3)
+        summary["promotion_mb_per_s"] = round(
+            promoted_kb / 1024 / elapsed, 3) if promotion_known else None
+        summary["stw_ms_per_minute"] = round(
+            total_pause * 1000 / (elapsed / 60.0), 3)
+
+    windows.sort(key=lambda w: w[0], reverse=True)
+    summary["worst_windows"] = [
+        {
+            "start" : _describe_time(start, parsed),
+            "stw_ms" : round(total * 1000, 3),
+            "pauses" : count,
+        }
+        for total, count, start, parsed in windows[:worst]
+    ]
+    return summary
+
+def _describe_time(t, parsed):
+    """Describe the time ``t`` from :func:`pause_times` for ``parsed``."""
+
+    if parsed["epoch_offset"] is None:
+        return "{file} uptime {t:.0f}s".format(file=parsed["file"], t=t)
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(t))
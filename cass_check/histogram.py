@@ -0,0 +1,292 @@
+"""Bucketed latency histograms like those output by ``nodetool``.
+
+A histogram is a fixed list of bucket offsets and the count of values in
+each bucket, where a value is counted in the first bucket whose offset is
+greater than or equal to it. This is how Cassandra's ``EstimatedHistogram``
+works. Histograms with the same offsets are merged by adding the counts, so
+snapshots from different times or nodes can be combined without going back
+to the text output.
+"""
+import array
+import collections
+import re
+
+import columnar
+
+HISTOGRAM_COLUMNS = [
+    ("ts", "d"),
+    ("node", columnar.STRING),
+    ("name", columnar.STRING),
+    ("offset", "d"),
+    ("count", "d"),
+]
+"""Columns for a table of histograms, one row per bucket. ts is the epoch
+time of the snapshot."""
+
+PERCENTILES = [("p50", 50), ("p95", 95), ("p99", 99)]
+"""Percentiles to summarise histograms with."""
+
+# ============================================================================
+#
+
+class BucketHistogram(object):
+    """Counts of values in buckets with the upper bounds in ``offsets``.
+
+    The counts are stored as doubles in an :class:`array.array` which is
+    exact for counts up to 2**53.
+    """
+
+    def __init__(self, offsets, counts=None):
+        self.offsets = array.array("d", offsets)
+        self.counts = array.array("d", counts) if counts is not None \
+            else array.array("d", [0]) * len(self.offsets)
+        if len(self.offsets) != len(self.counts):
+            raise ValueError("Histogram has {offsets} offsets and {counts} "\
+                "counts".format(offsets=len(self.offsets),
+                counts=len(self.counts)))
+
+    def __repr__(self):
+        return "BucketHistogram(count={count})".format(count=self.count)
+
+    def _check_offsets(self, other):
+        if self.offsets != other.offsets:
+            raise ValueError("Cannot combine histograms with different "\
+                "bucket offsets.")
+        return
+
+    def __add__(self, other):
+        """Merge two histograms by adding the counts."""
+
+        self._check_offsets(other)
+        return BucketHistogram(self.offsets, (a + b
+            for a, b in zip(self.counts, other.counts)))
+
+    def __sub__(self, other):
+        """Returns the histogram of the values added since ``other``, an
+        earlier snapshot of a cumulative histogram.
+
+        If any bucket went down the histogram was reset since ``other``, in
+        which case this histogram is returned as is.
+        """
+
+        self._check_offsets(other)
+        if any(a < b for a, b in zip(self.counts, other.counts)):
+            return BucketHistogram(self.offsets, self.counts)
+        return BucketHistogram(self.offsets, (a - b
+            for a, b in zip(self.counts, other.counts)))
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    @property
+    def max(self):
+        """Offset of the highest bucket with a value, or None."""
+
+        for offset, count in zip(reversed(self.offsets),
+            reversed(self.counts)):
+            if count:
+                return offset
+        return None
+
+    @property
+    def mean(self):
+        """Mean of the values, using the bucket offsets."""
+
+        total = self.count
+        if not total:
+            return None
+        return sum(o * c for o, c in zip(self.offsets, self.counts)) / total
+
+    def percentile(self, q):
+        """Returns the offset of the bucket the ``q`` percentile falls in,
+        calculated like ``EstimatedHistogram.percentile()``. None if the
+        histogram is empty.
+        """
+
+        total = self.count
+        if not total:
+            return None
+        target = int(total * q / 100.0)
+        seen = 0
+        for offset, count in zip(self.offsets, self.counts):
+            seen += count
+            if count and seen >= target:
+                return offset
+        return self.offsets[-1]
+
+    def summary(self):
+        """Returns a dict with the count, mean, max and percentiles."""
+
+        result = {
+            "count" : int(self.count),
+            "mean" : None if self.mean is None else round(self.mean, 3),
+            "max" : self.max,
+        }
+        for name, q in PERCENTILES:
+            result[name] = self.percentile(q)
+        return result
+
+# ============================================================================
+#
+
+class SnapshotBuffer(object):
+    """A fixed size ring buffer of histogram snapshots that is flushed to a
+    :class:`columnar.Table` in batches.
+
+    At most ``capacity`` snapshots are held in memory, when the buffer is
+    full the snapshots are appended to ``table`` before the new one is
+    added.
+    """
+
+    def __init__(self, table, capacity, node):
+        if capacity < 1:
+            raise ValueError("Buffer capacity must be at least 1")
+        self.table = table
+        self.capacity = capacity
+        self.node = node
+        self._slots = [None] * capacity
+        self._head = 0
+        self._size = 0
+        self.flushes = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, ts, histograms):
+        """Add the {name : histogram} snapshot taken at ``ts``, flushing the
+        buffer first if it is full."""
+
+        if self._size == self.capacity:
+            self.flush()
+        self._slots[(self._head + self._size) % self.capacity] = (ts,
+            histograms)
+        self._size += 1
+        return
+
+    def flush(self):
+        """Append the buffered snapshots to the table, oldest first.
+
+        Returns the number of snapshots flushed.
+        """
+
+        flushed = self._size
+        data = None
+        for i in xrange(self._size):
+            slot = (self._head + i) % self.capacity
+            ts, histograms = self._slots[slot]
+            self._slots[slot] = None
+            data = _histogram_rows(ts, self.node, histograms, data)
+        if data is not None:
+            self.table.append(data)
+            self.flushes += 1
+        self._head = (self._head + self._size) % self.capacity
+        self._size = 0
+        return flushed
+
+def merge_all(histograms):
+    """Returns the sum of the ``histograms``, or None if there are none."""
+
+    result = None
+    for h in histograms:
+        result = h if result is None else result + h
+    return result
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# nodetool output
+
+def parse_nodetool(text):
+    """Parse the table of offsets and counts output by the ``nodetool``
+    histogram commands like::
+
+        proxy histograms
+        Offset          Read Latency     Write Latency      Range Latency
+        1                          0                 0                  0
+        2                          0                 0                  0
+
+    Returns a dict of {name : :class:`BucketHistogram`} where the name is the
+    column heading in lower case without " Latency", e.g. "read".
+    """
+
+    names = None
+    offsets = []
+    rows = []
+    for line in text.splitlines():
+        if names is None:
+            if line.strip().startswith("Offset"):
+                names = [
+                    re.sub(r"\s*latency$", "", heading.strip().lower())
+                    for heading in re.split(r"\s{2,}", line.strip())[1:]
+                ]
+            continue
+        fields = line.split()
+        if not fields:
+            continue
+        if len(fields) != len(names) + 1:
+            raise ValueError("Unexpected histogram line {line!r}".format(
+                line=line))
+        offsets.append(float(fields[0]))
+        rows.append([float(f) for f in fields[1:]])
+
+    if names is None:
+        raise ValueError("No Offset table found in the histogram output.")
+    return collections.OrderedDict(
+        (name, BucketHistogram(offsets, [row[i] for row in rows]))
+        for i, name in enumerate(names)
+    )
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# Storage
+
+def append_histograms(table, ts, node, histograms):
+    """Append the {name : histogram} dict ``histograms`` for the ``node``
+    taken at ``ts`` to the :class:`columnar.Table` ``table``.
+
+    Returns the number of rows appended.
+    """
+
+    return table.append(_histogram_rows(ts, node, histograms))
+
+def _histogram_rows(ts, node, histograms, data=None):
+    """Add the rows for the ``histograms`` to the columns in ``data``, which
+    is created if None.
+
+    Returns ``data``.
+    """
+
+    if data is None:
+        data = dict((name, []) for name, _ in HISTOGRAM_COLUMNS)
+    for name, h in histograms.iteritems():
+        rows = len(h.offsets)
+        data["ts"].extend([ts] * rows)
+        data["node"].extend([node] * rows)
+        data["name"].extend([name] * rows)
+        data["offset"].extend(h.offsets)
+        data["count"].extend(h.counts)
+    return data
+
+def load_histograms(table):
+    """Load the histograms from the :class:`columnar.Table` ``table``.
+
+    Returns an ordered dict of {(ts, node) : {name : histogram}} in the order
+    the histograms were appended.
+    """
+
+    ts = table.read("ts")
+    offsets = table.read("offset")
+    counts = table.read("count")
+    nodes, node_values = table.read("node"), table.strings("node")
+    names, name_values = table.read("name"), table.strings("name")
+
+    result = collections.OrderedDict()
+    start = 0
+    for i in xrange(1, len(ts) + 1):
+        if i < len(ts) and (ts[i], nodes[i], names[i]) == \
+            (ts[start], nodes[start], names[start]):
+            continue
+        key = (ts[start], node_values[nodes[start]])
+        result.setdefault(key, collections.OrderedDict())[
+            name_values[names[start]]] = BucketHistogram(offsets[start:i],
+            counts[start:i])
+        start = i
+    return result
@@ -0,0 +1,190 @@
+"""History of the metrics from every checkup, to see trends between them.
+
+The history is a :class:`columnar.Table` in ``<output-base>/history`` with
+one row for each checkup, node, task and metric. Rows are only appended, a
+lock file stops checkups that finish at the same time from interleaving
+their appends. Reading a trend memory maps the metric column to find the
+rows for the metric and only reads the other columns for those rows.
+
+Metrics are the numbers in the task receipt stats, nested dicts are
+flattened with dotted names, for example ``write_latency_us.p99``.
+"""
+import collections
+import contextlib
+import fcntl
+import itertools
+import logging
+import numbers
+import os.path
+import time
+
+import file_util
+
+log = logging.getLogger(__name__)
+
+# columnar is imported by the functions that read and write the history, it
+# loads numpy and the options are added for every command. 
+
+STRING = "s"
+"""Same as :data:`columnar.STRING`."""
+
+HISTORY_COLUMNS = [
+    ("check", STRING),
+    ("ts", "d"),
+    ("node", STRING),
+    ("task", STRING),
+    ("metric", STRING),
+    ("value", "d"),
+]
+
+LOCAL_NODE = "local"
+"""Node name used for tasks that ran on this machine."""
+
+def add_arguments(parser):
+    """Add the history options to ``parser``."""
+
+    parser.add_argument("--history-dir", dest="history_dir", default=None,
+        help="Dir of the metric history, default is history in the "\
+            "output base.")
+    parser.add_argument("--no-history", dest="no_history", default=False,
+        action="store_true",
+        help="Do not add the metrics from this checkup to the history.")
+    return
+
+def history_dir(args):
+    """Returns the history dir for the command line ``args``."""
+
+    return getattr(args, "history_dir", None) or os.path.join(
+        args.output_base, "history")
+
+def flatten_stats(stats, prefix=""):
+    """Yields (name, value) for the numbers in the ``stats`` dict, nested
+    dicts are flattened using dotted names."""
+
+    for key in sorted(stats):
+        value = stats[key]
+        name = "{prefix}{key}".format(prefix=prefix, key=key)
+        if isinstance(value, dict):
+            for item in flatten_stats(value, name + "."):
+                yield item
+        elif isinstance(value, numbers.Real) and \
+            not isinstance(value, bool):
+            yield (name, float(value))
+
+@contextlib.contextmanager
+def _locked(path):
+    """Hold an exclusive lock on the history in ``path``."""
+
+    file_util.ensure_dir(path)
+    with open(os.path.join(path, ".lock"), "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def record(path, check, receipts, ts=None):
+    """Append the metrics from the ``receipts`` for the checkup named
+    ``check`` to the history in ``path``.
+
+    Returns the number of rows added.
+    """
+
+    import columnar
+
+    ts = time.time() if ts is None else ts
+    data = dict((name, []) for name, _ in HISTORY_COLUMNS)
+    for receipt in receipts:
+        if receipt.error:
+            continue
+        for metric, value in flatten_stats(receipt.stats or {}):
+            data["check"].append(check)
+            data["ts"].append(ts)
+            data["node"].append(receipt.node or LOCAL_NODE)
+            data["task"].append(receipt.name)
+            data["metric"].append(metric)
+            data["value"].append(value)
+
+    with _locked(path):
+        rows = columnar.Table(path, HISTORY_COLUMNS).append(data)
+    log.debug("Added {rows} rows for {check} to the history in "\
+        "{path}".format(rows=rows, check=check, path=path))
+    return rows
+
+def metrics(path):
+    """Returns the sorted list of metric names in the history in ``path``,
+    read from the table header only."""
+
+    import columnar
+
+    if not os.path.exists(os.path.join(path, columnar.HEADER_FILE)):
+        return []
+    return sorted(set(columnar.Table(path).strings("metric")))
+
+def _matching_rows(table, column, value, rows=None):
+    """Returns the row numbers where the string ``column`` is ``value``,
+    only checking ``rows`` if specified."""
+
+    import columnar
+
+    try:
+        code = table.strings(column).index(value)
+    except (ValueError):
+        return []
+    codes = table.map(column)
+    if columnar.numpy is not None:
+        if rows is None:
+            return columnar.numpy.flatnonzero(codes == code)
+        return rows[codes[rows] == code]
+    if rows is None:
+        return [i for i, c in enumerate(codes) if c == code]
+    return [i for i in rows if codes[i] == code]
+
+def _take(values, rows):
+    """Returns the ``values`` at the ``rows``."""
+
+    import columnar
+
+    if columnar.numpy is not None:
+        return values[rows].tolist()
+    return [values[i] for i in rows]
+
+TrendPoint = collections.namedtuple("TrendPoint",
+    ["check", "ts", "node", "task", "value"])
+
+def trend(path, metric, task=None, node=None):
+    """Returns the list of :class:`TrendPoint` for ``metric`` in the
+    history in ``path``, oldest first, optionally only for one ``task`` or
+    ``node``.
+
+    If a checkup recorded the metric more than once, for example the analyse
+    command ran again, the last value is used.
+    """
+
+    import columnar
+
+    if not os.path.exists(os.path.join(path, columnar.HEADER_FILE)):
+        return []
+    table = columnar.Table(path)
+    rows = _matching_rows(table, "metric", metric)
+    for column, value in (("task", task), ("node", node)):
+        if value and len(rows):
+            rows = _matching_rows(table, column, value, rows)
+    if not len(rows):
+        return []
+
+    columns = [
+        _take(table.map(name), rows)
+        for name in TrendPoint._fields
+    ]
+    for i, name in enumerate(TrendPoint._fields):
+        if dict(HISTORY_COLUMNS)[name] == STRING:
+            strings = table.strings(name)
+            columns[i] = [strings[code] for code in columns[i]]
+
+    latest = collections.OrderedDict()
+    for point in itertools.imap(TrendPoint, *columns):
+        key = (point.check, point.node, point.task)
+        latest.pop(key, None)
+        latest[key] = point
+    return sorted(latest.values(), key=lambda p: p.ts)
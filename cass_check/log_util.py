@@ -0,0 +1,202 @@
+"""Utilities for working with Cassandra log files.
+
+Both the ``system.log`` and the GC logs (when ``-XX:+PrintGCDateStamps`` is
+used) start each entry with a timestamp, the entries are in time order which
+lets us find a time window in a log by bisecting the byte offsets.
+"""
+import datetime
+import os
+import re
+import time
+
+TIMESTAMP_RE = re.compile(r"(\d{4}-\d{2}-\d{2})[ T](\d{2}:\d{2}:\d{2})")
+"""Matches the date and time in a log line, to the second.
+
+Matches ``system.log`` lines like::
+
+     INFO [main] 2012-11-27 10:05:06,123 CassandraDaemon.java (line 101) ...
+
+and GC log lines like::
+
+    2012-11-27T10:05:06.123+1300: 12.345: [GC ...
+"""
+
+TIMESTAMP_SEARCH_LEN = 128
+"""Only the start of a line is searched for the timestamp."""
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+"""Format of the timestamp keys we compare."""
+
+SCAN_SIZE = 64 * 1024
+"""Once a bisection has narrowed to this many bytes the lines are scanned."""
+
+RELATIVE_RE = re.compile(r"^(\d+)([smhd])$")
+RELATIVE_UNITS = {
+    "s" : "seconds",
+    "m" : "minutes",
+    "h" : "hours",
+    "d" : "days",
+}
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# Timestamps
+
+def line_timestamp(line):
+    """Returns the timestamp key for the log ``line`` or None if the line
+    does not start with a timestamp, e.g. it is part of a stack trace.
+
+    The key is a string in :attr:`TIMESTAMP_FORMAT` that sorts in time
+    order.
+    """
+
+    match = TIMESTAMP_RE.search(line, 0, TIMESTAMP_SEARCH_LEN)
+    if match is None:
+        return None
+    return "{0} {1}".format(*match.groups())
+
+def parse_time_arg(value, now=None):
+    """Parse a ``--since`` or ``--until`` command line ``value`` into a
+    timestamp key.
+
+    ``value`` is either relative to ``now`` such as ``30m``, ``2h`` or
+    ``1d``, or a local time such as ``2012-11-27 10:05`` or
+    ``2012-11-27T10:05:06``.
+    """
+
+    value = value.strip()
+    match = RELATIVE_RE.match(value)
+    if match:
+        now = now or datetime.datetime.now()
+        delta = datetime.timedelta(**{
+            RELATIVE_UNITS[match.group(2)] : int(match.group(1))
+        })
+        return (now - delta).strftime(TIMESTAMP_FORMAT)
+
+    value = value.replace("T", " ")
+    for fmt in (TIMESTAMP_FORMAT, "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.datetime.strptime(value, fmt).strftime(
+                TIMESTAMP_FORMAT)
+        except (ValueError):
+            pass
+    raise ValueError("Could not parse time {value}, use a relative time "\
+        "like 30m or a time like 2012-11-27 10:05:06".format(value=value))
+
+def timestamp_epoch(key):
+    """Returns the local epoch time for the timestamp ``key``."""
+
+    return time.mktime(time.strptime(key, TIMESTAMP_FORMAT))
+
+def in_window(key, since, until):
+    """Returns True if the timestamp ``key`` is in the window."""
+
+    return (since is None or key >= since) and (until is None or key <= until)
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# Bisection
+
+def _next_timestamp(f, offset, end):
+    """Find the first line with a timestamp that starts at or after
+    ``offset`` and before ``end`` in the file ``f``.
+
+    If ``offset`` is inside a line the rest of that line is skipped.
+
+    Returns a tuple of (key, line_start, line_end) or None.
+    """
+
+    pos = offset
+    if offset:
+        f.seek(offset - 1)
+        if f.read(1) != b"\n":
+            pos += len(f.readline())
+    else:
+        f.seek(offset)
+    while pos < end:
+        line = f.readline()
+        if not line:
+            break
+        key = line_timestamp(line)
+        if key is not None:
+            return (key, pos, pos + len(line))
+        pos += len(line)
+    return None
+
+def bisect_log(f, key, lo, hi, strict=False):
+    """Bisect the open log file ``f`` between the ``lo`` and ``hi`` byte
+    offsets to find the start of the first line with a timestamp at or after
+    ``key``, or after ``key`` if ``strict``.
+
+    Lines without a timestamp belong to the line before. Only the last
+    :attr:`SCAN_SIZE` bytes are read line by line.
+
+    Returns the byte offset, ``hi`` if all the lines are before ``key``.
+    The offset is always the start of a line or ``hi``.
+    """
+
+    def after(line_key):
+        return line_key > key if strict else line_key >= key
+
+    # lines that start before lo are before key, the answer is a line that
+    # starts before hi or it is best, which is always the start of a line
+    best = hi
+    while hi - lo > SCAN_SIZE:
+        mid = (lo + hi) // 2
+        found = _next_timestamp(f, mid, hi)
+        if found is None:
+            # no line from mid to hi has a timestamp, they belong to a line
+            # that starts before mid which may still be the answer
+            hi = mid
+            continue
+        line_key, line_start, _ = found
+        if after(line_key):
+            hi = best = line_start
+        else:
+            lo = line_start + 1
+
+    while lo < hi:
+        found = _next_timestamp(f, lo, hi)
+        if found is None:
+            return best
+        line_key, line_start, line_end = found
+        if after(line_key):
+            return line_start
+        lo = line_end
+    return best
+
+def window_range(path, since, until):
+    """Find the byte range of the uncompressed log file at ``path`` that
+    contains the lines between the ``since`` and ``until`` timestamp keys,
+    either may be None.
+
+    Returns a tuple of (start, end) byte offsets, (0, 0) if no lines are
+    in the window, or None if the file does not have timestamps.
+    """
+
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        first = _next_timestamp(f, 0, size)
+        if first is None:
+            return None
+        if until is not None and first[0] > until:
+            return (0, 0)
+
+        start = 0 if since is None else bisect_log(f, since, 0, size)
+        end = size if until is None else bisect_log(f, until, start, size,
+            strict=True)
+    return (start, end)
+
+def filter_window(lines, since, until):
+    """Yields the ``lines`` that are in the window between the ``since`` and
+    ``until`` timestamp keys.
+
+    Lines without a timestamp are yielded if the line before them was.
+    Used for compressed logs that cannot be bisected.
+    """
+
+    keep = False
+    for line in lines:
+        key = line_timestamp(line)
+        if key is not None:
+            keep = in_window(key, since, until)
+        if keep:
+            yield line
@@ -0,0 +1,85 @@
+"""Run ``nodetool`` commands once per checkup.
+
+Each nodetool command starts a JVM, so the output of each command is cached
+in the checkup dir and any task that needs it again reads the cached copy.
+"""
+import logging
+import os
+import os.path
+import threading
+
+import file_util
+
+log = logging.getLogger(__name__)
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+def _lock_for(path):
+    """Returns the lock used to run the command cached at ``path`` once."""
+
+    with _locks_lock:
+        return _locks.setdefault(path, threading.Lock())
+
+def add_arguments(parser):
+    """Add the options for running nodetool to ``parser``, shared by all
+    the tasks that use it."""
+
+    parser.add_argument("--nodetool", dest="nodetool", default="nodetool",
+        help="Path to the nodetool script.")
+    parser.add_argument("--nodetool-host", dest="nodetool_host",
+        default="localhost",
+        help="Host for nodetool to connect to.")
+    return
+
+# ============================================================================
+#
+
+class Nodetool(object):
+    """Runs nodetool commands for ``host`` and caches the output in
+    ``cache_dir``."""
+
+    def __init__(self, path, host, cache_dir):
+        self.path = path
+        self.host = host
+        self.cache_dir = cache_dir
+
+    @classmethod
+    def from_args(cls, args):
+        """Create a :class:`Nodetool` from the command line ``args``, with
+        the cache in the checkup dir."""
+
+        check_root = getattr(args, "check_root", None) or args.check_dir
+        return cls(args.nodetool, args.nodetool_host, os.path.join(check_root,
+            "cache", "nodetool", args.nodetool_host))
+
+    def command(self, subcommand):
+        """Returns the command line to run ``subcommand``."""
+
+        return "{self.path} -h {self.host} {subcommand}".format(self=self,
+            subcommand=subcommand)
+
+    def output(self, task, subcommand):
+        """Returns the path of the output from ``subcommand``, running it
+        with ``task`` if it is not in the cache.
+
+        Only one thread runs a subcommand, others wait for its output.
+        """
+
+        path = os.path.join(self.cache_dir, subcommand.replace(" ", "_"))
+        with _lock_for(path):
+            if os.path.exists(path):
+                log.debug("Using cached output for nodetool {subcommand} "\
+                    "from {path}".format(subcommand=subcommand, path=path))
+                return path
+
+            file_util.ensure_dir(self.cache_dir)
+            tmp_path = path + ".tmp"
+            try:
+                task._exec_cmd(self.command(subcommand), out_path=tmp_path)
+            except:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            os.rename(tmp_path, path)
+        return path
@@ -0,0 +1,145 @@
+"""Measure the resources used by tasks.
+
+CPU time and IO are measured for the calling thread where the platform
+supports it (Linux), so the numbers are per task when tasks are run in
+parallel. Peak RSS is only available for the whole process.
+"""
+import resource
+import sys
+import time
+
+RUSAGE_THREAD = getattr(resource, "RUSAGE_THREAD",
+    1 if sys.platform.startswith("linux") else None)
+"""getrusage() target for the calling thread, None if not supported."""
+
+IO_PATHS = ["/proc/thread-self/io", "/proc/self/io"]
+"""Linux files with the IO counters, for the thread then the process."""
+
+IO_COUNTERS = [
+    ("read_bytes", "read_bytes"),
+    ("write_bytes", "write_bytes"),
+    ("rchar", "syscall_read_bytes"),
+    ("wchar", "syscall_write_bytes"),
+]
+"""The counters read from the IO files and the names they are reported as.
+``read_bytes`` and ``write_bytes`` are fetched from and sent to storage, 
+``rchar`` and ``wchar`` are passed to read and write system calls, which
+includes reads from the page cache."""
+
+def _cpu_time():
+    """Returns the user and system CPU time for the thread, or the process
+    if per thread usage is not supported."""
+
+    try:
+        usage = resource.getrusage(RUSAGE_THREAD)
+    except (TypeError, ValueError):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+def _max_rss():
+    """Returns the peak RSS for the process, in KB on Linux."""
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def _io_bytes():
+    """Returns a dict of the :data:`IO_COUNTERS` for the thread by the name
+    they are reported as, or None if the counters are not available."""
+
+    for path in IO_PATHS:
+        try:
+            with open(path, "r") as f:
+                counters = dict(
+                    line.split(":", 1)
+                    for line in f
+                    if ":" in line
+                )
+        except (EnvironmentError):
+            continue
+        return dict(
+            (name, int(counters[counter]))
+            for counter, name in IO_COUNTERS
+            if counter in counters
+        )
+    return None
+
+# ============================================================================
+#
+
+class Measurement(object):
+    """Measures the resources used between :meth:`start` and :meth:`stop`.
+
+    Time spent running sub processes is added by the caller with
+    :meth:`add_subprocess`.
+    """
+
+    def __init__(self):
+        self.subprocess_time = 0.0
+        self.subprocess_count = 0
+        self._start = None
+        self.result = {}
+
+    def start(self):
+        self._start = (time.time(), _cpu_time(), _max_rss(), _io_bytes())
+        return self
+
+    def add_subprocess(self, elapsed):
+        """Record a sub process that ran for ``elapsed`` seconds."""
+
+        self.subprocess_time += elapsed
+        self.subprocess_count += 1
+        return
+
+    def stop(self):
+        """Stop measuring.
+
+        Returns a dict of the resources used, also stored in ``result``.
+        """
+
+        start_time, start_cpu, start_rss, start_io = self._start
+        self.result = {
+            "wall_time" : round(time.time() - start_time, 6),
+            "cpu_time" : round(_cpu_time() - start_cpu, 6),
+            "max_rss_delta_kb" : _max_rss() - start_rss,
+            "subprocess_time" : round(self.subprocess_time, 6),
+            "subprocess_count" : self.subprocess_count,
+        }
+        end_io = _io_bytes()
+        if start_io and end_io:
+            for name, value in end_io.iteritems():
+                if name in start_io:
+                    self.result[name] = value - start_io[name]
+        return self.result
+
+PERF_FIELDS = [
+    ("wall_time", "Wall (s)"),
+    ("cpu_time", "CPU (s)"),
+    ("subprocess_time", "Sub process (s)"),
+    ("max_rss_delta_kb", "Peak RSS delta (KB)"),
+    ("read_bytes", "Storage read (bytes)"),
+    ("write_bytes", "Storage written (bytes)"),
+    ("syscall_read_bytes", "Read calls (bytes)"),
+    ("syscall_write_bytes", "Write calls (bytes)"),
+]
+"""The measurements shown in the report, and their titles."""
+
+def summarise(receipts):
+    """Build a machine readable summary of the perf measurements in the
+    ``receipts``.
+
+    Returns a dict with a ``tasks`` list and the ``totals``.
+    """
+
+    tasks = []
+    totals = {}
+    for receipt in sorted(receipts, key=lambda r: r.label):
+        tasks.append({
+            "name" : receipt.label,
+            "error" : bool(receipt.error),
+            "perf" : receipt.perf,
+        })
+        for key, value in receipt.perf.iteritems():
+            totals[key] = totals.get(key, 0) + value
+    return {
+        "tasks" : tasks,
+        "totals" : totals,
+    }
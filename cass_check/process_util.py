@@ -0,0 +1,133 @@
+"""Utilities for running sub processes."""
+
+import collections
+import errno
+import os
+import signal
+import subprocess
+import threading
+
+MAX_STDERR = 64 * 1024
+"""Bytes of stderr kept from a process."""
+
+def popen_group(args, **kwargs):
+    """Start the process ``args`` in a new process group, so it and any
+    processes it starts can be killed with :func:`kill_group`.
+
+    ``kwargs`` are passed to :class:`subprocess.Popen`.
+    """
+
+    return subprocess.Popen(args, preexec_fn=os.setsid, **kwargs)
+
+def kill_group(process):
+    """Kill the process group started by :func:`popen_group`."""
+
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (OSError) as e:
+        # already exited.
+        if e.errno != errno.ESRCH:
+            raise
+    return
+
+RunResult = collections.namedtuple("RunResult", ["rv", "stderr", "expired"])
+"""Result from :func:`run`, the exit code, the start of stderr and if the
+process was killed as it timed out."""
+
+def run(args, out_file, timeout=None, max_stderr=MAX_STDERR):
+    """Run the process ``args`` with stdout going to the file object 
+    ``out_file``, which the process writes to directly. 
+    
+    The process group is killed if it runs for more than ``timeout`` 
+    seconds. Only the first ``max_stderr`` bytes of stderr are kept.
+    
+    Returns a :class:`RunResult`.
+    """
+    
+    process = popen_group(args, stdout=out_file, stderr=subprocess.PIPE)
+    stderr = BoundedCapture(process.stderr, max_stderr)
+    with Deadline(process, timeout) as deadline:
+        rv = process.wait()
+    return RunResult(rv, stderr.join(), deadline.expired)
+
+# ============================================================================
+#
+
+class BoundedCapture(object):
+    """Reads the ``pipe`` from a process in a thread, keeping the first 
+    ``max_bytes`` and discarding the rest so the process never blocks on a 
+    full pipe.
+    """
+    
+    chunk_size = 64 * 1024
+    
+    def __init__(self, pipe, max_bytes=MAX_STDERR):
+        self.pipe = pipe
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._chunks = []
+        self._thread = threading.Thread(target=self._read)
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def _read(self):
+        kept = 0
+        try:
+            while True:
+                data = os.read(self.pipe.fileno(), self.chunk_size)
+                if not data:
+                    break
+                self.total_bytes += len(data)
+                if kept < self.max_bytes:
+                    data = data[:self.max_bytes - kept]
+                    self._chunks.append(data)
+                    kept += len(data)
+        finally:
+            self.pipe.close()
+        return
+    
+    def join(self):
+        """Wait for the pipe to close and return the bytes kept."""
+        
+        self._thread.join()
+        return b"".join(self._chunks)
+
+# ============================================================================
+#
+
+class Deadline(object):
+    """Kills the process group for ``process`` if it is still running after
+    ``timeout`` seconds.
+
+    Use as a context manager around the code that waits for the process,
+    ``expired`` is True if the process was killed. A ``timeout`` of None
+    means no deadline.
+    """
+
+    def __init__(self, process, timeout):
+        self.process = process
+        self.timeout = timeout
+        self.expired = False
+        self._timer = None
+
+    def _expire(self):
+        if self.process.poll() is None:
+            self.expired = True
+            kill_group(self.process)
+        return
+
+    def __enter__(self):
+        if self.timeout is not None:
+            self._timer = threading.Timer(self.timeout, self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer.join()
+        # never leave the process running if the caller failed.
+        if exc_type is not None and self.process.poll() is None:
+            kill_group(self.process)
+        return False
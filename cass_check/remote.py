@@ -0,0 +1,123 @@
+"""Run the collection on other nodes and bring the output back.
+
+Each node is reached with a remote exec command template, ``ssh`` by
+default, which runs ``cass-check collect`` on the node in a temporary dir
+and writes a tar of the output to stdout. The tar is extracted as it is
+read into a directory for the node.
+"""
+import logging
+import os.path
+import pipes
+import shlex
+import subprocess
+import time
+
+import file_util, process_util, task
+
+log = logging.getLogger(__name__)
+
+DEFAULT_REMOTE_EXEC = "ssh -o BatchMode=yes {host} {cmd}"
+"""Template for the command to run ``cmd`` on ``host``, cmd is quoted as a
+single shell word."""
+
+REMOTE_SCRIPT = """d=$(mktemp -d) || exit 1
+trap 'rm -rf "$d"' EXIT
+{cass_check} --log-file "$d/cass-check.log" --output-base "$d" --check-dir "$d" {global_args} collect {collect_args} --no-cache --no-history >&2 || exit $?
+tar -C "$d/collect" -cf - ."""
+"""Shell script run on the node, the collect output goes to stderr and the
+tar to stdout. Everything is written to the temp dir which is removed when
+the script exits, the task cache and history are disabled so nothing is
+left on the node and concurrent collections do not share files."""
+
+HOST_TASK_NAME = "collect-host"
+"""Name of the receipt recording that the collection on a node failed."""
+
+def remote_script(cass_check, global_args, collect_args):
+    """Returns the shell script to run ``cass_check`` on the node with the
+    list of ``global_args`` and ``collect_args``."""
+
+    quote = lambda args: " ".join(pipes.quote(arg) for arg in args)
+    return REMOTE_SCRIPT.format(cass_check=cass_check,
+        global_args=quote(global_args), collect_args=quote(collect_args))
+
+def remote_cmd(template, host, script):
+    """Returns the args to run ``script`` on ``host`` using the remote exec
+    ``template``."""
+
+    return shlex.split(template.format(host=pipes.quote(host),
+        cmd=pipes.quote(script)))
+
+def _safe_members(tar, dest_dir):
+    """Yields the members of the streaming ``tar`` that extract under
+    ``dest_dir``, skipping links and paths that would escape it."""
+
+    dest_dir = os.path.realpath(dest_dir)
+    for member in tar:
+        path = os.path.realpath(os.path.join(dest_dir, member.name))
+        if not (path == dest_dir or path.startswith(dest_dir + os.sep)) or \
+            member.issym() or member.islnk() or member.isdev():
+            log.warn("Skipping unsafe tar member {name}".format(
+                name=member.name))
+            continue
+        yield member
+
+def collect_host(host, host_dir, script, template=DEFAULT_REMOTE_EXEC,
+    timeout=None):
+    """Run the collection ``script`` on ``host`` and extract the output into
+    ``host_dir``.
+
+    The remote command is killed if it runs for more than ``timeout``
+    seconds.
+
+    Returns the list of :class:`task.TaskReceipt` from the node, with the
+    ``node`` set. If the remote command failed a :data:`HOST_TASK_NAME`
+    receipt with the error is returned.
+    """
+
+    # imported here as only collecting from other nodes needs it.
+    import tarfile
+
+    file_util.ensure_dir(host_dir)
+    args = remote_cmd(template, host, script)
+    log.debug("Collecting from {host} with {args}".format(host=host,
+        args=args))
+
+    start = time.time()
+    error = None
+    process = process_util.popen_group(args, stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE)
+    stderr = process_util.BoundedCapture(process.stderr)
+    with process_util.Deadline(process, timeout) as deadline:
+        try:
+            # r| reads the stream without seeking.
+            with tarfile.open(fileobj=process.stdout, mode="r|") as tar:
+                for member in _safe_members(tar, host_dir):
+                    tar.extract(member, host_dir)
+        except (tarfile.TarError) as e:
+            error = e
+        finally:
+            process.stdout.close()
+            rv = process.wait()
+    err_text = stderr.join()
+    elapsed = time.time() - start
+
+    if deadline.expired:
+        error = RuntimeError("Collection from {host} timed out after "\
+            "{timeout}s".format(host=host, timeout=timeout))
+    elif rv != 0:
+        error = RuntimeError("Collection from {host} exited with {rv}: "\
+            "{err}".format(host=host, rv=rv, err=err_text.strip()))
+
+    receipts = [] if error else (task.ReceiptManifest.load(host_dir) or [])
+    if error or not receipts:
+        receipt = task.TaskReceipt(HOST_TASK_NAME, host_dir,
+            error=error or RuntimeError("No receipts from {host}".format(
+            host=host)))
+        receipts = [receipt]
+    for receipt in receipts:
+        receipt.node = host
+
+    log.info("Collected {count} task receipts from {host} in "\
+        "{elapsed:.2f}s".format(count=len(receipts), host=host,
+        elapsed=elapsed))
+    return receipts
@@ -0,0 +1,161 @@
+"""Run tasks in the order of their dependencies.
+
+Tasks name the tasks whose output they read in :attr:`task.Task.inputs`.
+The scheduler builds a graph of the tasks it is given, across commands, and
+starts each task as soon as the tasks it needs have finished, running up to
+``jobs`` at a time. Inputs that are not in the graph are assumed to be on
+disk from an earlier run.
+
+If a task fails the tasks that need it, directly or not, are not run and
+their receipts record why.
+"""
+import logging
+import Queue
+
+log = logging.getLogger(__name__)
+
+# ============================================================================
+#
+
+class Scheduler(object):
+    """Runs ``tasks`` with ``run_func``, ``jobs`` at a time.
+
+    ``run_func`` is called with a task in a worker thread and must return
+    None or the ``sys.exc_info()`` for an error that should stop the run,
+    like :meth:`commands.TaskRunningCommand._try_run_task`. Errors that do
+    not stop the run are expected to be stored in the task receipt.
+    """
+
+    log = logging.getLogger("%s.%s" % (__name__, "Scheduler"))
+
+    def __init__(self, tasks, run_func, jobs=1):
+        self.tasks = list(tasks)
+        self.run_func = run_func
+        self.jobs = max(1, jobs)
+
+        by_name = {}
+        for t in self.tasks:
+            if t.name in by_name:
+                raise ValueError("Task name {name} is used more than "\
+                    "once".format(name=t.name))
+            by_name[t.name] = t
+
+        self.requires = dict(
+            (t, [by_name[name] for name in t.inputs if name in by_name])
+            for t in self.tasks
+        )
+        self.dependents = dict((t, []) for t in self.tasks)
+        for t, required in self.requires.iteritems():
+            for r in required:
+                self.dependents[r].append(t)
+        self.order = self._sort()
+
+    def _sort(self):
+        """Returns the tasks in an order where every task comes after the
+        tasks it requires, keeping the given order where possible.
+
+        Raises a ValueError if there is a cycle.
+        """
+
+        waiting = dict((t, len(r)) for t, r in self.requires.iteritems())
+        ready = [t for t in self.tasks if not waiting[t]]
+        order = []
+        while ready:
+            t = ready.pop(0)
+            order.append(t)
+            for d in self.dependents[t]:
+                waiting[d] -= 1
+                if not waiting[d]:
+                    ready.append(d)
+        if len(order) != len(self.tasks):
+            raise ValueError("Tasks have circular inputs: {names}".format(
+                names=", ".join(sorted(
+                    t.name for t in self.tasks if waiting[t]))))
+        return order
+
+    def run(self):
+        """Run the tasks.
+
+        If ``run_func`` returns an error it is raised once the running
+        tasks have finished, tasks that have not started are not run.
+        Returns the list of tasks that were skipped because a task they
+        need failed.
+        """
+
+        waiting = dict((t, len(r)) for t, r in self.requires.iteritems())
+        pending = set(self.tasks)
+        skipped = []
+        done = Queue.Queue()
+        error = None
+        running = 0
+        ready = [t for t in self.order if not waiting[t]]
+
+        # imported here as it is only needed when running in parallel
+        pool = None
+        if self.jobs > 1 and len(self.tasks) > 1:
+            import multiprocessing.pool
+            pool = multiprocessing.pool.ThreadPool(self.jobs)
+
+        def start(t):
+            for r in self.requires[t]:
+                t.input_receipts[r.name] = r.receipt
+            if pool is None:
+                done.put((t, self.run_func(t)))
+            else:
+                pool.apply_async(self.run_func, (t,),
+                    callback=lambda result: done.put((t, result)))
+
+        try:
+            while pending:
+                while ready and running < self.jobs and error is None:
+                    t = ready.pop(0)
+                    running += 1
+                    start(t)
+                if not running:
+                    break
+
+                t, exc_info = done.get()
+                running -= 1
+                pending.discard(t)
+                if exc_info and error is None:
+                    error = exc_info
+
+                if t.receipt.error:
+                    for s in self._skip_dependents(t, pending):
+                        pending.discard(s)
+                        skipped.append(s)
+                    continue
+                for d in self.dependents[t]:
+                    waiting[d] -= 1
+                    if not waiting[d] and d in pending:
+                        ready.append(d)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        if error is not None:
+            raise error[0], error[1], error[2]
+        return skipped
+
+    def _skip_dependents(self, failed, pending):
+        """Record the tasks in ``pending`` that need ``failed`` as skipped.
+
+        Returns the list of tasks skipped.
+        """
+
+        skipped = []
+        stack = list(self.dependents[failed])
+        while stack:
+            t = stack.pop()
+            if t not in pending or t in skipped:
+                continue
+            self.log.warn("Skipping task {t.name} as task {failed.name} "\
+                "failed".format(t=t, failed=failed))
+            t.receipt.error = RuntimeError("Skipped as required task "\
+                "{failed.name} failed: {error!r}".format(failed=failed,
+                error=failed.receipt.error))
+            t.receipt.write()
+            skipped.append(t)
+            stack.extend(self.dependents[t])
+        return skipped
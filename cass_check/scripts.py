@@ -7,14 +7,12 @@ import os.path
 import sys
 import traceback
 
-import pkg_resources
-
-import file_util
+import entry_points, file_util, serializer
 
 # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 # Sub Commands take the command line args and call the function to do the 
 # work. Sub commands are retrieved from the ``cass-check.tasks`` entry 
-# point using :mod:`pkg_resources`, see :func:`arg_parser`.
+# point using :mod:`entry_points`, see :func:`arg_parser`.
 # The ones here are global.
 
 def execute_help(args):
@@ -61,7 +59,7 @@ def arg_parser():
     parser.add_argument('command', type=str, default="", nargs="?",
         help='Command to print help for.')
     
-    for entry_point in pkg_resources.iter_entry_points(
+    for entry_point in entry_points.iter_entry_points(
         "cass_check.commands"):
         # Load the class and add it's parser
         entry_point.load().add_sub_parser(sub_parsers)
@@ -77,6 +75,11 @@ def arg_parser():
         help="Full path to output to, if specified output-base and "\
             "check-name are ignored.")
 
+    main_parser.add_argument("--receipt-format", dest="receipt_format", 
+        default="yaml", choices=serializer.available_formats(),
+        help="Format to write task receipts and manifests in, they are "\
+            "read in any format.")
+
     main_parser.add_argument("--fail-fast", dest="fail_fast", default=False,
         action="store_true",
         help="Fail processing at the first error. Otherwise issue a warning.")
@@ -133,7 +136,7 @@ def cass_check_main():
     else:
         commands = [
             entry_point.load()(args)
-            for entry_point in pkg_resources.iter_entry_points(
+            for entry_point in entry_points.iter_entry_points(
                 "cass-check.commands")
         ]
     cmd_names = ", ".join([
@@ -153,7 +156,9 @@ def cass_check_main():
             if rv !=0:
                 break
 
-        sys.stdout.write(str(cmd_out) + "\n")
+        # commands that write data to stdout return no message.
+        if cmd_out is not None:
+            sys.stdout.write(str(cmd_out) + "\n")
 
     except (Exception) as exc:
         print "Error:"
@@ -0,0 +1,333 @@
+"""Inverted index over the collected logs so they can be searched without
+reading all of them.
+
+Each log is split into blocks of about :data:`BLOCK_SIZE` bytes that end on
+a line boundary. The index maps each token to the sorted ids of the blocks
+it appears in, a search intersects the block ids for the query tokens and
+only reads those blocks to find the matching lines. Indexing blocks rather
+than lines keeps the index small, a common token is stored once per block.
+
+The index is a directory of files:
+
+* ``meta.json`` the format and counts.
+* ``files.json`` the indexed files, paths are relative to the index dir.
+* ``blocks.bin`` an array of (file id, offset, length, first line) for
+  each block, offsets are into the decompressed data.
+* ``terms.txt`` sorted lines of ``term<TAB>start<TAB>count``, searched
+  with a binary search through an mmap so it is never loaded.
+* ``postings.bin`` the arrays of block ids, ``start`` and ``count`` from
+  terms.txt are in items.
+"""
+import array
+import collections
+import json
+import logging
+import mmap
+import os
+import os.path
+import re
+import time
+
+import file_util
+
+log = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+BLOCK_SIZE = 64 * 1024
+"""Approximate size of the blocks the logs are split into."""
+
+TOKEN_RE = re.compile(r"[a-z0-9_]{2,64}")
+"""Tokens are runs of 2 to 64 word characters, matched on lower case."""
+
+BLOCK_FIELDS = 4
+"""Number of items in ``blocks.bin`` for each block."""
+
+def tokens(text):
+    """Returns the set of tokens in ``text``."""
+
+    return set(TOKEN_RE.findall(text.lower()))
+
+def _iter_blocks(fileobj, block_size=BLOCK_SIZE):
+    """Yields tuples of (offset, data) for blocks of ``fileobj`` that end on
+    a line boundary, a line longer than ``block_size`` ends up in a block
+    on its own."""
+
+    offset = 0
+    pending = b""
+    for chunk in iter(lambda: fileobj.read(block_size), b""):
+        data = pending + chunk
+        end = data.rfind(b"\n") + 1
+        if not end:
+            pending = data
+            continue
+        yield (offset, data[:end])
+        offset += end
+        pending = data[end:]
+    if pending:
+        yield (offset, pending)
+
+# ============================================================================
+#
+
+class IndexWriter(object):
+    """Builds a search index in ``index_dir``. Call :meth:`add_file` for
+    each file and then :meth:`close`."""
+
+    log = logging.getLogger("%s.%s" % (__name__, "IndexWriter"))
+
+    def __init__(self, index_dir, block_size=BLOCK_SIZE):
+        self.index_dir = index_dir
+        self.block_size = block_size
+        self.files = []
+        self.blocks = array.array("L")
+        self.postings = collections.defaultdict(lambda: array.array("L"))
+        self.bytes_indexed = 0
+
+    def add_file(self, path, report_path=None):
+        """Index the file at ``path``, it is decompressed as it is read.
+        ``report_path`` is the path of the file in the report, if it is
+        there."""
+
+        file_id = len(self.files)
+        self.files.append({
+            "path" : os.path.relpath(path, self.index_dir),
+            "report_path" : report_path,
+            "compression" : file_util.source_compression(path),
+        })
+
+        line_no = 0
+        with file_util.open_decompressed(path) as f:
+            for offset, data in _iter_blocks(f, self.block_size):
+                block_id = len(self.blocks) // BLOCK_FIELDS
+                self.blocks.extend((file_id, offset, len(data), line_no))
+                for token in tokens(data):
+                    self.postings[token].append(block_id)
+                line_no += data.count(b"\n")
+                self.bytes_indexed += len(data)
+        return
+
+    def close(self):
+        """Write the index to disk.
+
+        Returns a dict of stats about the index.
+        """
+
+        file_util.ensure_dir(self.index_dir)
+        path = lambda name: os.path.join(self.index_dir, name)
+
+        postings_count = 0
+        with open(path("postings.bin"), "wb") as postings_file:
+            with open(path("terms.txt"), "wb") as terms_file:
+                for term in sorted(self.postings):
+                    block_ids = self.postings[term]
+                    terms_file.write("{term}\t{start}\t{count}\n".format(
+                        term=term, start=postings_count,
+                        count=len(block_ids)))
+                    block_ids.tofile(postings_file)
+                    postings_count += len(block_ids)
+        with open(path("blocks.bin"), "wb") as f:
+            self.blocks.tofile(f)
+        with open(path("files.json"), "wb") as f:
+            json.dump(self.files, f, indent=2)
+
+        stats = {
+            "files" : len(self.files),
+            "blocks" : len(self.blocks) // BLOCK_FIELDS,
+            "terms" : len(self.postings),
+            "postings" : postings_count,
+            "bytes_indexed" : self.bytes_indexed,
+        }
+        with open(path("meta.json"), "wb") as f:
+            json.dump(dict(stats, version=FORMAT_VERSION,
+                itemsize=self.blocks.itemsize, block_size=self.block_size),
+                f, indent=2)
+        stats["index_bytes"] = sum(
+            os.path.getsize(path(name))
+            for name in os.listdir(self.index_dir)
+        )
+        return stats
+
+# ============================================================================
+#
+
+SearchHit = collections.namedtuple("SearchHit",
+    ["path", "report_path", "line_no", "offset", "line"])
+"""A line that matched a search. ``line_no`` is one based, ``offset`` is
+the offset of the line in the decompressed file."""
+
+class SearchIndex(object):
+    """Reads the search index in ``index_dir``."""
+
+    log = logging.getLogger("%s.%s" % (__name__, "SearchIndex"))
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+
+        with open(os.path.join(index_dir, "meta.json"), "rb") as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != FORMAT_VERSION:
+            raise ValueError("Unsupported search index version {version} "\
+                "in {index_dir}".format(version=self.meta["version"],
+                index_dir=index_dir))
+        with open(os.path.join(index_dir, "files.json"), "rb") as f:
+            self.files = json.load(f)
+
+        self.blocks = array.array("L")
+        if self.blocks.itemsize != self.meta["itemsize"]:
+            raise ValueError("Search index {index_dir} was built on a "\
+                "platform with a different word size".format(
+                index_dir=index_dir))
+        with open(os.path.join(index_dir, "blocks.bin"), "rb") as f:
+            self.blocks.fromfile(f, self.meta["blocks"] * BLOCK_FIELDS)
+
+        self._terms_file = open(os.path.join(index_dir, "terms.txt"), "rb")
+        self._terms = mmap.mmap(self._terms_file.fileno(), 0,
+            access=mmap.ACCESS_READ) if self.meta["terms"] else b""
+        self._postings_file = open(os.path.join(index_dir, "postings.bin"),
+            "rb")
+
+    def close(self):
+        if self._terms:
+            self._terms.close()
+        self._terms_file.close()
+        self._postings_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def _find_term(self, term):
+        """Returns the tuple of (start, count) for ``term`` in the postings,
+        or None if it is not in the index."""
+
+        terms = self._terms
+        lo, hi = 0, len(terms)
+        # Binary search on byte offsets, moving to the start of the line.
+        while lo < hi:
+            mid = (lo + hi) // 2
+            line_start = terms.rfind(b"\n", 0, mid) + 1
+            line_end = terms.find(b"\n", line_start)
+            entry, start, count = terms[line_start:line_end].split(b"\t")
+            if entry == term:
+                return (int(start), int(count))
+            if entry < term:
+                lo = line_end + 1
+            else:
+                hi = line_start
+        return None
+
+    def postings(self, term):
+        """Returns the list of block ids ``term`` is in."""
+
+        found = self._find_term(term)
+        if found is None:
+            return []
+        start, count = found
+        block_ids = array.array("L")
+        self._postings_file.seek(start * block_ids.itemsize)
+        block_ids.fromfile(self._postings_file, count)
+        return block_ids
+
+    def search(self, query, limit=100):
+        """Returns a list of up to ``limit`` :class:`SearchHit` for the
+        lines that contain all the tokens in ``query``, in file order."""
+
+        query_tokens = tokens(query)
+        if not query_tokens:
+            raise ValueError("Query {query!r} has no searchable words, they "\
+                "must be at least 2 letters or digits.".format(query=query))
+
+        # Intersect from the shortest postings list.
+        block_ids = None
+        for postings in sorted((self.postings(t) for t in query_tokens),
+            key=len):
+            block_ids = set(postings) if block_ids is None else \
+                block_ids.intersection(postings)
+            if not block_ids:
+                return []
+
+        hits = []
+        reader = _BlockReader(self)
+        try:
+            for block_id in sorted(block_ids):
+                for hit in reader.matches(block_id, query_tokens):
+                    hits.append(hit)
+                    if len(hits) >= limit:
+                        return hits
+        finally:
+            reader.close()
+        return hits
+
+class _BlockReader(object):
+    """Reads blocks from the indexed files in order, keeping the current
+    file open so compressed files are only decompressed once."""
+
+    def __init__(self, index):
+        self.index = index
+        self._file_id = None
+        self._file = None
+        self._pos = 0
+
+    def read(self, block_id):
+        """Returns the tuple of (file id, offset, first line, data) for
+        ``block_id``. Blocks must be read in ascending order."""
+
+        i = block_id * BLOCK_FIELDS
+        file_id, offset, length, line_no = self.index.blocks[i:i + BLOCK_FIELDS]
+        if file_id != self._file_id:
+            self.close()
+            path = os.path.join(self.index.index_dir,
+                self.index.files[file_id]["path"])
+            self._file = file_util.open_decompressed(path)
+            self._file_id = file_id
+            self._pos = 0
+
+        if isinstance(self._file, file):
+            self._file.seek(offset)
+        else:
+            # decompressed streams can only move forward.
+            while self._pos < offset:
+                skipped = len(self._file.read(min(offset - self._pos,
+                    file_util.CHUNK_SIZE)))
+                if not skipped:
+                    break
+                self._pos += skipped
+        data = self._file.read(length)
+        self._pos = offset + len(data)
+        return (file_id, offset, line_no, data)
+
+    def matches(self, block_id, query_tokens):
+        """Yields a :class:`SearchHit` for the lines in ``block_id`` that
+        contain all the ``query_tokens``."""
+
+        file_id, offset, line_no, data = self.read(block_id)
+        info = self.index.files[file_id]
+        path = os.path.normpath(os.path.join(self.index.index_dir,
+            info["path"]))
+        for line in data.split(b"\n"):
+            line_no += 1
+            if query_tokens.issubset(tokens(line)):
+                yield SearchHit(path, info["report_path"], line_no,
+                    offset, line.decode("utf-8", "replace"))
+            offset += len(line) + 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._file_id = None
+
+def timed_search(index_dir, query, limit=100):
+    """Open the index in ``index_dir`` and search it for ``query``.
+
+    Returns a tuple of (hits, seconds).
+    """
+
+    start = time.time()
+    with SearchIndex(index_dir) as index:
+        hits = index.search(query, limit=limit)
+    return (hits, time.time() - start)
@@ -0,0 +1,110 @@
+"""Reading and writing the receipts, manifests and other state we keep.
+
+Files can be written as YAML, compact JSON or msgpack and the format is
+detected from the file extension when they are read. YAML uses the libyaml C
+loader and dumper when PyYAML was built with them, and is always loaded
+safely.
+
+:mod:`yaml` is imported the first time it is needed as it is slow to import
+and not all commands use it.
+"""
+import json
+import os.path
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+import file_util
+
+FORMAT_EXTENSIONS = {
+    "yaml" : ".yaml",
+    "json" : ".json",
+    "msgpack" : ".msgpack",
+}
+"""File extensions for the formats we can write."""
+
+def _yaml():
+    """Import yaml and return a tuple of (yaml, SafeLoader, SafeDumper) 
+    using the C classes if they are available."""
+
+    import yaml
+    try:
+        return (yaml, yaml.CSafeLoader, yaml.CSafeDumper)
+    except AttributeError:
+        return (yaml, yaml.SafeLoader, yaml.SafeDumper)
+
+def available_formats():
+    """Returns a list of the formats that can be used, msgpack depends on
+    the optional msgpack package."""
+
+    formats = ["yaml", "json"]
+    if msgpack is not None:
+        formats.append("msgpack")
+    return formats
+
+def file_names(base_name):
+    """Returns the file names ``base_name`` could be written to, one for
+    each format."""
+
+    return [
+        base_name + ext
+        for ext in sorted(FORMAT_EXTENSIONS.itervalues())
+    ]
+
+def path_format(path):
+    """Returns the format for the file at ``path`` from its extension, or
+    None if it is not a format we know."""
+
+    _, ext = os.path.splitext(path)
+    for fmt, fmt_ext in FORMAT_EXTENSIONS.iteritems():
+        if ext == fmt_ext:
+            return fmt
+    return None
+
+def find(dir_path, base_name):
+    """Returns the path of the file in ``dir_path`` called ``base_name``
+    with any of the format extensions, or None if there is not one."""
+
+    for file_name in file_names(base_name):
+        path = os.path.join(dir_path, file_name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+def load(path):
+    """Load the file at ``path`` using the format from its extension."""
+
+    fmt = path_format(path)
+    if fmt == "json":
+        with open(path, "rb") as f:
+            return json.load(f)
+    if fmt == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("The msgpack package is needed to read "\
+                "{path}".format(path=path))
+        with open(path, "rb") as f:
+            return msgpack.unpackb(f.read(), raw=False)
+
+    yaml, loader, _ = _yaml()
+    with open(path, "rb") as f:
+        return yaml.load(f, Loader=loader)
+
+def dump(data, path):
+    """Atomically write ``data`` to the file at ``path`` using the format
+    from its extension."""
+
+    fmt = path_format(path)
+    with file_util.atomic_write(path, "wb") as f:
+        if fmt == "json":
+            json.dump(data, f, separators=(",", ":"), sort_keys=True)
+        elif fmt == "msgpack":
+            if msgpack is None:
+                raise RuntimeError("The msgpack package is needed to write "\
+                    "{path}".format(path=path))
+            f.write(msgpack.packb(data, use_bin_type=True))
+        else:
+            yaml, _, dumper = _yaml()
+            yaml.dump(data, f, Dumper=dumper, default_flow_style=False)
+    return path
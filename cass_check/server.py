@@ -0,0 +1,424 @@
+"""Serve the report over HTTP so large output files can be browsed.
+
+Files are sent in chunks and byte range requests are supported, so a multi
+GB log never has to be loaded by the server or the browser. Compressed
+files are decompressed as they are sent unless ``?download=1`` is used.
+
+Text files can also be viewed a page of lines at a time with
+``?view=page&page=N`` or ``?view=tail``. A sparse index of line offsets is
+built with a single pass over the file the first time it is viewed, so
+finding a page only reads the lines between the nearest indexed line and
+the page.
+"""
+import array
+import BaseHTTPServer
+import cgi
+import collections
+import logging
+import os
+import os.path
+import posixpath
+import SimpleHTTPServer
+import SocketServer
+import threading
+import urllib
+import urlparse
+
+import file_util, search_index
+
+log = logging.getLogger(__name__)
+
+INDEX_STEP = 1000
+"""Number of lines between offsets stored in a :class:`LineIndex`."""
+
+PAGE_LINES = 500
+"""Default number of lines shown in a page or tail view."""
+
+MAX_PAGE_LINES = 10000
+"""Most lines that can be requested for a page."""
+
+MAX_INDEXES = 64
+"""Number of line indexes kept in memory."""
+
+# ============================================================================
+#
+
+class LineIndex(object):
+    """Sparse index of the offsets of every ``step`` lines in a file.
+
+    Offsets are for the decompressed data if the file is compressed.
+    """
+
+    def __init__(self, offsets, lines, step):
+        self.offsets = offsets
+        """Array where item ``i`` is the offset of line ``i * step``."""
+
+        self.lines = lines
+        """Number of lines in the file."""
+
+        self.step = step
+
+    @classmethod
+    def build(cls, fileobj, step=INDEX_STEP):
+        """Build the index by reading all of ``fileobj`` in chunks."""
+
+        offsets = array.array("L", [0])
+        lines = 0
+        pos = 0
+        next_mark = step
+        last = b"\n"
+        for chunk in iter(lambda: fileobj.read(file_util.CHUNK_SIZE), b""):
+            # Only look for the newlines in chunks with an indexed line.
+            start = 0
+            count = chunk.count(b"\n")
+            while count >= next_mark - lines:
+                for _ in xrange(next_mark - lines):
+                    start = chunk.index(b"\n", start) + 1
+                count -= next_mark - lines
+                lines = next_mark
+                offsets.append(pos + start)
+                next_mark += step
+            lines += count
+            pos += len(chunk)
+            last = chunk[-1:]
+        if last != b"\n":
+            # last line without a newline
+            lines += 1
+        return cls(offsets, lines, step)
+
+    def read_lines(self, fileobj, first, count):
+        """Returns up to ``count`` lines from ``fileobj`` starting at
+        the zero based line ``first``."""
+
+        mark = min(first // self.step, len(self.offsets) - 1)
+        _skip(fileobj, self.offsets[mark])
+        result = []
+        for line_no, line in enumerate(_iter_lines(fileobj),
+            mark * self.step):
+            if line_no >= first + count:
+                break
+            if line_no >= first:
+                result.append(line)
+        return result
+
+def _skip(fileobj, offset):
+    """Move ``fileobj`` forward to ``offset``, seeking if it is a plain
+    file and reading otherwise."""
+
+    if isinstance(fileobj, file):
+        fileobj.seek(offset)
+        return
+    remaining = offset
+    while remaining > 0:
+        chunk = fileobj.read(min(remaining, file_util.CHUNK_SIZE))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+    return
+
+def _iter_lines(fileobj):
+    """Yields the lines from ``fileobj`` using only ``read()``, which is
+    all some of the decompressing readers support."""
+
+    pending = b""
+    for chunk in iter(lambda: fileobj.read(file_util.CHUNK_SIZE), b""):
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+_indexes = collections.OrderedDict()
+_indexes_lock = threading.Lock()
+
+def line_index(path):
+    """Returns the :class:`LineIndex` for the file at ``path``, building it
+    if the file is new or has changed.
+
+    The most recently used indexes are kept in memory.
+    """
+
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime)
+    with _indexes_lock:
+        index = _indexes.pop(key, None)
+        if index is not None:
+            _indexes[key] = index
+            return index
+
+    # Two requests may build the same index, which is better than holding
+    # the lock while reading the file.
+    log.debug("Building line index for {path}".format(path=path))
+    with file_util.open_decompressed(path) as f:
+        index = LineIndex.build(f)
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+def parse_range(header, size):
+    """Parse the HTTP Range ``header`` for a file of ``size`` bytes.
+
+    Returns None to send the whole file, or a tuple of (start, end) with the
+    inclusive end. Raises ValueError if the range cannot be satisfied.
+    Multiple ranges are not supported and get the whole file.
+    """
+
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, _, end = header[len("bytes="):].strip().partition("-")
+    if not start:
+        # suffix range, the last N bytes.
+        length = int(end)
+        if length <= 0:
+            raise ValueError("Empty suffix range")
+        return (max(0, size - length), size - 1)
+    start = int(start)
+    end = int(end) if end else size - 1
+    if start >= size or end < start:
+        raise ValueError("Range {header} outside of {size} bytes".format(
+            header=header, size=size))
+    return (start, min(end, size - 1))
+
+# ============================================================================
+#
+
+class ReportRequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    """Serves the files under ``root``, see the module docs."""
+
+    log = logging.getLogger("%s.%s" % (__name__, "ReportRequestHandler"))
+
+    root = None
+    """Directory to serve, set on a sub class by :func:`make_server`."""
+
+    index_dir = None
+    """Search index for ``/search``, if there is one."""
+
+    extensions_map = dict(SimpleHTTPServer.SimpleHTTPRequestHandler.\
+        extensions_map, **{
+            ".log" : "text/plain",
+            ".txt" : "text/plain",
+            ".out" : "text/plain",
+            ".yaml" : "text/plain",
+            ".json" : "application/json",
+        })
+
+    def translate_path(self, path):
+        """Returns the file system path for the URL ``path``, never outside
+        of ``root``."""
+
+        path = posixpath.normpath(urllib.unquote(
+            urlparse.urlsplit(path).path))
+        parts = [
+            part
+            for part in path.split("/")
+            if part and part not in (os.curdir, os.pardir)
+        ]
+        return os.path.join(self.root, *parts)
+
+    def do_GET(self):
+
+        url = urlparse.urlsplit(self.path)
+        query = urlparse.parse_qs(url.query)
+        path = None
+        if url.path != "/search":
+            path = self.translate_path(self.path)
+            if os.path.isdir(path) or not os.path.isfile(path):
+                # index.html, listings and 404s.
+                return SimpleHTTPServer.SimpleHTTPRequestHandler.do_GET(self)
+
+        view = query.get("view", [None])[0]
+        try:
+            if path is None:
+                self._send_search(query)
+            elif view in ("page", "tail"):
+                self._send_lines(path, view, query)
+            elif file_util.source_compression(path) and \
+                not query.get("download"):
+                self._send_decompressed(path)
+            else:
+                self._send_file(path)
+        except (ValueError) as e:
+            self.send_error(400, str(e))
+        except (EnvironmentError) as e:
+            # the browser went away, or the file did.
+            self.log.debug("Error serving {path}: {e}".format(
+                path=path or url.path, e=e))
+        return
+
+    def _send_file(self, path):
+        """Send the file at ``path`` or the byte range requested."""
+
+        size = os.path.getsize(path)
+        try:
+            byte_range = parse_range(self.headers.get("Range"), size)
+        except (ValueError):
+            self.send_response(416)
+            self.send_header("Content-Range", "bytes */{size}".format(
+                size=size))
+            self.end_headers()
+            return
+
+        with open(path, "rb") as f:
+            if byte_range is None:
+                start, length = 0, size
+                self.send_response(200)
+            else:
+                start, length = byte_range[0], byte_range[1] - byte_range[0] + 1
+                self.send_response(206)
+                self.send_header("Content-Range",
+                    "bytes {start}-{end}/{size}".format(start=start,
+                    end=byte_range[1], size=size))
+            self.send_header("Content-Type", self.guess_type(path))
+            self.send_header("Content-Length", str(length))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Last-Modified", self.date_time_string(
+                os.path.getmtime(path)))
+            self.end_headers()
+            f.seek(start)
+            file_util.copy_stream(f, self.wfile, length=length)
+        return
+
+    def _send_decompressed(self, path):
+        """Send the file at ``path`` decompressing it as it is read. The
+        size is not known so the response ends when the connection closes.
+        """
+
+        with file_util.open_decompressed(path) as f:
+            self.send_response(200)
+            self.send_header("Content-Type", self.guess_type(
+                file_util.strip_compression_ext(path)))
+            self.end_headers()
+            file_util.copy_stream(f, self.wfile)
+        return
+
+    def _send_lines(self, path, view, query):
+        """Send an HTML page with a page of lines from ``path``."""
+
+        count = min(int(query.get("lines", [PAGE_LINES])[0]), MAX_PAGE_LINES)
+        if count <= 0:
+            raise ValueError("lines must be positive")
+        index = line_index(path)
+        pages = max(1, (index.lines + count - 1) // count)
+        if view == "tail":
+            first = max(0, index.lines - count)
+            page = pages - 1
+        else:
+            page = min(max(0, int(query.get("page", [0])[0])), pages - 1)
+            first = page * count
+
+        with file_util.open_decompressed(path) as f:
+            lines = index.read_lines(f, first, count)
+
+        name = cgi.escape(os.path.basename(path))
+        link = lambda p, text: '<a href="?view=page&amp;page={p}&amp;'\
+            'lines={count}">{text}</a>'.format(p=p, count=count, text=text)
+        nav = " | ".join([
+            link(0, "first"),
+            link(max(0, page - 1), "previous"),
+            link(min(pages - 1, page + 1), "next"),
+            '<a href="?view=tail&amp;lines={count}">tail</a>'.format(
+                count=count),
+            '<a href="?download=1">download</a>',
+        ])
+        body = [
+            "<!DOCTYPE html>",
+            "<html><head><meta charset=\"utf-8\"><title>{name}</title>"\
+                "</head><body>".format(name=name),
+            "<p>{name} lines {start:,} to {end:,} of {total:,}, page "\
+                "{page:,} of {pages:,}</p>".format(name=name, start=first + 1,
+                end=first + len(lines), total=index.lines, page=page + 1,
+                pages=pages),
+            "<p>{nav}</p>".format(nav=nav),
+            "<pre>",
+        ]
+        body.extend(
+            cgi.escape(line.decode("utf-8", "replace")).encode("utf-8")
+            for line in lines
+        )
+        body.extend(["</pre>", "<p>{nav}</p>".format(nav=nav),
+            "</body></html>"])
+        data = "\n".join(body)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        return
+
+    def _send_search(self, query):
+        """Send an HTML page with the results of searching for the ``q``
+        query parameter.
+
+        Raises a ValueError if the ``limit`` parameter is not a positive
+        number.
+        """
+
+        if self.index_dir is None:
+            self.send_error(404, "There is no search index for this report")
+            return
+        text = query.get("q", [""])[0]
+        limit = min(int(query.get("limit", [200])[0]), MAX_PAGE_LINES)
+        if limit <= 0:
+            raise ValueError("limit must be positive")
+        try:
+            hits, elapsed = search_index.timed_search(self.index_dir, text,
+                limit=limit)
+            summary = "{count} lines matched in {elapsed:.3f}s".format(
+                count=len(hits), elapsed=elapsed)
+        except (ValueError) as e:
+            hits, summary = [], str(e)
+
+        body = [
+            "<!DOCTYPE html>",
+            "<html><head><meta charset=\"utf-8\"><title>Search {text}"\
+                "</title></head><body>".format(text=cgi.escape(text)),
+            "<form action=\"/search\"><input name=\"q\" value=\"{text}\">"\
+                "<input type=\"submit\" value=\"Search\"></form>".format(
+                text=cgi.escape(text, quote=True)),
+            "<p>{summary}</p>".format(summary=cgi.escape(summary)),
+            "<pre>",
+        ]
+        for hit in hits:
+            href = "/{path}?view=page&amp;page={page}&amp;lines={lines}".format(
+                path=urllib.quote(hit.report_path), 
+                page=(hit.line_no - 1) // PAGE_LINES, lines=PAGE_LINES)
+            body.append("<a href=\"{href}\">{name}:{line_no}</a> "\
+                "{line}".format(href=href, 
+                name=cgi.escape(hit.report_path), line_no=hit.line_no, 
+                line=cgi.escape(hit.line).encode("utf-8")))
+        body.extend(["</pre>", "</body></html>"])
+        data = "\n".join(body)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        return
+
+    def log_message(self, format, *args):
+        self.log.info("{client} {msg}".format(client=self.client_address[0],
+            msg=format % args))
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn,
+    BaseHTTPServer.HTTPServer):
+    """HTTP server that handles each request in a thread, so a large
+    download does not block other requests."""
+
+    daemon_threads = True
+
+def make_server(root, bind="127.0.0.1", port=8000, index_dir=None):
+    """Returns a server for the files under ``root``, call
+    ``serve_forever()`` on it to start serving. ``index_dir`` is the
+    :mod:`search_index` to use for searches."""
+
+    # the handler is created for each request, so root goes on a class.
+    class Handler(ReportRequestHandler):
+        pass
+    Handler.root = os.path.abspath(root)
+    Handler.index_dir = index_dir
+    return ThreadingHTTPServer((bind, port), Handler)
@@ -0,0 +1,311 @@
+"""Parse Cassandra ``system.log`` files into structured events.
+
+Each log line becomes an event with the time, level, thread and source file.
+Lines from GCInspector, dropped messages, compactions and flushes are also
+classified with a kind, a subject (the collector, message verb or column
+family) and a value (the pause ms, dropped count or bytes).
+
+Both the log4j layout used up to Cassandra 2.0 and the logback layout used
+from 2.1 are parsed, and the messages of each version are classified.
+
+Large files are split into chunks at line boundaries and the chunks are
+parsed in parallel by worker processes that each ``mmap`` the file, so only
+the chunk they parse is paged in.
+"""
+import array
+import collections
+import mmap
+import os.path
+import re
+import time
+
+import columnar
+
+LINE_RE = re.compile(
+    r"^ ?(?P<level>[A-Z]+) +\[(?P<thread>[^\]]*)\] "
+    r"(?P<ts>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}),(?P<ms>\d{3}) "
+    r"(?P<source>[^\s:]+)(?: \(line \d+\)|:\d+ -)? (?P<message>[^\n]*)$", 
+    re.M)
+"""Matches a log line in the log4j or logback layout like::
+
+     INFO [main] 2012-11-27 10:05:06,123 CassandraDaemon.java (line 101) ...
+    INFO  [main] 2015-08-25 10:05:06,123 CassandraDaemon.java:101 - ...
+
+The source is the file name without the line number."""
+
+SIZE = r"(\d[\d,.]* ?(?:[KMGT]i?B|bytes)?)"
+"""A size in a message, like ``1,234``, ``5274 bytes`` or ``2.424MiB``."""
+
+SIZE_PARTS_RE = re.compile(r"([\d,.]+) ?(\w*)")
+
+SIZE_UNITS = {
+    "" : 1, "bytes" : 1, "B" : 1,
+    "KB" : 1024, "KiB" : 1024,
+    "MB" : 1024 ** 2, "MiB" : 1024 ** 2,
+    "GB" : 1024 ** 3, "GiB" : 1024 ** 3,
+    "TB" : 1024 ** 4, "TiB" : 1024 ** 4,
+}
+"""Multiplier for the units of a :data:`SIZE`, Cassandra uses both KB and 
+KiB for 1024 bytes."""
+
+KINDS = ["other", "gc_pause", "dropped", "compaction_start", "compaction",
+    "flush_start", "flush"]
+"""Kinds of event, the kind column stores the index into this list."""
+KIND_CODES = dict((kind, i) for i, kind in enumerate(KINDS))
+
+SOURCE_PATTERNS = {
+    "GCInspector.java" : [
+        ("gc_pause", re.compile(r"^GC for (\w+): (\d+) ms"), 1, 2),
+        # 2.1 and later
+        ("gc_pause", re.compile(r"^(\w[\w ]*?) GC in (\d+)ms"), 1, 2),
+    ],
+    "MessagingService.java" : [
+        ("dropped", re.compile(r"^(\d+) (\w+) messages dropped"), 2, 1),
+        # 2.1 and later, internal and cross node counts.
+        ("dropped", re.compile(r"^(\w+) messages were dropped in last \d+ "\
+            r"ms: (\d+) (?:for )?internal(?: timeout)? and (\d+) (?:for )?"\
+            r"cross node"), 1, (2, 3)),
+    ],
+    "CompactionTask.java" : [
+        ("compaction_start", re.compile(r"^Compacting (?:\([^)]*\) )?\["), 
+            None, None),
+        ("compaction", re.compile(r"^Compacted (?:to |.*? sstables to ).*?"\
+            + SIZE + r" to " + SIZE + r" \(~\d+% of original\)"), None, 1),
+    ],
+    "Memtable.java" : [
+        ("flush_start", re.compile(r"^Writing Memtable-(\w+)@"), 1, None),
+        ("flush", re.compile(r"^Completed flushing \S*?([^/]+) \(" + SIZE + \
+            r"\)"), 1, 2),
+    ],
+}
+"""For each source file, a list of (kind, regex, subject group, value group)
+to classify the line message. The value group may be a tuple of groups 
+that are added together. Only lines from these sources are classified which
+keeps the cost of parsing other lines low."""
+
+EVENT_COLUMNS = [
+    ("ts", "d"),
+    ("level", columnar.STRING),
+    ("thread", columnar.STRING),
+    ("source", columnar.STRING),
+    ("kind", "B"),
+    ("subject", columnar.STRING),
+    ("value", "d"),
+    ("file", columnar.STRING),
+    ("offset", "d"),
+]
+"""Columns in the events table. ts is the local epoch time, and offset the
+byte offset of the line in the file."""
+
+# ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+# Parsing
+
+def parse_size(text):
+    """Returns the number of bytes, or the number, in the ``text`` matched 
+    by :data:`SIZE`."""
+
+    number, unit = SIZE_PARTS_RE.match(text).groups()
+    return float(number.replace(",", "")) * SIZE_UNITS[unit]
+
+def classify(source, message):
+    """Classify the log ``message`` from ``source``.
+
+    Returns a tuple of (kind code, subject, value).
+    """
+
+    for kind, regex, subject_group, value_group in \
+        SOURCE_PATTERNS.get(source, ()):
+        match = regex.match(message)
+        if match is None:
+            continue
+        subject = match.group(subject_group) if subject_group else ""
+        if not value_group:
+            value = 0.0
+        elif isinstance(value_group, tuple):
+            value = sum(parse_size(match.group(g)) for g in value_group)
+        else:
+            value = parse_size(match.group(value_group))
+        return (KIND_CODES[kind], subject, value)
+    return (0, "", 0.0)
+
+def new_summary():
+    """Returns an empty summary, see :func:`merge_summary`."""
+
+    return {
+        "lines" : 0,
+        "first_ts" : None,
+        "last_ts" : None,
+        "levels" : collections.Counter(),
+        "kinds" : collections.Counter(),
+        "gc_pause_ms_total" : 0.0,
+        "gc_pause_ms_max" : 0.0,
+        "dropped" : collections.Counter(),
+        "compacted_bytes" : 0.0,
+        "flushed_bytes" : 0.0,
+    }
+
+def merge_summary(summary, other):
+    """Merge the ``other`` summary into ``summary``."""
+
+    summary["lines"] += other["lines"]
+    for key, func in (("first_ts", min), ("last_ts", max)):
+        values = [v for v in (summary[key], other[key]) if v is not None]
+        summary[key] = func(values) if values else None
+    for key in ("levels", "kinds", "dropped"):
+        summary[key].update(other[key])
+    for key in ("gc_pause_ms_total", "compacted_bytes", "flushed_bytes"):
+        summary[key] += other[key]
+    summary["gc_pause_ms_max"] = max(summary["gc_pause_ms_max"],
+        other["gc_pause_ms_max"])
+    return summary
+
+def parse_text(text, file_name, base_offset=0):
+    """Parse the log lines in ``text``, which started at ``base_offset``
+    in the file ``file_name``.
+
+    Returns a tuple of ({column : values}, summary) where the string columns
+    are (codes, dictionary) tuples that can be appended to a
+    :class:`columnar.Table`.
+    """
+
+    columns = dict(
+        (name, [] if typecode == columnar.STRING else array.array(typecode))
+        for name, typecode in EVENT_COLUMNS
+    )
+    encoders = dict(
+        (name, columnar.StringEncoder())
+        for name, typecode in EVENT_COLUMNS
+        if typecode == columnar.STRING
+    )
+    summary = new_summary()
+    epochs = {}
+
+    ts_col, kind_col, value_col, offset_col = (columns["ts"],
+        columns["kind"], columns["value"], columns["offset"])
+    level_enc, thread_enc, source_enc, subject_enc = (
+        encoders["level"].encode, encoders["thread"].encode,
+        encoders["source"].encode, encoders["subject"].encode)
+    level_col, thread_col, source_col, subject_col = (columns["level"],
+        columns["thread"], columns["source"], columns["subject"])
+
+    for match in LINE_RE.finditer(text):
+        level, thread, ts, ms, source, message = match.group("level",
+            "thread", "ts", "ms", "source", "message")
+
+        # Lots of lines are logged each second, so cache the conversion.
+        epoch = epochs.get(ts)
+        if epoch is None:
+            epoch = epochs[ts] = time.mktime(time.strptime(ts,
+                "%Y-%m-%d %H:%M:%S"))
+        kind, subject, value = classify(source, message)
+
+        ts_col.append(epoch + int(ms) / 1000.0)
+        level_col.append(level_enc(level))
+        thread_col.append(thread_enc(thread))
+        source_col.append(source_enc(source))
+        kind_col.append(kind)
+        subject_col.append(subject_enc(subject))
+        value_col.append(value)
+        offset_col.append(base_offset + match.start())
+
+        if kind:
+            kind_name = KINDS[kind]
+            summary["kinds"][kind_name] += 1
+            if kind_name == "gc_pause":
+                summary["gc_pause_ms_total"] += value
+                summary["gc_pause_ms_max"] = max(summary["gc_pause_ms_max"],
+                    value)
+            elif kind_name == "dropped":
+                summary["dropped"][subject] += int(value)
+            elif kind_name == "compaction":
+                summary["compacted_bytes"] += value
+            elif kind_name == "flush":
+                summary["flushed_bytes"] += value
+
+    rows = len(ts_col)
+    summary["lines"] = rows
+    if rows:
+        summary["first_ts"] = ts_col[0]
+        summary["last_ts"] = ts_col[-1]
+    for name, encoder in encoders.iteritems():
+        if name == "file":
+            continue
+        codes = array.array(columnar.CODE_TYPE, columns[name])
+        columns[name] = (codes, encoder.values)
+        if name == "level":
+            values = encoder.values
+            summary["levels"].update(values[c] for c in codes)
+    columns["file"] = columnar.repeat_string(file_name, rows)
+    return (columns, summary)
+
+def parse_range(job):
+    """Parse the bytes between ``start`` and ``end`` of the file at ``path``
+    from the ``job`` tuple of (path, file_name, start, end).
+
+    Used by the worker processes, the file is mapped so only the range is
+    read.
+    """
+
+    path, file_name, start, end = job
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            text = mapped[start:end]
+        finally:
+            mapped.close()
+    return parse_text(text, file_name, start)
+
+def chunk_ranges(path, chunk_size, file_name=None):
+    """Split the file at ``path`` into chunks of about ``chunk_size`` bytes
+    that end at a line boundary.
+
+    Returns a list of (path, file_name, start, end) tuples, ``file_name`` 
+    is stored in the events and defaults to the base name of ``path``.
+    """
+
+    if file_name is None:
+        file_name = os.path.basename(path)
+
+    size = os.path.getsize(path)
+    if not size:
+        return []
+
+    ranges = []
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            start = 0
+            while start < size:
+                end = min(start + chunk_size, size)
+                if end < size:
+                    newline = mapped.find(b"\n", end)
+                    end = size if newline == -1 else newline + 1
+                ranges.append((path, file_name, start, end))
+                start = end
+        finally:
+            mapped.close()
+    return ranges
+
+def iter_stream_chunks(reader, chunk_size):
+    """Yields tuples of (offset, text) for chunks of about ``chunk_size``
+    that end on a line boundary read from the file like ``reader``.
+
+    Used for compressed logs that cannot be mapped.
+    """
+
+    offset = 0
+    pending = b""
+    while True:
+        data = reader.read(chunk_size)
+        if not data:
+            break
+        data = pending + data
+        newline = data.rfind(b"\n")
+        if newline == -1:
+            pending = data
+            continue
+        pending = data[newline + 1:]
+        yield (offset, data[:newline + 1])
+        offset += newline + 1
+    if pending:
+        yield (offset, pending)
@@ -3,14 +3,17 @@
 Tasks are the things commands run. They take input from the node or other 
 tasks outputs and write output files. For example collecting logs.
 """
+import argparse
+import hashlib
+import json
 import logging
 import os.path
 import shlex
-import subprocess
+import shutil
+import tempfile
+import time
 
-import yaml
-
-import file_util
+import file_util, perf, process_util, serializer
 
 # ============================================================================
 # 
@@ -24,9 +27,27 @@ class Task(object):
     description = ""
     """Description of the task."""
     
+    inputs = []
+    """Names of the tasks whose output this task reads, it is run after 
+    them when they run in the same checkup, see :mod:`scheduler`."""
+    
+    version = 1
+    """Version of the task output. Increase it when a change to the task 
+    changes its output, so output cached by the old version is not used."""
+    
     # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
     # virtual and abstract 
     
+    @classmethod
+    def add_arguments(cls, parser):
+        """Called to add the task specific arguments to the ``parser`` for 
+        the command that runs the task. 
+        
+        Tasks share the args with the command so option names must be unique
+        across all tasks.
+        """
+        return
+    
     def __init__(self, args):
         self.args = args
         self.task_dir = os.path.abspath(os.path.join(self.args.check_dir, 
@@ -35,35 +56,156 @@ class Task(object):
         file_util.ensure_dir(self.task_dir)
         self.log.debug("Using output dir {self.task_dir} for task "\
             "{self.name}".format(self=self))
-        self.receipt = TaskReceipt(self.name, self.task_dir)
+        self.receipt = TaskReceipt(self.name, self.task_dir, 
+            fmt=self.args.receipt_format)
+        self.measurement = perf.Measurement()
+        
+        self.input_receipts = {}
+        """Receipts for the ``inputs`` that ran in this checkup, set by the
+        scheduler before the task runs."""
         
     def __call__(self):
-        self._do_task()
+        """Runs the task and records the resources it used in the receipt. 
+        """
+        
+        self.measurement.start()
+        try:
+            self.clear_output()
+            self._do_task()
+        finally:
+            self.receipt.perf = self.measurement.stop()
+            self.log.debug("Task {self.name} used {self.receipt.perf}".format(
+                self=self))
         return self.task_dir
 
     def _do_task(self):
         raise NotImplementedError()
 
+    def clear_output(self):
+        """Remove the output left in the task dir by an earlier run in the
+        same checkup. 
+        
+        Task output is never changed in place, a task writes new files so 
+        output hard linked into the :mod:`task_cache` is not changed.
+        """
+        
+        for name in os.listdir(self.task_dir):
+            if TaskReceipt.is_receipt_file(name):
+                continue
+            path = os.path.join(self.task_dir, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        return
+
+    def _cache_inputs(self):
+        """Returns a JSON serialisable description of everything the output
+        of the task depends on, other than its options, for example the 
+        inode, size and mtime of the files it reads. 
+        
+        Returns None if the output cannot be cached, which is the default.
+        """
+        return None
+    
+    # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+    # Caching. 
+    
+    def fingerprint(self):
+        """Returns a digest of the task version, options and inputs that 
+        identifies its output in the :mod:`task_cache`, or None if the 
+        output cannot be cached.
+        """
+        
+        inputs = self._cache_inputs()
+        if inputs is None:
+            return None
+        
+        # the options are the args added by the task.
+        parser = argparse.ArgumentParser(add_help=False, 
+            conflict_handler="resolve")
+        type(self).add_arguments(parser)
+        options = dict(
+            (action.dest, getattr(self.args, action.dest, None))
+            for action in parser._actions
+        )
+        data = {
+            "name" : self.name,
+            "version" : self.version,
+            "options" : options,
+            "inputs" : inputs,
+        }
+        return hashlib.sha1(json.dumps(data, sort_keys=True, 
+            default=str)).hexdigest()
+    
+    def _file_inputs(self, paths):
+        """Returns a list describing the files at ``paths`` for 
+        :meth:`_cache_inputs`, using their inode, size and mtime."""
+        
+        inputs = []
+        for path in sorted(paths):
+            st = os.stat(path)
+            inputs.append((path, st.st_dev, st.st_ino, st.st_size, 
+                st.st_mtime))
+        return inputs
+
     # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
     # Utilities. 
 
-    def _exec_cmd(self, cmd_line):
+    def _exec_cmd(self, cmd_line, out_path=None, timeout=None):
         """Executes the ``cmd_line``. 
         
+        If ``out_path`` is specified stdout is written to that file as the
+        command runs and the path is returned, otherwise stdout is returned.
+        The command is killed if it runs for longer than ``timeout`` 
+        seconds, which defaults to the ``exec_timeout`` arg. 
+        
+        Raises a :exc:`RuntimeError` if the command does not exit with 0. 
+        The command and its timing are recorded in the receipt.
         """
 
         split_line = shlex.split(str(cmd_line))
-        self.log.debug("Executing command {split_line}".format(
-            split_line=split_line))
-        
-        process = subprocess.Popen(split_line, 
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        std_out, std_err = process.communicate()
-        if std_err:
-            raise RuntimeError("Error running command {cmd_line}: "\
-                "{error}".format(cmd_line=cmd_line, error=std_out or std_err))
-                
-        return std_out
+        if timeout is None:
+            timeout = getattr(self.args, "exec_timeout", None)
+        self.log.debug("Executing command {split_line} with timeout "\
+            "{timeout}".format(split_line=split_line, timeout=timeout))
+        
+        start = time.time()
+        if out_path:
+            with open(out_path, "wb") as out_file:
+                result = process_util.run(split_line, out_file, 
+                    timeout=timeout)
+            out_bytes = os.path.getsize(out_path)
+        else:
+            with tempfile.TemporaryFile() as out_file:
+                result = process_util.run(split_line, out_file, 
+                    timeout=timeout)
+                out_file.seek(0)
+                std_out = out_file.read()
+            out_bytes = len(std_out)
+        elapsed = time.time() - start
+        self.measurement.add_subprocess(elapsed)
+        
+        self.receipt.commands.append({
+            "cmd" : cmd_line,
+            "rv" : result.rv,
+            "seconds" : round(elapsed, 6),
+            "stdout_bytes" : out_bytes,
+            "timed_out" : result.expired,
+        })
+        
+        if result.expired:
+            raise RuntimeError("Command {cmd_line} timed out after "\
+                "{timeout}s".format(cmd_line=cmd_line, timeout=timeout))
+        if result.rv != 0:
+            raise RuntimeError("Error {rv} running command {cmd_line}: "\
+                "{error}".format(rv=result.rv, cmd_line=cmd_line, 
+                error=result.stderr.strip()))
+        if result.stderr:
+            self.log.warn("Command {cmd_line} wrote to stderr: "\
+                "{error}".format(cmd_line=cmd_line, 
+                error=result.stderr[:1024].strip()))
+        return out_path if out_path else std_out
 
     def _write_output(self, content):
         """Write the output for the task. 
@@ -84,16 +226,34 @@ class TaskReceipt(object):
     """Recipt about a task that was run."""
     log = logging.getLogger("%s.%s" % (__name__, "TaskReceipt"))
     
-    def __init__(self, name, task_dir, error=None):
+    file_names = serializer.file_names("receipt")
+    """Names for the receipt file, one for each serialisation format."""
+    
+    def __init__(self, name, task_dir, error=None, fmt="yaml"):
         self.name = name 
         self.error = error
         self.task_dir = task_dir
         self.report_on = True
+        self.stats = {}
+        self.files = []
+        self.perf = {}
+        self.commands = []
+        self.node = None
+        self.cached = False
+        self._fmt = fmt
     
+    @property
+    def label(self):
+        """Name to show for the receipt, includes the node it is from."""
+        
+        if self.node:
+            return "{self.node}/{self.name}".format(self=self)
+        return self.name
+
     @classmethod
     def is_receipt_file(cls, path):
         _, file_name = os.path.split(path)
-        return file_name == "receipt.yaml"
+        return file_name in cls.file_names
 
     @classmethod
     def maybe_load(cls, path):
@@ -106,26 +266,122 @@ class TaskReceipt(object):
             return None
             
         cls.log.debug("Reading TaskReceipt {path}".format(path=path))
-        with open(path, "r") as f:
-            data = yaml.load(f)
+        receipt = cls.from_dict(serializer.load(path), path)
+        receipt._fmt = serializer.path_format(path)
+        return receipt
+    
+    @classmethod
+    def from_dict(cls, data, source):
+        """Create a receipt from the ``data`` read from ``source``."""
         
         receipt = TaskReceipt(data["name"], data["task_dir"])
         for k, v in data.iteritems():
             if hasattr(receipt, k):
                 setattr(receipt, k, v)
             else:
-                cls.log.debug("Unkown property {k} in receipt file "\
-                    "{path}".format(k=k, path=path))
+                cls.log.debug("Unkown property {k} in receipt from "\
+                    "{source}".format(k=k, source=source))
         return receipt
+    
+    def to_dict(self):
+        """Returns a dict of the receipt properties to serialise. 
+        
+        Errors are stored as a message so they can be read without 
+        loading python objects.
+        """
+        
+        data = dict(
+            (k, v)
+            for k, v in vars(self).iteritems()
+            if not k.startswith("_")
+        )
+        if isinstance(self.error, BaseException):
+            data["error"] = "{name}: {error}".format(
+                name=type(self.error).__name__, error=self.error)
+        return data
+    
+    def update_files(self):
+        """Update the list of output files in the task_dir, with their size
+        and sha1 digest. 
+        """
+        
+        files = []
+        for file_name in sorted(os.listdir(self.task_dir)):
+            path = os.path.join(self.task_dir, file_name)
+            if not os.path.isfile(path) or self.is_receipt_file(path):
+                continue
+            files.append({
+                "name" : file_name,
+                "size" : os.path.getsize(path),
+                "sha1" : file_util.file_digest(path),
+            })
+        self.files = files
+        return files
         
     def write(self):
         """Writes the task receipt to the current task_dir."""
         
         assert os.path.isdir(self.task_dir)
-        out_file = os.path.join(self.task_dir, "receipt.yaml")
+        self.update_files()
+        out_file = os.path.join(self.task_dir, 
+            "receipt" + serializer.FORMAT_EXTENSIONS[self._fmt])
         self.log.debug("Writing task receipt for {self.name} to "\
             "{out_file}".format(self=self, out_file=out_file))
 
-        with open(out_file, "w") as f:
-            yaml.dump(vars(self), stream=f, default_flow_style=False)
-        return out_file
\ No newline at end of file
+        serializer.dump(self.to_dict(), out_file)
+        return out_file
+
+# ============================================================================
+# 
+
+class ReceiptManifest(object):
+    """Index of the receipts for the tasks a command ran.
+    
+    The manifest is written in the command output dir so the receipts and 
+    their output files can be found with a single read rather than walking
+    the directories. Task dirs are stored relative to the manifest so the 
+    output can be moved. 
+    """
+    log = logging.getLogger("%s.%s" % (__name__, "ReceiptManifest"))
+    
+    base_name = "manifest"
+    
+    @classmethod
+    def write(cls, manifest_dir, receipts, fmt="yaml"):
+        """Writes a manifest for the ``receipts`` in ``manifest_dir`` using
+        the serialisation format ``fmt``."""
+        
+        entries = []
+        for receipt in sorted(receipts, key=lambda r: (r.node, r.name)):
+            data = receipt.to_dict()
+            data["task_dir"] = os.path.relpath(receipt.task_dir, 
+                manifest_dir)
+            entries.append(data)
+        
+        path = os.path.join(manifest_dir, 
+            cls.base_name + serializer.FORMAT_EXTENSIONS[fmt])
+        cls.log.debug("Writing manifest for {count} receipts to "\
+            "{path}".format(count=len(entries), path=path))
+        return serializer.dump({"receipts" : entries}, path)
+    
+    @classmethod
+    def load(cls, manifest_dir):
+        """Loads the manifest in ``manifest_dir``.
+        
+        Returns None if there is no manifest, or a list of 
+        :class:`TaskReceipt`.
+        """
+        
+        path = serializer.find(manifest_dir, cls.base_name)
+        if path is None:
+            return None
+        
+        cls.log.debug("Reading manifest {path}".format(path=path))
+        data = serializer.load(path) or {}
+        
+        receipts = []
+        for entry in data.get("receipts", []):
+            entry["task_dir"] = os.path.normpath(os.path.join(manifest_dir, 
+                entry["task_dir"]))
+            receipts.append(TaskReceipt.from_dict(entry, path))
+        return receipts
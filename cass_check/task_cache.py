@@ -0,0 +1,202 @@
+"""Cache of task output so tasks whose inputs have not changed are not run
+again.
+
+A task that can be cached returns a fingerprint of its inputs from
+:meth:`task.Task.fingerprint`, covering its version, options and the
+inode, size and mtime or digest of the files it reads. The output of a
+task is stored in ``<output-base>/cache/tasks/<fingerprint>``, when a later
+checkup has a task with the same fingerprint the files are linked back into
+the task dir instead of running the task and the receipt is marked as
+cached.
+
+Files are hard linked between the task dir and the cache where they are on
+the same file system, so a cache hit and storing an entry do not write the
+output again, see :func:`file_util.stage_file`. Task output is immutable,
+:meth:`task.Task.clear_output` removes the files from an earlier run before
+a task runs or is restored so they are replaced rather than written
+through to the cache.
+
+Entries that have not been used for ``max_age_days`` are evicted, then the
+least recently used entries until the cache is under ``max_mb``.
+"""
+import json
+import logging
+import os
+import os.path
+import shutil
+import time
+
+import file_util, task
+
+log = logging.getLogger(__name__)
+
+ENTRY_FILE = "entry.json"
+"""File in each cache entry with the receipt details."""
+
+def add_arguments(parser):
+    """Add the task cache options to ``parser``."""
+
+    parser.add_argument("--no-cache", dest="no_cache", default=False,
+        action="store_true",
+        help="Always run tasks rather than using cached output.")
+    parser.add_argument("--cache-max-age-days", dest="cache_max_age_days",
+        type=float, default=30,
+        help="Evict cached task output not used for this many days.")
+    parser.add_argument("--cache-max-mb", dest="cache_max_mb", type=float,
+        default=10240,
+        help="Evict the least recently used task output when the cache is "\
+            "bigger than this.")
+    return
+
+def _walk_files(root):
+    """Yields the paths of the files under ``root`` relative to it."""
+
+    for dir_path, _, file_names in os.walk(root):
+        for file_name in file_names:
+            yield os.path.relpath(os.path.join(dir_path, file_name), root)
+
+# ============================================================================
+#
+
+class TaskCache(object):
+    """Task output cache in ``cache_dir``."""
+
+    log = logging.getLogger("%s.%s" % (__name__, "TaskCache"))
+
+    def __init__(self, cache_dir, max_age_days=30, max_mb=10240):
+        self.cache_dir = cache_dir
+        self.max_age_days = max_age_days
+        self.max_mb = max_mb
+
+    @classmethod
+    def from_args(cls, args):
+        """Returns the :class:`TaskCache` for the command line ``args``, or
+        None if caching is disabled."""
+
+        if getattr(args, "no_cache", False):
+            return None
+        return cls(os.path.join(args.output_base, "cache", "tasks"),
+            max_age_days=args.cache_max_age_days, max_mb=args.cache_max_mb)
+
+    def _entry_dir(self, fingerprint):
+        return os.path.join(self.cache_dir, fingerprint[:2], fingerprint)
+
+    def restore(self, t, fingerprint):
+        """Link the cached output for ``fingerprint`` into the task dir of
+        the task ``t`` and update its receipt.
+
+        Returns False if there is no usable entry.
+        """
+
+        entry_dir = self._entry_dir(fingerprint)
+        entry_path = os.path.join(entry_dir, ENTRY_FILE)
+        try:
+            with open(entry_path, "rb") as f:
+                entry = json.load(f)
+            files_dir = os.path.join(entry_dir, "files")
+            t.clear_output()
+            for rel_path in _walk_files(files_dir):
+                if task.TaskReceipt.is_receipt_file(rel_path):
+                    continue
+                dest = os.path.join(t.task_dir, rel_path)
+                file_util.ensure_dir(os.path.dirname(dest))
+                file_util.stage_file(os.path.join(files_dir, rel_path), dest)
+            # mark as used for eviction
+            os.utime(entry_path, None)
+        except (EnvironmentError, ValueError) as e:
+            # missing, or evicted while we were reading it.
+            self.log.debug("No cached output for {t.name} with "\
+                "{fingerprint}: {e}".format(t=t,
+                fingerprint=fingerprint, e=e))
+            return False
+
+        t.receipt.stats = entry["stats"]
+        t.receipt.cached = True
+        self.log.info("Using cached output for {t.name} from "\
+            "{entry_dir}".format(t=t, entry_dir=entry_dir))
+        return True
+
+    def store(self, t, fingerprint):
+        """Store the output of the task ``t`` as ``fingerprint``, the
+        receipt is not stored.
+
+        The entry is built in a temp dir and renamed into place, so other
+        checkups never see part of an entry.
+        """
+
+        entry_dir = self._entry_dir(fingerprint)
+        if os.path.exists(entry_dir):
+            return
+        tmp_dir = "{entry_dir}.tmp.{pid}".format(entry_dir=entry_dir,
+            pid=os.getpid())
+        size = 0
+        try:
+            file_util.ensure_dir(tmp_dir)
+            files_dir = os.path.join(tmp_dir, "files")
+            for rel_path in _walk_files(t.task_dir):
+                if task.TaskReceipt.is_receipt_file(rel_path):
+                    continue
+                dest = os.path.join(files_dir, rel_path)
+                file_util.ensure_dir(os.path.dirname(dest))
+                file_util.stage_file(os.path.join(t.task_dir, rel_path),
+                    dest)
+                size += os.path.getsize(dest)
+            with open(os.path.join(tmp_dir, ENTRY_FILE), "wb") as f:
+                json.dump({
+                    "name" : t.name,
+                    "version" : t.version,
+                    "stats" : t.receipt.stats,
+                    "size" : size,
+                    "created" : time.time(),
+                }, f, indent=2, default=str)
+            os.rename(tmp_dir, entry_dir)
+        except (EnvironmentError) as e:
+            # Another checkup may have stored it first, and the task output
+            # is fine without the cache.
+            self.log.warn("Could not cache the output of {t.name}: "\
+                "{e}".format(t=t, e=e))
+        finally:
+            if os.path.exists(tmp_dir):
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        return
+
+    def evict(self):
+        """Remove entries older than the max age, then the least recently
+        used entries until the cache is under the max size.
+
+        Returns the number of entries removed.
+        """
+
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        entries = []
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                entry_path = os.path.join(prefix_dir, name, ENTRY_FILE)
+                try:
+                    with open(entry_path, "rb") as f:
+                        size = json.load(f)["size"]
+                    used = os.path.getmtime(entry_path)
+                except (EnvironmentError, ValueError, KeyError):
+                    # being written, or damaged and left to age out.
+                    continue
+                entries.append((used, size, os.path.dirname(entry_path)))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        oldest = time.time() - self.max_age_days * 86400
+        max_bytes = self.max_mb * 1024 * 1024
+        removed = 0
+        for used, size, entry_dir in entries:
+            if used >= oldest and total <= max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            removed += 1
+        if removed:
+            self.log.info("Evicted {removed} task cache entries, "\
+                "{total} bytes left".format(removed=removed, total=total))
+        return removed
@@ -0,0 +1,61 @@
+<!DOCTYPE html>
+<html lang="en">
+  <head>
+    <meta charset="utf-8">
+    <title>${self.title() | n}</title>
+    <meta name="description" content="">
+    <meta name="author" content="">
+
+    <!-- Le HTML5 shim, for IE6-8 support of HTML elements -->
+    <!--[if lt IE 9]>
+      <script src="http://html5shim.googlecode.com/svn/trunk/html5.js"></script>
+    <![endif]-->
+
+    <!-- Le styles -->
+    <link href="${root}assets/bootstrap.min.css" rel="stylesheet">
+
+    <!-- Le fav and touch icons -->
+    <!--
+    <link rel="shortcut icon" href="/static/images/favicon.ico">
+    <link rel="apple-touch-icon" href="/static/images/apple-touch-icon.png">
+    <link rel="apple-touch-icon" sizes="72x72" href="/static/images/apple-touch-icon-72x72.png">
+    <link rel="apple-touch-icon" sizes="114x114" href="/static/images/apple-touch-icon-114x114.png">
+    -->
+  </head>
+
+  <body >
+
+    <div class="navbar" data-dropdown="dropdown">
+      <div class="navbar-inner">
+        <div class="container">
+          <a class="brand" href="${root}index.html">Cassandra Checkup</a>
+        </div>
+      </div>
+    </div>
+
+    <div class="container">
+      ${self.body() | n}
+    </div>
+
+    <script src="${root}assets/jquery-1.8.3.min.js"></script>
+    <script src="${root}assets/bootstrap.min.js"></script>
+    <script>
+      // Sort the rows of a sortable table on the clicked column, numbers
+      // are sorted as numbers. Clicking again reverses the order.
+      $("table.sortable th").css("cursor", "pointer").click(function() {
+        var th = $(this), col = th.index(), tbody = th.closest("table").find("tbody");
+        var desc = !th.data("desc");
+        th.data("desc", desc);
+        var rows = tbody.find("tr").get().sort(function(a, b) {
+          var x = $(a).children().eq(col).data("sort");
+          var y = $(b).children().eq(col).data("sort");
+          var cmp = (typeof x === "number" && typeof y === "number") ? x - y : String(x).localeCompare(String(y));
+          return desc ? -cmp : cmp;
+        });
+        tbody.append(rows);
+      });
+    </script>
+  </body>
+</html>
+
+<%def name="title()">Cassandra Checkup Report XX-TIME-XX</%def>
@@ -0,0 +1,40 @@
+<%def name="render_stat(value)">
+  % if isinstance(value, dict):
+    ${", ".join("{0}: {1}".format(k, format_stat(v)) for k, v in sorted(value.items()))}
+  % elif isinstance(value, list) and value and isinstance(value[0], dict):
+    <% keys = sorted(set(k for row in value for k in row)) %>
+    <table class="table table-condensed">
+      <thead>
+        <tr>
+          % for k in keys:
+            <th>${k}</th>
+          % endfor
+        </tr>
+      </thead>
+      <tbody>
+        % for row in value:
+          <tr>
+            % for k in keys:
+              <td>${format_stat(row.get(k))}</td>
+            % endfor
+          </tr>
+        % endfor
+      </tbody>
+    </table>
+  % elif isinstance(value, list):
+    ${", ".join(format_stat(v) for v in value)}
+  % else:
+    ${format_stat(value)}
+  % endif
+</%def>
+
+<%!
+    def format_stat(value):
+        if value is None:
+            return "-"
+        if isinstance(value, float):
+            return "{0:,.3f}".format(value)
+        if isinstance(value, (int, long)) and not isinstance(value, bool):
+            return "{0:,}".format(value)
+        return unicode(value)
+%>
@@ -1,75 +1,67 @@
-<!DOCTYPE html>
-<html lang="en">
-  <head>
-    <meta charset="utf-8">
-    <title>Cassandra Checkup Report XX-TIME-XX</title>
-    <meta name="description" content="">
-    <meta name="author" content="">
+<%inherit file="base.mako"/>
 
-    <!-- Le HTML5 shim, for IE6-8 support of HTML elements -->
-    <!--[if lt IE 9]>
-      <script src="http://html5shim.googlecode.com/svn/trunk/html5.js"></script>
-    <![endif]-->
+      % if search:
+        <form class="form-search" action="/search">
+          <input type="text" name="q" class="input-xlarge search-query" placeholder="Search the logs">
+          <button type="submit" class="btn">Search</button>
+          <span class="help-inline">Needs the report to be opened with cass-check serve.</span>
+        </form>
+      % endif
 
-    <!-- Le styles -->
-    <link href="assets/bootstrap.min.css" rel="stylesheet">
-
-    <!-- Le fav and touch icons -->
-    <!-- 
-    <link rel="shortcut icon" href="/static/images/favicon.ico">
-    <link rel="apple-touch-icon" href="/static/images/apple-touch-icon.png">
-    <link rel="apple-touch-icon" sizes="72x72" href="/static/images/apple-touch-icon-72x72.png">
-    <link rel="apple-touch-icon" sizes="114x114" href="/static/images/apple-touch-icon-114x114.png">
-    -->
-  </head>
-
-  <body >
-
-    <div class="navbar" data-dropdown="dropdown">
-      <div class="navbar-inner">
-        <div class="container">
-          <a class="brand" href="/">Cassandra Checkup</a>
-        </div>
-      </div>
-    </div>
-    
-    <div class="container">
-      <table class="table table-striped">
+      <table class="table table-striped sortable">
         <caption>Cassandra Checkup output for XX TIME XX</caption>
         <thead>
           <tr>
             <th>Task</th>
-            <th>Output</th>
+            <th>Result</th>
+            <th>Files</th>
           </tr>
         </thead>
         <tbody>
-          % for receipt, files in receipt_files.iteritems():
+          % for receipt in sorted(receipt_files, key=lambda r: r.label):
             <tr>
-              <td>
-                  ${receipt.name}
+              <td data-sort="${receipt.label}">
+                <a href="${task_pages[receipt]}">${receipt.label}</a>
               </td>
-              <td>
-                % if receipt.error:
+              % if receipt.error:
+                <td data-sort="error">
                   <span class="label label-important">Error</span>
                   ${receipt.error}
-                % else:
-                  <ul>
-                    % for file_name in files:
-                      <li>
-                        <a href="${file_name}">${file_name}</a>
-                      </li>
-                    %endfor
-                  </ul>
-                %endif
-              </td>
+                </td>
+              % else:
+                <td data-sort="ok">OK</td>
+              % endif
+              <td data-sort="${len(receipt_files[receipt])}">${len(receipt_files[receipt])}</td>
             </tr>
           % endfor
         </tbody>
       </table>
 
-    </div>
-    
-    <script src="assets/jquery-1.8.3.min.js"></script>
-    <script src="assets/bootstrap.min.js"></script>
-  </body>
-</html>
+      <table class="table table-striped table-condensed sortable">
+        <caption>Task performance, click a column to sort</caption>
+        <thead>
+          <tr>
+            <th>Task</th>
+            % for key, title in perf_fields:
+              <th>${title}</th>
+            % endfor
+          </tr>
+        </thead>
+        <tbody>
+          % for receipt in sorted(receipt_files, key=lambda r: r.label):
+            <tr>
+              <td data-sort="${receipt.label}">${receipt.label}</td>
+              % for key, title in perf_fields:
+                <% value = receipt.perf.get(key) %>
+                % if value is None:
+                  <td data-sort="-1">-</td>
+                % elif isinstance(value, float):
+                  <td data-sort="${value}">${"%.3f" % value}</td>
+                % else:
+                  <td data-sort="${value}">${"{0:,}".format(value)}</td>
+                % endif
+              % endfor
+            </tr>
+          % endfor
+        </tbody>
+      </table>
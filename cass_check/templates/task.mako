@@ -0,0 +1,52 @@
+<%inherit file="base.mako"/>
+<%namespace name="helpers" file="helpers.mako"/>
+
+<%def name="title()">Cassandra Checkup ${receipt.label}</%def>
+
+      <h2>${receipt.label}</h2>
+      % if receipt.error:
+        <p>
+          <span class="label label-important">Error</span>
+          ${receipt.error}
+        </p>
+      % endif
+
+      <table class="table table-striped">
+        <caption>Output files</caption>
+        <tbody>
+          % for file_name in files:
+            <tr>
+              <td><a href="${file_name}">${file_name.rsplit("/", 1)[-1]}</a></td>
+              <td>
+                <a href="${file_name}?view=page">page</a>
+                <a href="${file_name}?view=tail">tail</a>
+              </td>
+            </tr>
+          % endfor
+        </tbody>
+      </table>
+
+      % if receipt.stats and not receipt.error:
+        <table class="table table-condensed">
+          <caption>Statistics</caption>
+          <tbody>
+            % for key in sorted(receipt.stats):
+              <tr>
+                <th>${key}</th>
+                <td>${helpers.render_stat(receipt.stats[key]) | n}</td>
+              </tr>
+            % endfor
+          </tbody>
+        </table>
+      % endif
+
+      % if receipt.commands:
+        <table class="table table-condensed">
+          <caption>Commands</caption>
+          <tbody>
+            <tr>
+              <td>${helpers.render_stat(receipt.commands) | n}</td>
+            </tr>
+          </tbody>
+        </table>
+      % endif
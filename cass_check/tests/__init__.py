@@ -0,0 +1,5 @@
+"""Tests for cass-check, run with ``python setup.py test``."""
+import logging
+
+# tasks log warnings for the errors the tests cause.
+logging.getLogger("cass_check").addHandler(logging.NullHandler())
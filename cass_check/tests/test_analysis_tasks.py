@@ -0,0 +1,35 @@
+"""Tests for :mod:`analysis_tasks`."""
+import os
+import os.path
+
+from cass_check import columnar, fixtures
+from cass_check.tests import util
+
+class SystemLogAnalysisTaskTest(util.TempDirTestCase):
+
+    def test_events_name_file_in_collect_dir(self):
+        """Events record the path of their log relative to the collect dir,
+        so logs with the same name from different tasks or nodes are told
+        apart."""
+
+        log_dir = os.path.join(self.root, "logs")
+        fixtures.make_log_dir(log_dir, 256 * 1024)
+        nodetool = fixtures.write_fake_nodetool(os.path.join(self.root,
+            "bin", "nodetool"))
+        self.check_cass_check("--check-name", "c1", "collect", "--log-dir",
+            log_dir, "--nodetool", nodetool, "--no-history", "--no-cache")
+        self.check_cass_check("--check-name", "c1", "analyse",
+            "--no-history", "--no-cache", "--parse-processes", "2",
+            "--parse-chunk-mb", "1")
+
+        collect_dir = os.path.join(self.output_base, "c1", "collect")
+        expected = set(
+            os.path.relpath(os.path.join(dir_path, name), collect_dir)
+            for dir_path, _, names in os.walk(collect_dir)
+            for name in names
+            if name.startswith("system.log")
+        )
+        table = columnar.Table(os.path.join(self.output_base, "c1",
+            "analyse", "analyse-system-log", "events"))
+        self.assertEqual(2, len(expected))
+        self.assertEqual(expected, set(table.strings("file")))
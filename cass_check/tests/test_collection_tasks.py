@@ -0,0 +1,175 @@
+"""Tests for :mod:`collection_tasks`."""
+import argparse
+import os
+import os.path
+import threading
+
+from cass_check import collection_tasks, fixtures
+from cass_check.tests import util
+
+class NodetoolCollectionTaskTest(util.TempDirTestCase):
+
+    def setUp(self):
+        super(NodetoolCollectionTaskTest, self).setUp()
+        self.calls_path = os.path.join(self.root, "nodetool-calls")
+
+    def make_args(self, **kwargs):
+        """Returns the args for the nodetool tasks using a fake nodetool
+        created with ``kwargs``."""
+
+        nodetool = fixtures.write_fake_nodetool(os.path.join(self.root,
+            "bin", "nodetool"), calls_path=self.calls_path, **kwargs)
+        parser = argparse.ArgumentParser(conflict_handler="resolve")
+        collection_tasks.NodetoolCollectionTask.add_arguments(parser)
+        collection_tasks.ProxyHistogramsCollectionTask.add_arguments(parser)
+        args = parser.parse_args(["--nodetool", nodetool])
+        args.output_base = self.output_base
+        args.check_dir = os.path.join(self.output_base, "c1", "collect")
+        args.receipt_format = "yaml"
+        args.exec_timeout = 60
+        return args
+
+    def calls(self):
+        with open(self.calls_path) as f:
+            return sorted(f.read().splitlines())
+
+    def test_commands_run_once(self):
+        """Tasks running at the same time that need the same command share
+        one run of it."""
+
+        args = self.make_args(delay=0.5)
+        tasks = [
+            collection_tasks.NodetoolCollectionTask(args),
+            collection_tasks.ProxyHistogramsCollectionTask(args),
+        ]
+        threads = [threading.Thread(target=t) for t in tasks]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.calls(),
+            sorted(collection_tasks.NodetoolCollectionTask.subcommands))
+        self.assertEqual(tasks[0].receipt.stats["failed"], {})
+        self.assertIn("read_latency_us", tasks[1].receipt.stats)
+        for t in tasks:
+            self.assertTrue(os.listdir(t.task_dir))
+
+    def test_failed_command_in_stats(self):
+        """A command that fails is recorded and the others are collected."""
+
+        t = collection_tasks.NodetoolCollectionTask(self.make_args(
+            fail=["netstats"]))
+        t()
+
+        failed = t.receipt.stats["failed"]
+        self.assertEqual(failed.keys(), ["netstats"])
+        self.assertIn("Connection refused", failed["netstats"])
+        files = os.listdir(t.task_dir)
+        self.assertNotIn("netstats.txt", files)
+        self.assertIn("info.txt", files)
+
+    def test_all_commands_failed(self):
+        """The task only fails when every command failed."""
+
+        subcommands = collection_tasks.NodetoolCollectionTask.subcommands
+        t = collection_tasks.NodetoolCollectionTask(self.make_args(
+            fail=subcommands))
+        with self.assertRaises(RuntimeError) as cm:
+            t()
+        self.assertIn("All nodetool commands failed", str(cm.exception))
+        self.assertEqual(sorted(t.receipt.stats["failed"]),
+            sorted(subcommands))
+
+class IncrementalLogCollectionTest(util.TempDirTestCase):
+
+    def setUp(self):
+        super(IncrementalLogCollectionTest, self).setUp()
+        self.log_dir = os.path.join(self.root, "logs")
+        os.makedirs(self.log_dir)
+        self.log_path = os.path.join(self.log_dir, "system.log")
+        self.runs = 0
+
+    def write(self, data, mode="ab"):
+        with open(self.log_path, mode) as f:
+            f.write(data)
+
+    def collect(self):
+        """Run an incremental collection into a new checkup.
+
+        Returns {file name : (offset, bytes collected)}.
+        """
+
+        self.runs += 1
+        parser = argparse.ArgumentParser()
+        collection_tasks.LogCollectionTask.add_arguments(parser)
+        args = parser.parse_args(["--log-dir", self.log_dir,
+            "--incremental"])
+        args.output_base = self.output_base
+        args.check_dir = os.path.join(self.output_base,
+            "c{runs}".format(runs=self.runs), "collect")
+        args.receipt_format = "yaml"
+        t = collection_tasks.LogCollectionTask(args)
+        t()
+        return dict(
+            (f["file"], (f["offset"], f["raw_bytes"]))
+            for f in t.receipt.stats["files"]
+        )
+
+    def line(self, i):
+        return " INFO [main] 2012-11-27 10:00:{i:02d},000 "\
+            "CassandraDaemon.java (line 101) Line {i}\n".format(i=i)
+
+    def test_append_to_small_file(self):
+        """Only the appended data is collected, including from a file
+        smaller than the head used to detect inode reuse."""
+
+        self.write(self.line(0))
+        first = len(self.line(0))
+        self.assertLess(first, collection_tasks.LogCollectionTask.head_size)
+        self.assertEqual(self.collect(), {"system.log" : (0, first)})
+
+        appended = "".join(self.line(i) for i in range(1, 30))
+        self.write(appended)
+        self.assertEqual(self.collect(),
+            {"system.log" : (first, len(appended))})
+        self.assertEqual(self.collect(), {})
+
+    def test_rotation(self):
+        """A log renamed since the last run carries on from where it was."""
+
+        self.write("".join(self.line(i) for i in range(20)))
+        size = os.path.getsize(self.log_path)
+        self.collect()
+
+        self.write(self.line(20))
+        os.rename(self.log_path, self.log_path + ".1")
+        self.write(self.line(21))
+        self.assertEqual(self.collect(), {
+            "system.log.1" : (size, len(self.line(20))),
+            "system.log" : (0, len(self.line(21))),
+        })
+
+    def test_truncation(self):
+        """A log smaller than the checkpoint is collected from the start."""
+
+        self.write("".join(self.line(i) for i in range(20)))
+        self.collect()
+
+        self.write(self.line(0), mode="r+b")
+        with open(self.log_path, "r+b") as f:
+            f.truncate(len(self.line(0)))
+        self.assertEqual(self.collect(),
+            {"system.log" : (0, len(self.line(0)))})
+
+    def test_inode_reuse(self):
+        """A different file with the inode of a checkpoint is collected
+        from the start."""
+
+        self.write("".join(self.line(i) for i in range(20)))
+        self.collect()
+
+        # Write a new, longer, file over the same inode.
+        data = "".join(self.line(i) for i in range(30, 59))
+        self.write(data, mode="r+b")
+        self.assertEqual(self.collect(), {"system.log" : (0, len(data))})
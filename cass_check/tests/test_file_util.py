@@ -0,0 +1,35 @@
+"""Tests for :mod:`file_util`."""
+import gzip
+import os.path
+
+from cass_check import file_util
+from cass_check.tests import util
+
+class CopyGzipTest(util.TempDirTestCase):
+
+    def write_gzip(self, path, members, padding=b""):
+        """Write each of ``members`` as a gzip member to ``path``."""
+
+        with open(path, "wb") as f:
+            for data in members:
+                with gzip.GzipFile(fileobj=f, mode="wb") as member:
+                    member.write(data)
+            f.write(padding)
+
+    def test_counts_every_member(self):
+        """The size covers all members, not just the last one the gzip
+        trailer describes."""
+
+        src = os.path.join(self.root, "system.log.1.gz")
+        dest = os.path.join(self.root, "copy.gz")
+        members = [b"INFO line one\n" * 5000, os.urandom(70000),
+            b"WARN line two\n"]
+        self.write_gzip(src, members, padding=b"\0" * 8)
+
+        raw_bytes = file_util.copy_gzip(src, dest, chunk_size=4096)
+
+        self.assertEqual(sum(len(data) for data in members), raw_bytes)
+        with open(src, "rb") as f:
+            expected = f.read()
+        with open(dest, "rb") as f:
+            self.assertEqual(expected, f.read())
@@ -0,0 +1,44 @@
+"""Tests for :mod:`gc_log`."""
+import os.path
+
+from cass_check import fixtures, gc_log
+from cass_check.tests import util
+
+class ParseTest(util.TempDirTestCase):
+
+    def write_log(self, name, **kwargs):
+        """Write a GC log of a few collections, returns a tuple of (path, 
+        collections written)."""
+
+        path = os.path.join(self.root, name)
+        return (path, fixtures.write_gc_log(path, 4096, **kwargs))
+
+    def test_tenuring_distribution(self):
+        """Young collections split over several lines by the tenuring 
+        distribution are parsed along with single line ones."""
+
+        texts = []
+        written = 0
+        for name, tenuring in (("plain.log", False), ("tenuring.log", True)):
+            path, count = self.write_log(name, tenuring=tenuring)
+            with open(path, "rb") as f:
+                texts.append(f.read())
+            written += count
+        self.assertIn("Desired survivor", texts[1])
+
+        parsed = gc_log.parse_text("".join(texts))
+
+        uptime, young_before = parsed["collections"][:2]
+        self.assertEqual(written, len(uptime))
+        self.assertEqual(written, len(parsed["stopped"][0]))
+        self.assertTrue(all(v > 0 for v in young_before))
+
+    def test_entries_not_split_between_blocks(self):
+        """Parsing a file in small blocks finds every multi line 
+        collection."""
+
+        path, written = self.write_log("gc.log", tenuring=True)
+
+        parsed = gc_log.parse_file(path, chunk_size=100)
+
+        self.assertEqual(written, len(parsed["collections"][0]))
@@ -0,0 +1,143 @@
+"""Tests for :mod:`log_util`."""
+import os.path
+
+from cass_check import log_util
+from cass_check.tests import util
+
+TRACE = b"java.lang.RuntimeException: boom\n" + \
+    b"\tat org.apache.cassandra.Foo.bar(Foo.java:42)\n" * 10
+
+# ============================================================================
+#
+
+class WindowTest(util.TempDirTestCase):
+
+    def write_log(self, entries):
+        """Write a ``system.log`` with an entry for each (minute, trace)
+        in ``entries``, ``trace`` is the bytes of the lines without a
+        timestamp that follow it.
+
+        Returns a tuple of (path, bytes written).
+        """
+
+        lines = []
+        for minute, trace in entries:
+            lines.append(b" INFO [main] 2012-11-27 10:%02d:00,123 "\
+                b"CassandraDaemon.java (line 101) entry %d\n" % (minute,
+                minute))
+            lines.append(trace)
+        data = b"".join(lines)
+        path = os.path.join(self.root, "system.log")
+        with open(path, "wb") as f:
+            f.write(data)
+        return (path, data)
+
+    def check_windows(self, path, data, minutes):
+        """Check :func:`log_util.window_range` against a scan of every line
+        for windows between each of the ``minutes`` and outside the log."""
+
+        starts = []
+        pos = 0
+        for line in data.splitlines(True):
+            key = log_util.line_timestamp(line)
+            if key is not None:
+                starts.append((key, pos))
+            pos += len(line)
+
+        def first_after(key, strict):
+            for line_key, line_start in starts:
+                if line_key > key or (line_key == key and not strict):
+                    return line_start
+            return len(data)
+
+        keys = [None, "2012-11-27 09:00:00", "2012-11-27 11:00:00"] + \
+            ["2012-11-27 10:%02d:30" % m for m in minutes]
+        for since in keys:
+            for until in keys:
+                if since is not None and until is not None and since > until:
+                    continue
+                start, end = log_util.window_range(path, since, until)
+                for offset in (start, end):
+                    self.assertTrue(offset == 0 or
+                        data[offset - 1:offset] == b"\n",
+                        "window {0} is not at a line start".format(
+                            (since, until)))
+                expected_start = 0 if since is None else \
+                    first_after(since, False)
+                expected_end = len(data) if until is None else \
+                    first_after(until, True)
+                if expected_start >= expected_end:
+                    self.assertEqual(start, end, (since, until))
+                else:
+                    self.assertEqual((start, end), (expected_start,
+                        expected_end), (since, until))
+
+    def test_window_outside_log(self):
+        """Windows before the first line and after the last line are
+        empty."""
+
+        path, data = self.write_log([(m, b"") for m in range(10, 20)])
+        self.assertEqual(log_util.window_range(path, None,
+            "2012-11-27 09:00:00"), (0, 0))
+        self.assertEqual(log_util.window_range(path, "2012-11-27 09:00:00",
+            None), (0, len(data)))
+        self.assertEqual(log_util.window_range(path, "2012-11-27 11:00:00",
+            None), (len(data), len(data)))
+        self.assertEqual(log_util.window_range(path, "2012-11-27 10:30:00",
+            "2012-11-27 10:40:00"), (len(data), len(data)))
+
+    def test_window_in_stack_trace(self):
+        """A window that starts or ends inside a stack trace includes the
+        whole trace with the line it belongs to."""
+
+        path, data = self.write_log([(m, TRACE if m % 2 else b"")
+            for m in range(10, 20)])
+        start, end = log_util.window_range(path, "2012-11-27 10:11:30",
+            "2012-11-27 10:13:30")
+        window = data[start:end]
+        self.assertTrue(window.startswith(b" INFO [main] 2012-11-27 10:12"))
+        self.assertTrue(window.endswith(TRACE))
+        self.check_windows(path, data, range(9, 20))
+
+    def test_bisect_large_log(self):
+        """Windows are found when the log is bisected rather than
+        scanned."""
+
+        path, data = self.write_log([(m, TRACE * (m % 7) * 20)
+            for m in range(60)])
+        self.assertTrue(len(data) > 4 * log_util.SCAN_SIZE)
+        self.check_windows(path, data, range(0, 60, 3))
+
+    def test_gap_without_timestamps(self):
+        """Lines without timestamps longer than the scan size do not move
+        the window start or end off a line start."""
+
+        gap = TRACE * (3 * log_util.SCAN_SIZE // len(TRACE))
+        for gap_after in (0, 5, 9):
+            path, data = self.write_log([(m, gap if m == gap_after else b"")
+                for m in range(10)])
+            self.check_windows(path, data, range(10))
+
+    def test_filter_window(self):
+        """Lines without a timestamp are kept with the line before them,
+        the same lines as found by :func:`log_util.window_range`."""
+
+        _, data = self.write_log([(m, TRACE if m % 2 else b"")
+            for m in range(10, 14)])
+        lines = data.splitlines(True)
+        self.assertEqual(b"".join(log_util.filter_window(lines,
+            "2012-11-27 10:11:00", "2012-11-27 10:12:00")),
+            b"".join(lines[1:14]))
+        self.assertEqual(list(log_util.filter_window(lines, None,
+            "2012-11-27 09:00:00")), [])
+        self.assertEqual(list(log_util.filter_window(
+            [TRACE] + lines[:1], None, None)), lines[:1])
+
+        path, data = self.write_log([(m, TRACE * (m % 3))
+            for m in range(10, 20)])
+        lines = data.splitlines(True)
+        for since, until in [("2012-11-27 10:12:30", "2012-11-27 10:15:30"),
+                (None, "2012-11-27 10:13:00"), ("2012-11-27 10:13:00", None)]:
+            start, end = log_util.window_range(path, since, until)
+            self.assertEqual(b"".join(log_util.filter_window(lines, since,
+                until)), data[start:end])
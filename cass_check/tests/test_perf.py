@@ -0,0 +1,28 @@
+"""Tests for :mod:`perf`."""
+import os
+import os.path
+import unittest
+
+from cass_check import perf
+from cass_check.tests import util
+
+@unittest.skipIf(perf._io_bytes() is None, "IO counters not available")
+class MeasurementTest(util.TempDirTestCase):
+
+    def test_io_counters(self):
+        """Bytes passed to system calls are not reported as storage IO."""
+
+        path = os.path.join(self.root, "data")
+        data = b"x" * (1024 * 1024)
+        measurement = perf.Measurement().start()
+        with open(path, "wb") as f:
+            f.write(data)
+        with open(path, "rb") as f:
+            # The page cache serves the read.
+            self.assertEqual(data, f.read())
+        result = measurement.stop()
+
+        self.assertGreaterEqual(result["syscall_write_bytes"], len(data))
+        self.assertGreaterEqual(result["syscall_read_bytes"], len(data))
+        self.assertLess(result["read_bytes"], len(data))
+        self.assertIn("write_bytes", result)
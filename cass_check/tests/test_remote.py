@@ -0,0 +1,88 @@
+"""Tests for :mod:`remote` and ``collect --hosts``."""
+import os
+import os.path
+import pipes
+import stat
+import sys
+
+from cass_check import benchmarks, fixtures, remote, task
+from cass_check.tests import util
+
+LOCAL_EXEC = "sh -c {cmd}"
+"""Remote exec template that runs the collection on this machine."""
+
+class RemoteCollectTest(util.TempDirTestCase):
+
+    def setUp(self):
+        super(RemoteCollectTest, self).setUp()
+        self.log_dir = os.path.join(self.root, "logs")
+        fixtures.make_log_dir(self.log_dir, 64 * 1024)
+        self.nodetool = fixtures.write_fake_nodetool(os.path.join(self.root,
+            "bin", "nodetool"))
+        self.tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(self.tmp_dir)
+
+        # records the args the node is run with.
+        self.args_path = os.path.join(self.root, "remote-args")
+        self.remote_cass_check = os.path.join(self.root, "bin", "cass-check")
+        with open(self.remote_cass_check, "wb") as f:
+            f.write("#!/bin/sh\nfor arg in \"$@\"; do echo \"$arg\"; done "\
+                ">> {args_path}\nexec {python} -c {script} \"$@\"\n".format(
+                args_path=pipes.quote(self.args_path),
+                python=pipes.quote(sys.executable),
+                script=pipes.quote(benchmarks.STARTUP_SCRIPT)))
+        os.chmod(self.remote_cass_check, stat.S_IRWXU)
+
+    def collect(self, hosts, remote_exec=LOCAL_EXEC):
+        return self.cass_check("--check-name", "c1", "collect",
+            "--hosts", hosts, "--remote-exec", remote_exec,
+            "--remote-cass-check", self.remote_cass_check,
+            "--log-dir", self.log_dir, "--nodetool", self.nodetool,
+            "--no-history", env={"TMPDIR" : self.tmp_dir})
+
+    def test_nothing_left_on_node(self):
+        """The node only writes to the temp dir, which is removed."""
+
+        rv, out, err = self.collect("n1,n2")
+        self.assertEqual(rv, 0, err)
+        check_dir = os.path.join(self.output_base, "c1", "collect")
+        receipts = task.ReceiptManifest.load(check_dir)
+        self.assertEqual(sorted(set(r.node for r in receipts)), ["n1", "n2"])
+        self.assertFalse([r.label for r in receipts if r.error])
+
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+        with open(self.args_path) as f:
+            args = f.read().splitlines()
+        output_bases = [
+            args[i + 1]
+            for i, arg in enumerate(args)
+            if arg == "--output-base"
+        ]
+        self.assertEqual(len(output_bases), 2)
+        for output_base in output_bases:
+            self.assertTrue(output_base.startswith(self.tmp_dir + os.sep),
+                output_base)
+        self.assertEqual(args.count("--no-cache"), 2)
+        self.assertEqual(args.count("--no-history"), 2)
+
+    def test_failed_node_exits_non_zero(self):
+        """A node that cannot be collected from fails the command, and the
+        other nodes are still collected."""
+
+        fake_ssh = os.path.join(self.root, "bin", "ssh")
+        with open(fake_ssh, "wb") as f:
+            f.write("#!/bin/sh\nif [ \"$1\" = bad ]; then echo "\
+                "\"$1: unreachable\" >&2; exit 255; fi\nexec sh -c \"$2\"\n")
+        os.chmod(fake_ssh, stat.S_IRWXU)
+
+        rv, out, err = self.collect("good,bad", remote_exec=fake_ssh +
+            " {host} {cmd}")
+        self.assertEqual(rv, 1, err)
+        self.assertIn("Collection failed on 1 of 2 nodes: bad", out)
+        receipts = task.ReceiptManifest.load(os.path.join(self.output_base,
+            "c1", "collect"))
+        failed = [r for r in receipts if r.error]
+        self.assertEqual([(r.node, r.name) for r in failed],
+            [("bad", remote.HOST_TASK_NAME)])
+        self.assertIn("unreachable", failed[0].error)
+        self.assertTrue([r for r in receipts if r.node == "good"])
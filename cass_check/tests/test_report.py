@@ -0,0 +1,48 @@
+"""Tests for the report command."""
+import os
+import os.path
+
+from cass_check import fixtures, task
+from cass_check.tests import util
+
+class ReportTest(util.TempDirTestCase):
+
+    def test_text_is_escaped(self):
+        """Errors and stats, which can hold text from the logs or nodetool,
+        are HTML escaped in the pages."""
+
+        check_dir = os.path.join(self.output_base, "c1")
+        receipts = fixtures.make_check_dir(check_dir, 2, files_per_task=1,
+            file_size=1024)
+        receipts[0].error = "Error from <script>alert(1)</script>"
+        receipts[1].stats.update({
+            "<b>key</b>" : "<i>value</i>",
+            "rows" : [{"<th>" : "<td>"}],
+        })
+        for receipt in receipts:
+            receipt.write()
+        task.ReceiptManifest.write(os.path.join(check_dir, "collect"),
+            receipts)
+
+        self.check_cass_check("--check-dir", check_dir, "report")
+
+        report_dir = os.path.join(check_dir, "report")
+        pages = [os.path.join(report_dir, "index.html")] + [
+            os.path.join(dir_path, name)
+            for dir_path, _, names in os.walk(os.path.join(report_dir,
+                "pages"))
+            for name in names
+        ]
+        text = ""
+        for path in pages:
+            with open(path, "rb") as f:
+                text += f.read()
+        for raw in ("<script>alert", "<b>key", "<i>value", "<th><th>",
+            "<td><td>"):
+            self.assertNotIn(raw, text)
+        for escaped in ("&lt;script&gt;alert(1)", "&lt;b&gt;key",
+            "&lt;i&gt;value", "&lt;th&gt;", "&lt;td&gt;"):
+            self.assertIn(escaped, text)
+        # markup from the templates and their defs is not escaped.
+        self.assertIn('<table class="table table-condensed">', text)
+        self.assertNotIn("&lt;table", text)
@@ -0,0 +1,162 @@
+"""Tests for :mod:`scheduler`."""
+import argparse
+import logging
+import os.path
+import sys
+import threading
+import time
+
+from cass_check import scheduler, task
+from cass_check.tests import util
+
+# ============================================================================
+#
+
+class StubTask(task.Task):
+    """Task that sleeps for ``delay`` seconds then raises ``error`` if it is
+    set."""
+
+    log = logging.getLogger("%s.%s" % (__name__, "StubTask"))
+
+    def __init__(self, args, name, inputs=(), delay=0, error=None):
+        self.name = name
+        self.inputs = list(inputs)
+        self.delay = delay
+        self.error = error
+        self.finished = False
+        super(StubTask, self).__init__(args)
+
+    def _do_task(self):
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        self.finished = True
+
+class SchedulerTest(util.TempDirTestCase):
+
+    def setUp(self):
+        super(SchedulerTest, self).setUp()
+        parser = argparse.ArgumentParser()
+        task.Task.add_arguments(parser)
+        self.args = parser.parse_args([])
+        self.args.check_dir = self.output_base
+        self.args.receipt_format = "yaml"
+        self.args.fail_fast = False
+        self.started = []
+        self.lock = threading.Lock()
+
+    def make_task(self, name, inputs=(), **kwargs):
+        return StubTask(self.args, name, inputs, **kwargs)
+
+    def run_task(self, t):
+        """Runs ``t`` like :meth:`commands.TaskRunningCommand._try_run_task`.
+        """
+
+        with self.lock:
+            self.started.append(t.name)
+        try:
+            try:
+                t()
+            except (Exception) as e:
+                if self.args.fail_fast:
+                    raise
+                t.receipt.error = e
+            t.receipt.write()
+        except:
+            return sys.exc_info()
+        return None
+
+    def load_receipt(self, t):
+        return task.TaskReceipt.maybe_load(os.path.join(t.task_dir,
+            "receipt.yaml"))
+
+    def test_order_by_inputs(self):
+        """Tasks run after the tasks named in their inputs, inputs that are
+        not scheduled are ignored."""
+
+        for jobs in (1, 3):
+            self.started = []
+            c = self.make_task("c", ["b", "not-scheduled"])
+            b = self.make_task("b", ["a"], delay=0.05)
+            a = self.make_task("a", delay=0.05)
+            d = self.make_task("d")
+            sched = scheduler.Scheduler([c, b, a, d], self.run_task,
+                jobs=jobs)
+            self.assertEqual(sched.order, [a, d, b, c])
+            self.assertEqual(sched.run(), [])
+            self.assertTrue(self.started.index("a") <
+                self.started.index("b") < self.started.index("c"))
+            self.assertEqual(sorted(self.started), ["a", "b", "c", "d"])
+            self.assertTrue(all(t.finished for t in (a, b, c, d)))
+            self.assertEqual(c.input_receipts, {"b" : b.receipt})
+
+    def test_reject_cycles(self):
+        """Circular inputs and names used twice are rejected."""
+
+        tasks = [
+            self.make_task("a", ["c"]),
+            self.make_task("b", ["a"]),
+            self.make_task("c", ["b"]),
+            self.make_task("d"),
+        ]
+        with self.assertRaises(ValueError) as cm:
+            scheduler.Scheduler(tasks, self.run_task)
+        self.assertIn("a, b, c", str(cm.exception))
+
+        with self.assertRaises(ValueError):
+            scheduler.Scheduler([self.make_task("a"), self.make_task("a")],
+                self.run_task)
+        self.assertEqual(self.started, [])
+
+    def test_skip_dependents(self):
+        """Tasks that need a failed task, directly or not, are skipped and
+        their receipts written. Other tasks still run."""
+
+        for jobs in (1, 3):
+            self.started = []
+            a = self.make_task("a", error=ValueError("boom"))
+            b = self.make_task("b", ["a"])
+            c = self.make_task("c", ["b"])
+            d = self.make_task("d", ["a", "e"])
+            e = self.make_task("e", delay=0.05)
+            sched = scheduler.Scheduler([a, b, c, d, e], self.run_task,
+                jobs=jobs)
+            skipped = sched.run()
+
+            self.assertEqual(sorted(t.name for t in skipped), ["b", "c", "d"])
+            self.assertEqual(sorted(self.started), ["a", "e"])
+            self.assertTrue(e.finished)
+            for t in skipped:
+                receipt = self.load_receipt(t)
+                self.assertIn("Skipped as required task a failed",
+                    receipt.error)
+                self.assertIn("boom", receipt.error)
+            self.assertIn("boom", self.load_receipt(a).error)
+            self.assertIsNone(self.load_receipt(e).error)
+
+    def test_fail_fast(self):
+        """An error that stops the run is raised once the running tasks have
+        finished, no new tasks are started."""
+
+        self.args.fail_fast = True
+        for jobs in (1, 2):
+            self.started = []
+            a = self.make_task("a", delay=0.05, error=ValueError("boom"))
+            b = self.make_task("b", delay=0.3)
+            c = self.make_task("c")
+            d = self.make_task("d", ["b"])
+            sched = scheduler.Scheduler([a, b, c, d], self.run_task,
+                jobs=jobs)
+            with self.assertRaises(ValueError) as cm:
+                sched.run()
+            self.assertEqual(str(cm.exception), "boom")
+
+            if jobs == 1:
+                self.assertEqual(self.started, ["a"])
+                self.assertFalse(b.finished)
+            else:
+                # b was running when a failed and is left to finish
+                self.assertEqual(sorted(self.started), ["a", "b"])
+                self.assertTrue(b.finished)
+                self.assertIsNone(self.load_receipt(b).error)
+            self.assertFalse(c.finished or d.finished)
@@ -0,0 +1,58 @@
+"""Tests for :mod:`server`."""
+import os
+import os.path
+import threading
+import urllib2
+
+from cass_check import search_index, server
+from cass_check.tests import util
+
+class ServerTest(util.TempDirTestCase):
+
+    def setUp(self):
+        super(ServerTest, self).setUp()
+        report_dir = os.path.join(self.root, "report")
+        os.makedirs(report_dir)
+        log_path = os.path.join(report_dir, "system.log")
+        with open(log_path, "wb") as f:
+            f.write(" INFO [main] 2012-11-27 10:05:06,123 "\
+                "CassandraDaemon.java (line 101) Starting up\n")
+        index_dir = os.path.join(self.root, "index")
+        writer = search_index.IndexWriter(index_dir)
+        writer.add_file(log_path, report_path="system.log")
+        writer.close()
+
+        self.server = server.make_server(report_dir, port=0,
+            index_dir=index_dir)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def get(self, path):
+        """Returns a tuple of (status, body) for a GET of ``path``."""
+
+        url = "http://127.0.0.1:{port}{path}".format(
+            port=self.server.server_address[1], path=path)
+        try:
+            response = urllib2.urlopen(url)
+        except (urllib2.HTTPError) as e:
+            return (e.code, e.read())
+        return (response.getcode(), response.read())
+
+    def test_search(self):
+        status, body = self.get("/search?q=starting")
+        self.assertEqual(status, 200)
+        self.assertIn("1 lines matched", body)
+
+    def test_search_bad_limit(self):
+        """A limit that is not a positive number is a bad request."""
+
+        for limit in ("abc", "0", "-1"):
+            status, _ = self.get("/search?q=starting&limit=" + limit)
+            self.assertEqual(status, 400, limit)
+
+    def test_page_bad_lines(self):
+        status, _ = self.get("/system.log?view=page&lines=abc")
+        self.assertEqual(status, 400)
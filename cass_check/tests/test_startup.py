@@ -0,0 +1,47 @@
+"""Tests that starting ``cass-check`` only imports what it needs."""
+import json
+import os.path
+import subprocess
+import sys
+import unittest
+
+from cass_check.tests import util
+
+SLOW_MODULES = ["numpy", "tarfile", "BaseHTTPServer", "SimpleHTTPServer",
+    "mako", "pkg_resources", "yaml", "cass_check.columnar",
+    "cass_check.server", "cass_check.search_index", "cass_check.scheduler",
+    "cass_check.system_log", "cass_check.gc_log", "cass_check.histogram"]
+"""Modules that are slow to import and not needed to parse the args."""
+
+LAUNCHER = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))), "bin", "cass-check")
+"""The ``cass-check`` script installed by setup.py."""
+
+NOOP_SCRIPT = """\
+import json, sys
+launcher = sys.argv[1]
+sys.argv = ['cass-check'] + sys.argv[2:]
+try:
+    execfile(launcher, {"__name__" : "__main__"})
+except SystemExit:
+    pass
+sys.stderr.write(json.dumps(sorted(
+    name for name, module in sys.modules.items() if module is not None)))
+"""
+
+@unittest.skipUnless(os.path.exists(LAUNCHER), "not run from a checkout")
+class StartupTest(util.TempDirTestCase):
+
+    def test_noop_imports(self):
+        """The noop command run by the launcher does not import the modules
+        other commands need."""
+
+        env = dict(os.environ, CASS_CHECK_CACHE_DIR=os.path.join(self.root,
+            "cache"))
+        proc = subprocess.Popen([sys.executable, "-c", NOOP_SCRIPT,
+            LAUNCHER, "--log-file", os.devnull, "--output-base", self.output_base,
+            "noop"], env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = proc.communicate()
+        self.assertEqual(proc.returncode, 0, err)
+        modules = set(json.loads(err.splitlines()[-1]))
+        self.assertEqual(sorted(modules.intersection(SLOW_MODULES)), [])
@@ -0,0 +1,67 @@
+"""Tests for :mod:`system_log`."""
+import unittest
+
+from cass_check import system_log
+
+LOGBACK_LINES = """\
+INFO  [Service Thread] 2015-08-25 10:00:00,123 GCInspector.java:258 - ParNew GC in 250ms.  CMS Old Gen: 1 -> 2; Par Eden Space: 3 -> 4
+INFO  [Service Thread] 2019-08-25 10:00:01,123 GCInspector.java:284 - G1 Young Generation GC in 1247ms.  G1 Eden Space: 1 -> 0
+INFO  [ScheduledTasks:1] 2015-08-25 10:00:02,000 MessagingService.java:888 - MUTATION messages were dropped in last 5000 ms: 123 for internal timeout and 7 for cross node timeout
+INFO  [ScheduledTasks:1] 2019-08-25 10:00:02,000 MessagingService.java:1236 - READ messages were dropped in last 5000 ms: 3 internal and 2 cross node. Mean internal dropped latency: 5 ms and Mean cross-node dropped latency: 6 ms
+INFO  [CompactionExecutor:1] 2015-08-25 10:00:03,000 CompactionTask.java:141 - Compacting [SSTableReader(path='/var/lib/cassandra/data/ks/cf/ks-cf-ka-1-Data.db')]
+INFO  [CompactionExecutor:1] 2019-08-25 10:00:03,000 CompactionTask.java:155 - Compacting (3a5c1e40-c6b2-11e9-8d7a-0b8c1f2a3b4c) [/var/lib/cassandra/data/ks/cf-1/mc-1-big-Data.db:level=0, ]
+INFO  [CompactionExecutor:1] 2015-08-25 10:00:04,000 CompactionTask.java:274 - Compacted 4 sstables to [/var/lib/cassandra/data/ks/cf/ks-cf-ka-5,].  2,541,580 bytes to 2,000,000 (~78% of original) in 101ms = 23.998MB/s.  10 total partitions merged to 10.
+INFO  [CompactionExecutor:1] 2019-08-25 10:00:04,000 CompactionTask.java:241 - Compacted (3a5c1e40-c6b2-11e9-8d7a-0b8c1f2a3b4c) 4 sstables to [/var/lib/cassandra/data/ks/cf-1/mc-5-big,] to level=0.  2.5MiB to 2.000MiB (~80% of original) in 101ms.  Read Throughput = 23.998MiB/s
+INFO  [MemtableFlushWriter:1] 2015-08-25 10:00:05,000 Memtable.java:347 - Writing Memtable-peers@1234(0.123KiB serialized bytes, 5 ops, 0%/0% of on/off-heap limit)
+INFO  [MemtableFlushWriter:1] 2015-08-25 10:00:05,100 Memtable.java:382 - Completed flushing /var/lib/cassandra/data/system/peers-37f71aca/system-peers-ka-5-Data.db (5.5KB) for commitlog position ReplayPosition(segmentId=1, position=2)
+"""
+"""Lines in the logback layout from Cassandra 2.1 to 4.0."""
+
+class ParseTextTest(unittest.TestCase):
+
+    def events(self, text):
+        """Returns a list of (source, kind, subject, value) for the lines in
+        ``text``."""
+
+        columns, _ = system_log.parse_text(text, "system.log")
+        source_codes, sources = columns["source"]
+        subject_codes, subjects = columns["subject"]
+        return [
+            (sources[source], system_log.KINDS[kind], subjects[subject],
+                value)
+            for source, kind, subject, value in zip(source_codes,
+                columns["kind"], subject_codes, columns["value"])
+        ]
+
+    def test_logback_layout(self):
+        """Lines in the logback layout are classified, with the line number
+        removed from the source."""
+
+        self.assertEqual(self.events(LOGBACK_LINES), [
+            ("GCInspector.java", "gc_pause", "ParNew", 250.0),
+            ("GCInspector.java", "gc_pause", "G1 Young Generation", 1247.0),
+            ("MessagingService.java", "dropped", "MUTATION", 130.0),
+            ("MessagingService.java", "dropped", "READ", 5.0),
+            ("CompactionTask.java", "compaction_start", "", 0.0),
+            ("CompactionTask.java", "compaction_start", "", 0.0),
+            ("CompactionTask.java", "compaction", "", 2541580.0),
+            ("CompactionTask.java", "compaction", "", 2.5 * 1024 * 1024),
+            ("Memtable.java", "flush_start", "peers", 0.0),
+            ("Memtable.java", "flush", "system-peers-ka-5-Data.db",
+                5.5 * 1024),
+        ])
+
+    def test_log4j_layout(self):
+        """Lines in the log4j layout up to Cassandra 2.0 are classified."""
+
+        text = " INFO [ScheduledTasks:1] 2012-11-27 10:00:00,123 "\
+            "GCInspector.java (line 122) GC for ParNew: 250 ms for 1 "\
+            "collections, 1 used; max is 2\n"\
+            " INFO [FlushWriter:1] 2012-11-27 10:00:05,100 Memtable.java "\
+            "(line 305) Completed flushing /var/lib/cassandra/data/ks/cf/"\
+            "ks-cf-hf-5-Data.db (5274 bytes) for commitlog position "\
+            "ReplayPosition(segmentId=1, position=2)\n"
+        self.assertEqual(self.events(text), [
+            ("GCInspector.java", "gc_pause", "ParNew", 250.0),
+            ("Memtable.java", "flush", "ks-cf-hf-5-Data.db", 5274.0),
+        ])
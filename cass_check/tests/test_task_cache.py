@@ -0,0 +1,73 @@
+"""Tests for :mod:`task_cache`."""
+import os
+import os.path
+
+from cass_check import file_util, fixtures, task
+from cass_check.tests import util
+
+class TaskCacheTest(util.TempDirTestCase):
+
+    def setUp(self):
+        super(TaskCacheTest, self).setUp()
+        self.log_dir = os.path.join(self.root, "logs")
+        fixtures.make_log_dir(self.log_dir, 256 * 1024)
+        self.nodetool = fixtures.write_fake_nodetool(os.path.join(self.root,
+            "bin", "nodetool"))
+
+    def collect(self, check_name):
+        self.check_cass_check("--check-name", check_name, "collect",
+            "--log-dir", self.log_dir, "--nodetool", self.nodetool,
+            "--no-history")
+        return os.path.join(self.output_base, check_name, "collect",
+            "collect-logs")
+
+    def digests(self, root):
+        """Returns {relative path : sha1} for the files under ``root``."""
+
+        return dict(
+            (os.path.relpath(os.path.join(dir_path, name), root),
+                file_util.file_digest(os.path.join(dir_path, name)))
+            for dir_path, _, names in os.walk(root)
+            for name in names
+        )
+
+    def test_rewrite_after_hit_leaves_cache_unchanged(self):
+        """Rewriting a task output restored from the cache does not change
+        the cache entry or the checkup the entry was stored from."""
+
+        first_dir = self.collect("c1")
+        first = self.digests(first_dir)
+        cache_dir = os.path.join(self.output_base, "cache", "tasks")
+        cached = self.digests(cache_dir)
+
+        second_dir = self.collect("c2")
+        receipt = task.TaskReceipt.maybe_load(os.path.join(second_dir,
+            "receipt.yaml"))
+        self.assertTrue(receipt.cached)
+        # The hit links the files rather than writing them again.
+        outputs = [
+            name
+            for name in first
+            if not task.TaskReceipt.is_receipt_file(name)
+        ]
+        self.assertTrue(outputs)
+        for name in outputs:
+            path = os.path.join(second_dir, name)
+            self.assertGreater(os.stat(path).st_nlink, 1,
+                "{path} is not hard linked".format(path=path))
+
+        with open(os.path.join(self.log_dir, "system.log"), "ab") as f:
+            f.write(" INFO [main] 2012-11-28 10:00:00,000 "\
+                "CassandraDaemon.java (line 101) Appended\n")
+        self.collect("c2")
+        with open(os.path.join(second_dir, "system.log"), "rb") as f:
+            self.assertTrue(f.read().endswith("Appended\n"))
+
+        self.assertEqual(self.digests(first_dir), first)
+        self.assertEqual(
+            dict(
+                (path, digest)
+                for path, digest in self.digests(cache_dir).iteritems()
+                if path in cached
+            ),
+            cached)
@@ -0,0 +1,51 @@
+"""Helpers shared by the tests."""
+import os
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from cass_check import benchmarks
+
+# ============================================================================
+#
+
+class TempDirTestCase(unittest.TestCase):
+    """Test case with a temp dir in ``self.root`` that is removed after each
+    test."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="cass-check-test-")
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.output_base = os.path.join(self.root, "output")
+
+    def cass_check(self, *args, **kwargs):
+        """Run ``cass-check`` with ``args`` in a new process, using the
+        output base in the temp dir.
+
+        Returns a tuple of (exit code, stdout, stderr).
+        """
+
+        env = dict(os.environ, CASS_CHECK_CACHE_DIR=os.path.join(self.root,
+            "cache"), **kwargs.pop("env", {}))
+        cmd = [sys.executable, "-c", benchmarks.STARTUP_SCRIPT,
+            "--log-file", os.path.join(self.root, "cass-check.log"),
+            "--output-base", self.output_base] + list(args)
+        proc = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, **kwargs)
+        out, err = proc.communicate()
+        return (proc.returncode, out, err)
+
+    def check_cass_check(self, *args, **kwargs):
+        """Run ``cass-check`` like :meth:`cass_check` and fail the test if it
+        does not exit with 0.
+
+        Returns stdout.
+        """
+
+        rv, out, err = self.cass_check(*args, **kwargs)
+        self.assertEqual(rv, 0, "cass-check {args} exited with {rv}: "\
+            "{err}".format(args=" ".join(args), rv=rv, err=err))
+        return out
@@ -1,18 +1,29 @@
 from setuptools import setup
 
+# cass-check is a plain script in bin/ rather than a console_scripts entry 
+# point, the setuptools wrapper for those imports pkg_resources on start up.
 entry_points = """
-[console_scripts]
-cass-check = cass_check.scripts:cass_check_main
-
 [cass_check.commands]
 noop=cass_check.commands:NoopCommand
 check=cass_check.commands:CheckCommand
 report=cass_check.commands:ReportCommand
 collect=cass_check.commands:CollectCommand
+bench=cass_check.commands:BenchmarkCommand
+analyse=cass_check.commands:AnalyseCommand
+archive=cass_check.commands:ArchiveCommand
+serve=cass_check.commands:ServeCommand
+search=cass_check.commands:SearchCommand
+trend=cass_check.commands:TrendCommand
 
 [cass_check.tasks.collection]
 logs=cass_check.collection_tasks:LogCollectionTask
 proxy_histograms=cass_check.collection_tasks:ProxyHistogramsCollectionTask
+nodetool=cass_check.collection_tasks:NodetoolCollectionTask
+
+[cass_check.tasks.analysis]
+system_log=cass_check.analysis_tasks:SystemLogAnalysisTask
+gc_log=cass_check.analysis_tasks:GCLogAnalysisTask
+search_index=cass_check.analysis_tasks:SearchIndexAnalysisTask
 """
 
 setup(
@@ -20,12 +31,14 @@ setup(
     version='0.0.1',
     author='Aaron Morton',
     author_email='aaron@thelastpickle.com',
-    packages = [],
+    packages = ["cass_check"],
+    scripts = ["bin/cass-check"],
     install_requires=[
         "PyYAML>=3.10",
         "Mako>=0.7.3"
     ],
     entry_points=entry_points,
+    test_suite="cass_check.tests",
     package_data = {
         "cass_check": ["resources/*.*", 
                        "templates/*.*"],